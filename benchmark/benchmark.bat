@@ -8,6 +8,17 @@ python create_random_file.py ../tests/testdata/random_file_%size%.dat %size%
 
 hyperfine --warmup %warmup% --runs %runs% --export-csv benchmark_results.csv -L threads %threads% -L piece_size 128,1024,8192 "python ../src/py3createtorrent.py %target% -p {piece_size} --threads {threads}" "torrenttools create %target% -v1 --piece-size {piece_size}K --threads {threads}"
 
+rem Costs of the md5 sums (--md5), which are calculated concurrently with reading and sha1 hashing.
+hyperfine --warmup %warmup% --runs %runs% --export-csv benchmark_results_md5.csv -L threads %threads% -L piece_size 1024 "python ../src/py3createtorrent.py %target% -p {piece_size} --threads {threads}" "python ../src/py3createtorrent.py %target% -p {piece_size} --threads {threads} --md5"
+
+rem A single reading thread (hashlib) compared to threads that read the pieces themselves (parallel), with the standard
+rem and the free-threaded interpreter (without the GIL, which can be installed with the python.org installer).
+hyperfine --warmup %warmup% --runs %runs% --export-csv benchmark_results_free_threading.csv -L python "py -3.13,py -3.13t" -L threads %threads% -L engine hashlib,parallel "{python} ../src/py3createtorrent.py %target% -p 1024 --threads {threads} --engine {engine}"
+
+rem Many small files (a million files of 4-64 KiB), read one after another or prefetched concurrently.
+python create_random_folder.py ../tests/testdata/random_folder_1m 1000000 4k 64k > NUL
+hyperfine --warmup %warmup% --runs %runs% --export-csv benchmark_results_small_files.csv -L prefetch 0,4,16,64 "python ../src/py3createtorrent.py ../tests/testdata/random_folder_1m -f -p 1024 --prefetch-files {prefetch}"
+
 hyperfine --warmup %warmup% --runs %runs% --export-csv benchmark_results_torf.csv -L threads %threads% -L piece_size 0.125,1,8 --show-output "torf %target% --yes --threads {threads} --max-piece-size {piece_size}"
 
 python plot_benchmark_results.py benchmark_results.csv benchmark_results_torf.csv
@@ -8,6 +8,26 @@ threads=1,2,3,4
 
 hyperfine --warmup $warmup --runs $runs --export-csv /results/benchmark_results.csv -L threads $threads -L piece_size 128,1024,8192 --show-output "python3 py3createtorrent.py $target -p {piece_size} --threads {threads}" "transmission-create --piece-size {piece_size} $target"
 
+# Costs of the md5 sums (--md5), which are calculated concurrently with reading and sha1 hashing.
+hyperfine --warmup $warmup --runs $runs --export-csv /results/benchmark_results_md5.csv -L threads $threads -L piece_size 1024 --show-output "python3 py3createtorrent.py $target -p {piece_size} --threads {threads}" "python3 py3createtorrent.py $target -p {piece_size} --threads {threads} --md5"
+
+# sha1 hashing in the Linux kernel (AF_ALG) compared to hashlib.
+hyperfine --warmup $warmup --runs $runs --export-csv /results/benchmark_results_engine.csv -L threads $threads -L piece_size 1024 -L engine hashlib,afalg --show-output "python3 py3createtorrent.py $target -p {piece_size} --threads {threads} --engine {engine}"
+
+# A single reading thread (hashlib) compared to threads that read the pieces themselves (parallel), with the standard
+# and the free-threaded interpreter (without the GIL, if installed).
+pythons=python3
+ft_python=$(uv python find 3.13t 2>/dev/null || command -v python3.13t)
+if [ -n "$ft_python" ]; then
+    pythons="$pythons,$ft_python"
+fi
+hyperfine --warmup $warmup --runs $runs --export-csv /results/benchmark_results_free_threading.csv -L python $pythons -L threads $threads -L engine hashlib,parallel --show-output "{python} py3createtorrent.py $target -p 1024 --threads {threads} --engine {engine}"
+
+# Many small files (a million files of 4-64 KiB), read one after another or prefetched concurrently. The page cache is
+# dropped before each run (if possible), so that the files are actually read from disk.
+python3 create_random_folder.py random_folder_1m 1000000 4k 64k > /dev/null
+hyperfine --runs $runs --prepare "sync; echo 3 > /proc/sys/vm/drop_caches || true" --export-csv /results/benchmark_results_small_files.csv -L prefetch 0,4,16,64 --show-output "python3 py3createtorrent.py random_folder_1m -f -p 1024 --prefetch-files {prefetch}"
+
 hyperfine --warmup $warmup --runs $runs --export-csv /results/benchmark_results_torf.csv -L threads $threads -L piece_size 0.125,1,8 --show-output "torf $target --yes --threads {threads} --max-piece-size {piece_size}"
 
 hyperfine --warmup $warmup --runs $runs --prepare "rm *.torrent" --export-csv /results/benchmark_results_mktorrent.csv -L threads $threads -L piece_size 17,20,23 --show-output "mktorrent -t{threads} -l{piece_size} $target"
@@ -11,20 +11,44 @@ TODOs for 2.x:
 """
 
 import argparse
+import base64
+import bisect
 import concurrent.futures
+import contextlib
+import ctypes
+import ctypes.util
 import datetime
+import errno
+import functools
 import hashlib
+import http.client
 import json
 import math
+import mmap
 import multiprocessing
+import operator
 import os
 import pprint
+import queue
+import random
 import re
+import select
+import shutil
+import socket
+import stat
+import struct
+import subprocess
 import sys
+import tarfile
+import tempfile
+import threading
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
-from typing import Any, Dict, List, Optional, Pattern, Set, Union
+import zipfile
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, NoReturn, Optional, Pattern, Set, Tuple, TypeVar, Union, cast
 
 # Literal was introducted in Python 3.8.
 try:
@@ -43,6 +67,8 @@ except ImportError:
         raise
 
 try:
+    from bencodepy import BencodeDecodeError
+    from bencodepy import decode as bdecode
     from bencodepy import encode as bencode
 except ImportError as exc:
     print("ERROR:")
@@ -56,7 +82,10 @@ except ImportError as exc:
     print()
     raise
 
-__all__ = ["create_torrent", "calculate_piece_length", "get_files_in_directory", "sha1", "split_path"]
+__all__ = [
+    "create_torrent", "edit_torrent", "PieceIndex", "calculate_piece_length", "get_files_in_directory",
+    "iter_files_in_directory", "sha1", "split_path"
+]
 
 # Do not touch anything below this line unless you know what you're doing!
 
@@ -70,6 +99,12 @@ MIB = KIB * KIB
 
 VERBOSE = False
 
+# Limits for reading and hashing the data (see Throttle), if any.
+THROTTLE: Optional["Throttle"] = None
+
+# Version of the plan and shard files for sharded hashing.
+PLAN_VERSION = 1
+
 
 class Config(object):
 
@@ -85,6 +120,10 @@ class Config(object):
         self.advertise: Optional[bool] = advertise
         self.best_trackers_url: str = "https://raw.githubusercontent.com/ngosang/trackerslist/master/trackers_best.txt"
 
+        # The fastest hash engine and number of threads by piece length in KiB (see calibrate), like
+        # {"1024": {"engine": "hashlib", "threads": 4}}.
+        self.calibration: Dict[str, Dict[str, Any]] = {}
+
     def get_path_to_config_file(self) -> str:
         if self.path is None:
             return os.path.join(os.path.expanduser("~"), ".py3createtorrent.cfg")
@@ -108,6 +147,7 @@ class Config(object):
         self.tracker_abbreviations = data.get("tracker_abbreviations", self.tracker_abbreviations)
         self.advertise = data.get("advertise", self.advertise)
         self.best_trackers_url = data.get("best_trackers_url", self.best_trackers_url)
+        self.calibration = data.get("calibration", self.calibration)
 
         # Validate the configuration.
         for abbr, replacement in self.tracker_abbreviations.items():
@@ -129,1002 +169,6317 @@ class Config(object):
             raise Config.InvalidConfigError("Configuration error: invalid value for advertise: %s "
                                             "(must be true/false)" % self.best_trackers_url)
 
+        if not isinstance(self.calibration, dict):
+            raise Config.InvalidConfigError("Configuration error: invalid calibration (must be an object)")
+        for piece_length, entry in self.calibration.items():
+            if (not piece_length.isdigit() or int(piece_length) <= 0 or not isinstance(entry, dict)
+                    or not isinstance(entry.get("engine"), str) or not isinstance(entry.get("threads"), int)
+                    or entry["threads"] <= 0):
+                raise Config.InvalidConfigError("Configuration error: invalid calibration for piece length '%s' "
+                                                "(must be like {\"engine\": \"hashlib\", \"threads\": 4})" %
+                                                piece_length)
+
+    def save_calibration(self, calibration: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Add the given calibration to the config file, keeping the other settings.
 
-def clean_str_for_console(path: str) -> str:
-    """
-    Returns the string for printing to the console.
-    
-    Non-printable characters are replaced by a backslashed escape sequence like \\xhh, \\uxxxx or \\Uxxxxxxxx.
-    """
-    encoding = sys.stdout.encoding
-    errors = "backslashreplace"
-    return path.encode(encoding, errors).decode(encoding, errors)
-
-
-def printv(*args: Any, **kwargs: Any) -> None:
-    """If VERBOSE is True, act as an alias for print. Else do nothing."""
-    if VERBOSE:
-        print(*args, **kwargs)
+        @throws json.JSONDecodeError if the existing config file cannot be parsed as JSON
+        """
+        path = self.get_path_to_config_file()
+        data: Dict[str, Any] = {}
+        if os.path.isfile(path):
+            with open(path, "r") as fh:
+                data = json.load(fh)
 
+        self.calibration.update(calibration)
+        data["calibration"] = self.calibration
+        with open(path, "w") as fh:
+            json.dump(data, fh, indent=4)
 
-def sha1(data: bytes) -> bytes:
-    """Return the given data's SHA-1 hash (= always 20 bytes)."""
-    m = hashlib.sha1()
-    m.update(data)
-    return m.digest()
+    def get_calibration(self, piece_length: int) -> Optional[Dict[str, Any]]:
+        """
+        Return the calibration for the piece length (in bytes) that is closest to the given one, or None if there is
+        no calibration.
+        """
+        if not self.calibration:
+            return None
+        closest = min(self.calibration, key=lambda length: abs(math.log2(int(length) * KIB / piece_length)))
+        return self.calibration[closest]
 
 
-def create_single_file_info(file: str, piece_length: int, include_md5: bool = True, threads: int = 4) -> Dict[str, Any]:
+class KnownHashes(object):
     """
-    Return dictionary with the following keys:
-      - pieces: concatenated 20-byte-sha1-hashes
-      - name:   basename of the file
-      - length: size of the file in bytes
-      - md5sum: md5sum of the file (unless disabled via include_md5)
+    Piece hashes (and MD5 sums) from a previous run that are still valid for the current data.
 
-    @see:   BitTorrent Metainfo Specification.
-    @note:  md5 hashes in torrents are actually optional
+    A piece hash can be re-used if the piece lies entirely in unchanged files that are still located at the same
+    offsets within the torrent's data. The known pieces are stored as runs of piece indices.
     """
-    assert os.path.isfile(file), "not a file"
 
-    # Total byte count.
-    length = os.path.getsize(file)
-    assert length > 0, "empty file"
+    def __init__(self, pieces: bytes, runs: List[Tuple[int, int]], md5sums: Dict[int, str]) -> None:
+        # Piece hashes of the previous run. Only the pieces in runs are valid for the current data.
+        self.pieces: bytes = pieces
 
-    # Concatenated 20byte sha1-hashes of all the file's pieces.
-    piece_count = int(math.ceil(length / piece_length))
-    pieces = bytearray(piece_count * 20)
+        # Runs of known pieces given as (first piece, last piece + 1).
+        self.runs: List[Tuple[int, int]] = runs
 
-    md5 = None
-    if include_md5:
-        md5 = hashlib.md5()
+        # Known md5 sums, by index of the (current) file.
+        self.md5sums: Dict[int, str] = md5sums
 
-    printv("Hashing file... ", end="")
+    def get_piece_count(self) -> int:
+        return sum(end - start for start, end in self.runs)
 
-    def calculate_sha1_hash_for_piece(i: int, piece_data: bytes) -> None:
-        count = len(piece_data)
-        if count == piece_length:
-            pieces[i * 20:(i + 1) * 20] = sha1(piece_data)
-        elif count != 0:
-            pieces[i * 20:(i + 1) * 20] = sha1(piece_data[:count])
+    @staticmethod
+    def find(
+        old_files: List[List[Any]],
+        old_pieces: bytes,
+        new_files: List[List[Any]],
+        piece_length: int,
+        old_md5sums: Optional[List[Optional[str]]] = None,
+        is_unchanged: Optional[Callable[[List[Any], List[Any]], bool]] = None,
+    ) -> "KnownHashes":
+        """
+        Determine which of old_pieces can be re-used for new_files.
 
-    MAX_FUTURES = min(threads, multiprocessing.cpu_count())
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_FUTURES) as executor:
-        with open(file, "rb") as fh:
-            futures: Set[concurrent.futures.Future[None]] = set()
-            for i, piece_data in enumerate(iter(lambda: fh.read(piece_length), "")):
-                if not piece_data:
-                    break
+        Files are given as [path, size, mtime_ns] (see get_file_fingerprints). old_pieces may contain the hashes of
+        the first pieces only. By default, a file is considered unchanged if its fingerprint is unchanged. This
+        policy can be replaced with is_unchanged(old_file, new_file).
+        """
+        if is_unchanged is None:
+            is_unchanged = operator.eq
+
+        # Map paths to (offset, index, fingerprint) of the old files.
+        old_by_path = {}
+        offset = 0
+        for idx, entry in enumerate(old_files):
+            old_by_path[entry[0]] = (offset, idx, entry)
+            offset += entry[1]
+        old_size = offset
+        old_piece_count = len(old_pieces) // 20
+
+        # Find the byte ranges of unchanged data at unchanged offsets.
+        ranges: List[List[int]] = []
+        md5sums = {}
+        offset = 0
+        for k, entry in enumerate(new_files):
+            old = old_by_path.get(entry[0])
+            if old is not None and entry[1] == old[2][1] and is_unchanged(old[2], entry):
+                if old_md5sums is not None and old[1] < len(old_md5sums) and old_md5sums[old[1]] is not None:
+                    md5sums[k] = old_md5sums[old[1]]
+                if old[0] == offset and entry[1] > 0:
+                    if ranges and ranges[-1][1] == offset:
+                        ranges[-1][1] += entry[1]
+                    else:
+                        ranges.append([offset, offset + entry[1]])
+            offset += entry[1]
+        new_size = offset
+
+        # Pieces that lie entirely in these ranges are known. The last (short) piece is known only if the total size
+        # did not change, because otherwise the piece's length changed.
+        runs = []
+        for start, end in ranges:
+            first = -(-start // piece_length)
+            if end == new_size and new_size == old_size:
+                last = -(-end // piece_length)
+            else:
+                last = end // piece_length
+            last = min(last, old_piece_count)
+            if first < last:
+                runs.append((first, last))
 
-                futures.add(executor.submit(calculate_sha1_hash_for_piece, i, piece_data))
+        return KnownHashes(old_pieces, runs, md5sums)
 
-                if md5:
-                    md5.update(piece_data)
 
-                if len(futures) >= MAX_FUTURES:
-                    _, notdone = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
-                    futures = notdone
+class Checkpoint(object):
+    """
+    Progress of a torrent creation that can be saved to and resumed from a sidecar file.
 
-            concurrent.futures.wait(futures)
+    The checkpoint stores the chosen parameters, the scanned files together with their fingerprints (size and
+    modification time) and the hashes of all pieces that have been completed so far (contiguously from the start).
+    """
 
-    printv("done")
+    class InvalidCheckpointError(Exception):
+        pass
 
-    info = {"pieces": bytes(pieces), "name": os.path.basename(file), "length": length}
+    VERSION = 1
+
+    def __init__(
+        self,
+        path: str,
+        target: str,
+        piece_length: int,
+        include_md5: bool,
+        files: List[List[Any]],
+        interval: float = 60,
+    ) -> None:
+        self.path: str = path
+        self.target: str = os.path.abspath(target)
+        self.piece_length: int = piece_length
+        self.include_md5: bool = include_md5
+        self.files: List[List[Any]] = files
+        self.interval: float = interval
+
+        # Progress (filled by load() or save()).
+        self.pieces_done: int = 0
+        self.pieces: bytes = b""
+        self.md5sums: List[Optional[str]] = []
+
+        self._last_save: float = time.monotonic()
+
+    def load(self) -> bool:
+        """
+        Load the progress from the checkpoint file, if it exists.
 
-    if md5:
-        info["md5sum"] = md5.hexdigest()
+        Return False if there is no checkpoint file.
 
-    return info
+        @throws Checkpoint.InvalidCheckpointError if the checkpoint does not match the current target, parameters or
+                files.
+        """
+        if not os.path.isfile(self.path):
+            return False
+
+        try:
+            with open(self.path, "r") as fh:
+                data = json.load(fh)
+        except json.JSONDecodeError as exc:
+            raise Checkpoint.InvalidCheckpointError("Checkpoint '%s' is damaged: %s" % (self.path, exc))
+
+        if data.get("version") != Checkpoint.VERSION:
+            raise Checkpoint.InvalidCheckpointError("Checkpoint '%s' has an unsupported version" % self.path)
+        if data.get("target") != self.target:
+            raise Checkpoint.InvalidCheckpointError("Checkpoint '%s' was created for a different target: '%s'" %
+                                                    (self.path, data.get("target")))
+        if data.get("piece_length") != self.piece_length or data.get("include_md5") != self.include_md5:
+            raise Checkpoint.InvalidCheckpointError("Checkpoint '%s' was created with different options "
+                                                    "(piece length or md5)" % self.path)
+        if data.get("files") != self.files:
+            raise Checkpoint.InvalidCheckpointError("Checkpoint '%s' does not match the input files. Files have been "
+                                                    "added, removed or modified since it was written." % self.path)
+
+        self.pieces_done = data["pieces_done"]
+        self.pieces = base64.b64decode(data["pieces"])
+        self.md5sums = data["md5sums"]
+
+        if len(self.pieces) != self.pieces_done * 20:
+            raise Checkpoint.InvalidCheckpointError("Checkpoint '%s' is damaged: piece count mismatch" % self.path)
+
+        return True
+
+    def get_known_hashes(self) -> KnownHashes:
+        """Return the piece hashes and md5 sums that have been completed so far."""
+        return KnownHashes.find(self.files, self.pieces, self.files, self.piece_length, self.md5sums)
+
+    def is_due(self) -> bool:
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, pieces_done: int, pieces: Union[bytes, bytearray], md5sums: List[Optional[str]]) -> None:
+        """Atomically write the checkpoint file. pieces must contain (at least) the first pieces_done hashes."""
+        self.pieces_done = pieces_done
+        self.pieces = bytes(pieces[:pieces_done * 20])
+        self.md5sums = list(md5sums)
+
+        data = {
+            "version": Checkpoint.VERSION,
+            "target": self.target,
+            "piece_length": self.piece_length,
+            "include_md5": self.include_md5,
+            "files": self.files,
+            "pieces_done": self.pieces_done,
+            "pieces": base64.b64encode(self.pieces).decode("ascii"),
+            "md5sums": self.md5sums,
+        }
 
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp_path, self.path)
 
-def create_multi_file_info(
-    directory: str,
-    files: List[str],
-    piece_length: int,
-    include_md5: bool = True,
-    threads: int = 4,
-) -> Dict[str, Any]:
-    """
-    Return dictionary with the following keys:
-      - pieces: concatenated 20-byte-sha1-hashes
-      - name:   basename of the directory (default name of all torrents)
-      - files:  a list of dictionaries with the following keys:
-        - length: size of the file in bytes
-        - md5sum: md5 sum of the file (unless disabled via include_md5)
-        - path:   path to the file, relative to the initial directory,
-                  given as list.
-                  Examples:
-                  -> ["dir1", "dir2", "file.ext"]
-                  -> ["just_in_the_initial_directory_itself.ext"]
+        self._last_save = time.monotonic()
+        printv("Saved checkpoint (%d pieces done)" % self.pieces_done)
 
-    @see:   BitTorrent Metainfo Specification.
-    @note:  md5 hashes in torrents are actually optional
-    """
-    assert os.path.isdir(directory), "not a directory"
+    def remove(self) -> None:
+        if os.path.isfile(self.path):
+            os.remove(self.path)
 
-    # Preallocate space for 2000 piece hashes. This way, we avoid the need for
-    # synchronizing the hashing threads that write into the pieces bytearray.
-    pieces = bytearray(2000 * 20)
 
-    #
-    info_files = []
+class DirectoryWatcher(object):
+    """
+    Wait for changes of a file or of the files below a directory.
 
-    # This bytearray will be used for the calculation of info_pieces.
-    # At some point, every file's data will be written into data. Consecutive files will be written into data as a
-    # continuous stream, as required by info_pieces' BitTorrent specification.
-    data = bytearray()
+    On Linux, inotify is used. Elsewhere (or if inotify is not available), the path is polled periodically.
+    """
 
-    def calculate_sha1_hash_for_piece(i: int, piece_data: bytes) -> None:
-        count = len(piece_data)
-        if count == piece_length:
-            pieces[i * 20:(i + 1) * 20] = sha1(piece_data)
-        elif count != 0:
-            pieces[i * 20:(i + 1) * 20] = sha1(piece_data[:count])
+    # inotify event masks (see inotify(7)).
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    def __init__(self, path: str, poll_interval: float = 2.0) -> None:
+        # A single file is watched by watching its directory (so that replacing the file is noticed, too).
+        if os.path.isdir(path):
+            self.path: str = os.path.abspath(path)
+            self.recursive: bool = True
+        else:
+            self.path = os.path.dirname(os.path.abspath(path))
+            self.recursive = False
+        self.poll_interval: float = poll_interval
 
-    MAX_FUTURES = min(threads, multiprocessing.cpu_count())
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_FUTURES) as executor:
-        futures: Set[concurrent.futures.Future[None]] = set()
-        i = 0
-        for file in files:
-            path = os.path.join(directory, file)
-            length = os.path.getsize(path)
+        self._libc: Any = None
+        self._fd: int = -1
+        self._init_inotify()
 
-            # File's md5sum.
-            md5 = None
-            if include_md5:
-                md5 = hashlib.md5()
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        if self._fd < 0:
+            printv("Using polling to watch for changes.")
+            self._snapshot = self._take_snapshot()
 
-            printv("Processing file '%s'... " % clean_str_for_console(os.path.relpath(path, directory)), end="")
+    def _init_inotify(self) -> None:
+        if not sys.platform.startswith("linux"):
+            return
 
-            with open(path, "rb") as fh:
-                while True:
-                    filedata = fh.read(piece_length)
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC)  # type:ignore
+        except (OSError, AttributeError):
+            self._fd = -1
+            return
 
-                    if not filedata:
-                        break
+        if self._fd < 0:
+            return
+
+        if not self._add_watches():
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watches(self) -> bool:
+        """Add inotify watches for all directories (adding a watch twice is harmless). Return False on failure."""
+        directories = [self.path]
+        if self.recursive:
+            for root, dirs, _ in os.walk(self.path, followlinks=True):
+                directories.extend(os.path.join(root, d) for d in dirs)
+
+        for directory in directories:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), DirectoryWatcher.IN_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                # The directory may have been removed in the meantime. Other errors (for example, the limit of
+                # watches has been reached) cause a fallback to polling.
+                if err != errno.ENOENT:
+                    print("Warning: inotify failed for '%s' (%s). Falling back to polling." %
+                          (clean_str_for_console(directory), os.strerror(err)),
+                          file=sys.stderr)
+                    return False
+        return True
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        if self.recursive:
+            for root, _, files in os.walk(self.path, followlinks=True):
+                for file in files:
+                    path = os.path.join(root, file)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (st.st_size, st.st_mtime_ns)
+        else:
+            for file in os.listdir(self.path):
+                path = os.path.join(self.path, file)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def _poll(self, timeout: Optional[float]) -> bool:
+        """Wait up to timeout seconds (None = forever) for a change. Return True if a change occurred."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        if self._fd >= 0:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if not readable:
+                return False
+            os.read(self._fd, 64 * KIB)
+            return True
+
+        while True:
+            if deadline is None:
+                time.sleep(self.poll_interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.poll_interval, remaining))
+
+            snapshot = self._take_snapshot()
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                return True
+
+    def wait(self, debounce: float) -> None:
+        """Block until a change occurred and no further changes occurred for debounce seconds."""
+        self._poll(None)
+        while self._poll(debounce):
+            pass
+
+        # Watch directories that have been created in the meantime.
+        if self._fd >= 0 and self.recursive and not self._add_watches():
+            os.close(self._fd)
+            self._fd = -1
+            self._snapshot = self._take_snapshot()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class ArchiveReader(object):
+    """
+    Read the files in a tar or zip archive as if the archive had been extracted to a directory.
 
-                    if i >= len(pieces) // 20:
-                        # Need to extend pieces bytearray.
-                        # Wait until all other threads/tasks are finished.
-                        concurrent.futures.wait(futures, return_when=concurrent.futures.ALL_COMPLETED)
+    Zip archives and uncompressed tar archives are read with random access. Compressed tar archives are read
+    sequentially (after the member headers have been read in a first pass). Members that are stored in a different
+    order than the torrent's order are buffered in temporary files until they are needed. A streamed tar archive
+    (path "-", i.e. stdin) can only be read once, so all of its members are buffered.
+    """
 
-                        # Now we have exclusive access to the pieces bytearray.
-                        # Add space for 1000 additional piece hashes.
-                        pieces += bytes(1000 * 20)
+    class InvalidArchiveError(Exception):
+        pass
 
-                    data += filedata
-                    if len(data) >= piece_length:
-                        futures.add(executor.submit(calculate_sha1_hash_for_piece, i, data[:piece_length]))
-                        data = data[piece_length:]
-                        i += 1
+    EXTENSIONS = [".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz", ".tbz2", ".tar.xz", ".txz", ".zip"]
 
-                    if md5:
-                        md5.update(filedata)
+    def __init__(self, path: str, strip_components: int = 0) -> None:
+        self.path: str = path
+        self.strip_components: int = strip_components
 
-                    if len(futures) >= MAX_FUTURES:
-                        _, notdone = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
-                        futures = notdone
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._tar: Optional[tarfile.TarFile] = None
 
-            printv("done")
+        # Compressed tar archives are read sequentially in stream mode.
+        self._sequential: bool = False
+        self._stream: Optional[tarfile.TarFile] = None
 
-            # Build the current file's dictionary.
-            fdict = {"length": length, "path": split_path(file)}
+        # Temporary directory for buffered members and their paths, by member key.
+        self._spool_dir: Optional[str] = None
+        self._spools: Dict[Any, str] = {}
 
-            if md5:
-                fdict["md5sum"] = md5.hexdigest()
+        # Files of the torrent (path components, size and member key), in torrent order. Set by get_files().
+        self._files: List[Tuple[List[str], int, Any]] = []
+        self._positions: Dict[Any, int] = {}
 
-            info_files.append(fdict)
+        try:
+            if path == "-":
+                self._tar = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+            elif zipfile.is_zipfile(path):
+                self._zip = zipfile.ZipFile(path)
+            else:
+                try:
+                    self._tar = tarfile.open(path, "r:")
+                except tarfile.ReadError:
+                    self._tar = tarfile.open(path, "r:*")
+                    self._sequential = True
+        except (tarfile.TarError, zipfile.BadZipFile) as exc:
+            raise ArchiveReader.InvalidArchiveError("'%s' is not a valid tar or zip archive: %s" % (path, exc))
+
+    @staticmethod
+    def get_name(path: str) -> str:
+        """Return the default torrent name for the archive, i.e. its file name without archive extension."""
+        name = os.path.basename(path)
+        for extension in ArchiveReader.EXTENSIONS:
+            if name.lower().endswith(extension) and len(name) > len(extension):
+                return name[:-len(extension)]
+        return name
+
+    def close(self) -> None:
+        for archive in (self._zip, self._tar, self._stream):
+            if archive is not None:
+                archive.close()
+        if self._spool_dir is not None:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _spool(self, key: Any, fh: Any) -> None:
+        """Buffer the data of a member in a temporary file."""
+        if self._spool_dir is None:
+            self._spool_dir = tempfile.mkdtemp(prefix="py3createtorrent-")
+        spool_path = os.path.join(self._spool_dir, str(len(self._spools)))
+        with open(spool_path, "wb") as spool_fh:
+            shutil.copyfileobj(fh, spool_fh)
+        self._spools[key] = spool_path
+
+    def _get_components(self, name: str) -> Optional[List[str]]:
+        """Return the path components of a member after stripping, or None if the member is to be skipped."""
+        components = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+        if ".." in components:
+            print("Warning: skipping '%s', because it points outside of the archive." % clean_str_for_console(name),
+                  file=sys.stderr)
+            return None
+        return components[self.strip_components:] or None
+
+    def _get_members(self) -> List[Tuple[List[str], int, Any]]:
+        """Return the regular files in the archive as (path components, size, member key), in archive order."""
+        members = []
+
+        if self._zip is not None:
+            for zip_info in self._zip.infolist():
+                if zip_info.is_dir():
+                    continue
+                if stat.S_ISLNK(zip_info.external_attr >> 16):
+                    print("Warning: skipping symlink '%s'." % clean_str_for_console(zip_info.filename), file=sys.stderr)
+                    continue
+                components = self._get_components(zip_info.filename)
+                if components:
+                    members.append((components, zip_info.file_size, zip_info))
+            return members
+
+        assert self._tar is not None
+        streamed = self.path == "-"
+
+        # Keys and sizes of the regular files by their name, for resolving hard links.
+        by_name: Dict[str, Tuple[int, Any]] = {}
+
+        for tar_info in self._tar:
+            if tar_info.issym():
+                print("Warning: skipping symlink '%s'." % clean_str_for_console(tar_info.name), file=sys.stderr)
+                continue
+            if tar_info.islnk():
+                if tar_info.linkname not in by_name:
+                    raise ArchiveReader.InvalidArchiveError("the target of the hard link '%s' is missing" %
+                                                            tar_info.name)
+                if self._sequential:
+                    raise ArchiveReader.InvalidArchiveError(
+                        "hard links are not supported in compressed tar archives ('%s')" % tar_info.name)
+                size, key = by_name[tar_info.linkname]
+                if not streamed:
+                    key = tar_info
+            elif tar_info.isfile():
+                size = tar_info.size
+                if streamed:
+                    key = tar_info.offset
+                    self._spool(key, self._tar.extractfile(tar_info))
+                elif self._sequential:
+                    key = tar_info.offset
+                else:
+                    key = tar_info
+                by_name[tar_info.name] = (size, key)
+            else:
+                continue
 
-        concurrent.futures.wait(futures)
+            components = self._get_components(tar_info.name)
+            if components:
+                members.append((components, size, key))
 
-    # Don't forget to hash the last piece. (Probably the piece that has not reached the regular piece size.)
-    if data:
-        pieces[i * 20:(i + 1) * 20] = sha1(data)
+        return members
 
-    # Cut off unused pieces space.
-    pieces = pieces[:(i + 1) * 20]
+    def get_files(
+        self,
+        root: str,
+        excluded_paths: Optional[Set[str]] = None,
+        excluded_regexps: Optional[Set[Pattern[str]]] = None,
+    ) -> List[Tuple[str, int]]:
+        """
+        Return the relative paths and sizes of the files in the archive, in the same order as get_files_in_directory
+        would return them for the extracted archive.
 
-    # Build the final dictionary.
-    info = {
-        "pieces": bytes(pieces),
-        "name": os.path.basename(os.path.abspath(directory)),
-        "files": info_files,
-    }
+        The archive is considered to be extracted to root. Excluded paths and regular expressions are matched against
+        the resulting absolute paths, as in get_files_in_directory.
+        """
+        try:
+            files = sort_like_directory([(components, (components, size, key))
+                                         for components, size, key in self._get_members()],
+                                        root,
+                                        excluded_paths=excluded_paths,
+                                        excluded_regexps=excluded_regexps)
+        except ValueError as exc:
+            raise ArchiveReader.InvalidArchiveError(str(exc))
+
+        self._files = files
+        self._positions = {key: i for i, (_, _, key) in enumerate(files)}
+        return [(os.path.join(*components), size) for components, size, _ in files]
+
+    def open(self, index: int) -> Any:
+        """
+        Open the file with the given index (in the list returned by get_files) for reading.
 
-    return info
+        In sequential mode, the files must be opened in order and each file must be closed before the next one is
+        opened.
+        """
+        key = self._files[index][2]
+
+        if key in self._spools:
+            return open(self._spools[key], "rb")
+        if self._zip is not None:
+            return self._zip.open(key)
+        if not self._sequential:
+            assert self._tar is not None
+            return self._tar.extractfile(key)
+
+        # Read the archive sequentially until the member is reached. Members that are needed later are buffered.
+        if self._stream is None:
+            self._stream = tarfile.open(self.path, "r|*")
+        while True:
+            tar_info = self._stream.next()
+            if tar_info is None:
+                raise IOError("'%s' has changed while hashing" % self.path)
+            if tar_info.offset == key:
+                return self._stream.extractfile(tar_info)
+            if self._positions.get(tar_info.offset, -1) > index:
+                self._spool(tar_info.offset, self._stream.extractfile(tar_info))
+
+
+class PieceIndex(object):
+    """
+    Binary index of the piece hashes and the file table of a torrent (see --export-index).
 
+    The index is memory-mapped, so single piece hashes and file entries can be looked up in O(1) without reading the
+    whole file. Layout (all integers little-endian):
 
-def get_files_in_directory(
-    directory: str,
-    excluded_paths: Optional[Set[str]] = None,
-    relative_to: Optional[str] = None,
-    excluded_regexps: Optional[Set[Pattern[str]]] = None,
-) -> List[str]:
+    - header (HEADER)
+    - file table: one FILE_ENTRY per file (offset and length of the file within the torrent's data, position and
+      length of its UTF-8 encoded path in the string table, raw md5 digest or zeroes)
+    - piece hashes: 20 bytes per piece
+    - string table: the torrent name followed by the paths (path components joined with "/")
     """
-    Return a list containing the paths to all files in the given directory.
 
-    Paths in excluded_paths are skipped. These should be os.path.normcase()-d.
-    Of course, the initial directory cannot be excluded.
-    Paths matching any of the regular expressions in excluded_regexps are
-    skipped, too. The regexps must be compiled by the caller.
-    In both cases, absolute paths are used for matching.
+    class InvalidIndexError(Exception):
+        pass
 
-    The paths may be returned relative to a specific directory. By default,
-    this is the initial directory itself.
+    MAGIC = b"P3CTIDX\0"
+    VERSION = 1
+
+    # magic, version, flags, piece length, total length, file count, piece count, string table offset, name length
+    HEADER = struct.Struct("<8sIIQQQQQI4x")
+
+    # offset, length, path offset (relative to the string table), path length, md5 digest
+    FILE_ENTRY = struct.Struct("<QQQI4x16s")
+
+    FLAG_MD5 = 1
+    FLAG_SINGLE_FILE = 2
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+
+        with open(path, "rb") as fh:
+            try:
+                self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PieceIndex.InvalidIndexError("'%s' is empty" % path)
+
+        if len(self._map) < self.HEADER.size:
+            self.close()
+            raise PieceIndex.InvalidIndexError("'%s' is too short" % path)
+
+        (magic, version, flags, self.piece_length, self.total_length, self.file_count, self.piece_count,
+         self._strings_offset, name_length) = self.HEADER.unpack_from(self._map, 0)
+
+        if magic != self.MAGIC:
+            self.close()
+            raise PieceIndex.InvalidIndexError("'%s' is not a piece index" % path)
+        if version != self.VERSION:
+            self.close()
+            raise PieceIndex.InvalidIndexError("'%s' has unsupported version %d" % (path, version))
+
+        self.has_md5: bool = bool(flags & self.FLAG_MD5)
+        self.is_single_file: bool = bool(flags & self.FLAG_SINGLE_FILE)
+
+        self._pieces_offset: int = self.HEADER.size + self.file_count * self.FILE_ENTRY.size
+        if (self._strings_offset != self._pieces_offset + 20 * self.piece_count
+                or len(self._map) < self._strings_offset + name_length or self.piece_length <= 0
+                or self.piece_count != math.ceil(self.total_length / self.piece_length)):
+            self.close()
+            raise PieceIndex.InvalidIndexError("'%s' is corrupt" % path)
+
+        self.name: str = self._get_string(0, name_length)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "PieceIndex":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _get_string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def get_piece_hash(self, index: int) -> bytes:
+        """Return the sha1 hash of the piece with the given index."""
+        if not 0 <= index < self.piece_count:
+            raise IndexError("piece index out of range")
+        start = self._pieces_offset + 20 * index
+        return self._map[start:start + 20]
+
+    def get_pieces(self) -> bytes:
+        """Return the concatenated hashes of all pieces."""
+        return self._map[self._pieces_offset:self._strings_offset]
+
+    def get_file(self, index: int) -> Tuple[List[str], int, int, Optional[str]]:
+        """Return path (list of components), offset, length and md5 sum (or None) of the file with the given index."""
+        if not 0 <= index < self.file_count:
+            raise IndexError("file index out of range")
+        offset, length, path_offset, path_length, md5 = self.FILE_ENTRY.unpack_from(
+            self._map, self.HEADER.size + index * self.FILE_ENTRY.size)
+        components = self._get_string(path_offset, path_length).split("/")
+        return (components, offset, length, md5.hex() if self.has_md5 else None)
+
+    def _get_file_offset(self, index: int) -> int:
+        return struct.unpack_from("<Q", self._map, self.HEADER.size + index * self.FILE_ENTRY.size)[0]
+
+    def find_file(self, position: int) -> int:
+        """Return the index of the file containing the byte at the given position of the torrent's data."""
+        if not 0 <= position < self.total_length:
+            raise IndexError("position out of range")
+
+        # Binary search for the last file starting at or before position (which skips empty files).
+        lo, hi = 0, self.file_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_file_offset(mid) <= position:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def get_piece_files(self, index: int) -> List[int]:
+        """Return the indices of the (non-empty) files that the piece with the given index spans."""
+        if not 0 <= index < self.piece_count:
+            raise IndexError("piece index out of range")
+        first = self.find_file(index * self.piece_length)
+        last = self.find_file(min((index + 1) * self.piece_length, self.total_length) - 1)
+        return [i for i in range(first, last + 1) if self.get_file(i)[2] > 0]
+
+    def get_info(self) -> Dict[str, Any]:
+        """Return the info dictionary of the torrent."""
+        info: Dict[str, Any] = {
+            "piece length": self.piece_length,
+            "pieces": self.get_pieces(),
+            "name": self.name,
+        }
 
-    Please note: Only paths to files are returned!
+        if self.is_single_file:
+            _, _, length, md5sum = self.get_file(0)
+            info["length"] = length
+            if md5sum is not None:
+                info["md5sum"] = md5sum
+        else:
+            info["files"] = []
+            for i in range(self.file_count):
+                path, _, length, md5sum = self.get_file(i)
+                file_dict: Dict[str, Any] = {"length": length, "path": path}
+                if md5sum is not None:
+                    file_dict["md5sum"] = md5sum
+                info["files"].append(file_dict)
+
+        return info
+
+    @staticmethod
+    def write(path: str, info: Dict[str, Any]) -> None:
+        """
+        Write the index for the given info dictionary to path.
 
-    @param excluded_regexps: A set of compiled regular expressions.
+        The file is written atomically: readers either see the previous file or the complete new one.
+        """
+        if "files" in info:
+            files = info["files"]
+            flags = 0
+        else:
+            files = [{"length": info["length"], "path": [info["name"]], "md5sum": info.get("md5sum")}]
+            flags = PieceIndex.FLAG_SINGLE_FILE
+        if all(f.get("md5sum") for f in files):
+            flags |= PieceIndex.FLAG_MD5
+
+        strings = bytearray(info["name"].encode("utf-8"))
+        entries = bytearray()
+        offset = 0
+        for f in files:
+            encoded_path = "/".join(f["path"]).encode("utf-8")
+            md5 = bytes.fromhex(f["md5sum"]) if flags & PieceIndex.FLAG_MD5 else bytes(16)
+            entries += PieceIndex.FILE_ENTRY.pack(offset, f["length"], len(strings), len(encoded_path), md5)
+            strings += encoded_path
+            offset += f["length"]
+
+        piece_count = len(info["pieces"]) // 20
+        header = PieceIndex.HEADER.pack(PieceIndex.MAGIC, PieceIndex.VERSION, flags, info["piece length"], offset,
+                                        len(files), piece_count,
+                                        PieceIndex.HEADER.size + len(entries) + len(info["pieces"]),
+                                        len(info["name"].encode("utf-8")))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(header)
+            fh.write(entries)
+            fh.write(info["pieces"])
+            fh.write(strings)
+        os.replace(tmp_path, path)
+
+
+def get_holes(path: str, length: int) -> List[Tuple[int, int]]:
     """
-    # Argument validation:
-    if not isinstance(directory, str):
-        raise TypeError("directory must be instance of: str")
-
-    if excluded_paths is None:
-        excluded_paths = set()
-    elif not isinstance(excluded_paths, set):
-        raise TypeError("excluded_paths must be instance of: set")
+    Return the holes of a sparse file as list of (start, end) ranges.
 
-    if relative_to is not None:
-        if not isinstance(relative_to, str):
-            raise TypeError("relative_to must be instance of: str")
+    The holes are found with SEEK_DATA and SEEK_HOLE. An empty list is returned if the file is not sparse or if the
+    platform or the file system does not support this.
+    """
+    if not hasattr(os, "SEEK_HOLE"):
+        return []
 
-        if not os.path.isdir(relative_to):
-            raise ValueError("relative_to: '%s' is not a valid directory" % relative_to)
+    holes = []
+    with open(path, "rb") as fh:
+        # Files without holes occupy (at least) as many blocks as they need.
+        blocks = getattr(os.fstat(fh.fileno()), "st_blocks", None)
+        if blocks is None or blocks * 512 >= length:
+            return []
 
-    if excluded_regexps is None:
-        excluded_regexps = set()
-    elif not isinstance(excluded_regexps, set):
-        raise TypeError("excluded_regexps must be instance of: set")
+        pos = 0
+        try:
+            while pos < length:
+                try:
+                    data = os.lseek(fh.fileno(), pos, os.SEEK_DATA)  # type:ignore
+                except OSError as exc:
+                    # There is no more data, i.e. the file ends with a hole.
+                    if exc.errno != errno.ENXIO:
+                        raise
+                    data = length
+                if data > pos:
+                    holes.append((pos, min(data, length)))
+                if data >= length:
+                    break
+                pos = os.lseek(fh.fileno(), data, os.SEEK_HOLE)  # type:ignore
+        except OSError:
+            return []
 
-    # Helper function:
-    def _get_files_in_directory(
-        directory: str,
-        files: List[str],
-        excluded_paths: Optional[Set[str]] = None,
-        relative_to: Optional[str] = None,
-        excluded_regexps: Optional[Set[Pattern[str]]] = None,
-        processed_paths: Optional[Set[str]] = None,
-    ) -> List[str]:
-        if excluded_paths is None:
-            excluded_paths = set()
-        if excluded_regexps is None:
-            excluded_regexps = set()
-        if processed_paths is None:
-            processed_paths = set()
+    return holes
 
-        # Improve consistency across platforms.
-        # Note:
-        listdir = os.listdir(directory)
-        listdir.sort(key=str.lower)
 
-        processed_paths.add(os.path.normcase(os.path.realpath(directory)))
+def get_physical_offset(path: str) -> Optional[int]:
+    """
+    Return the physical offset of the first extent of the file on its device.
 
-        for node in listdir:
-            path = os.path.join(directory, node)
+    The offset is determined with the FIEMAP ioctl. None is returned if the platform or the file system does not
+    support this, or if the file has no extents (yet).
+    """
+    if not sys.platform.startswith("linux"):
+        return None
 
-            if os.path.normcase(path) in excluded_paths:
-                printv("Skipping '%s' due to explicit exclusion." %
-                       clean_str_for_console(os.path.relpath(path, relative_to)))
-                continue
+    import fcntl  # type:ignore
 
-            regexp_match = False
-            for regexp in excluded_regexps:
-                if regexp.search(path):
-                    printv("Skipping '%s' due to pattern exclusion." %
-                           clean_str_for_console(os.path.relpath(path, relative_to)))
-                    regexp_match = True
-                    break
-            if regexp_match:
-                continue
+    # struct fiemap with room for one struct fiemap_extent (see linux/fiemap.h).
+    FS_IOC_FIEMAP = 0xC020660B
+    buf = bytearray(struct.pack("=QQIIII", 0, 2**64 - 1, 0, 0, 1, 0) + bytes(56))
+    try:
+        with open(path, "rb") as fh:
+            fcntl.ioctl(fh.fileno(), FS_IOC_FIEMAP, buf)  # type:ignore
+    except OSError:
+        return None
 
-            if os.path.normcase(os.path.realpath(path)) in processed_paths:
-                print(
-                    "Warning: skipping symlink '%s', because it's target "
-                    "has already been processed." % clean_str_for_console(path),
-                    file=sys.stderr,
-                )
-                continue
-            processed_paths.add(os.path.normcase(os.path.realpath(path)))
+    mapped_extents = struct.unpack_from("=I", buf, 20)[0]
+    if mapped_extents == 0:
+        return None
+    return struct.unpack_from("=Q", buf, 40)[0]
 
-            if os.path.isfile(path):
-                if relative_to:
-                    path = os.path.relpath(path, relative_to)
-                files.append(path)
-            elif os.path.isdir(path):
-                _get_files_in_directory(
-                    path,
-                    files,
-                    excluded_paths=excluded_paths,
-                    relative_to=relative_to,
-                    excluded_regexps=excluded_regexps,
-                    processed_paths=processed_paths,
-                )
-            else:
-                assert False, "not a valid node: '%s'" % node
 
-        return files
+def get_file_fingerprints(directory: str, files: List[str]) -> List[List[Any]]:
+    """Return [path, size, mtime_ns] for each of the given files (relative to directory)."""
+    fingerprints = []
+    for file in files:
+        st = os.stat(os.path.join(directory, file))
+        fingerprints.append([file, st.st_size, st.st_mtime_ns])
+    return fingerprints
 
-    # Final preparations:
-    directory = os.path.abspath(directory)
 
-    if not relative_to:
-        relative_to = directory
+def check_file_size(path: str, fd: int, length: int) -> None:
+    """
+    Raise IOError if the size of the open file differs from the expected length, i.e. if the file has been changed
+    since it was scanned (or if its size has been given wrongly, see read_file_list).
+    """
+    size = os.fstat(fd).st_size
+    if size != length:
+        raise IOError("File '%s' has a size of %d bytes instead of %d bytes" % (path, size, length))
 
-    # Now do the main work.
-    files = _get_files_in_directory(
-        directory,
-        list(),
-        excluded_paths=excluded_paths,
-        relative_to=relative_to,
-        excluded_regexps=excluded_regexps,
-    )
 
-    return files
+def open_data_file(path: str, length: int) -> Any:
+    """Open one of the torrent's files for reading and check its size (see check_file_size)."""
+    fh = open(path, "rb")
+    try:
+        check_file_size(path, fh.fileno(), length)
+    except BaseException:
+        fh.close()
+        raise
+    return fh
 
 
-def split_path(path: str) -> List[str]:
+def read_file_list(
+    path: str,
+    directory: str,
+    excluded_paths: Optional[Set[str]] = None,
+    excluded_regexps: Optional[Set[Pattern[str]]] = None,
+) -> List[List[Any]]:
     """
-    Return a list containing all of a path's components.
+    Return the fingerprints [path, size, mtime_ns] of the files in the given file list ("-" for stdin), in their order.
+    The size and mtime_ns are None unless they are given in the list.
 
-    Paths containing relative components get resolved first.
+    The entries are separated by NUL characters (e.g. the output of find -print0) or by newlines. Each entry is a path,
+    optionally followed by the size and the modification time in nanoseconds, separated by tabs. The paths are
+    relative to the directory (absolute paths must be inside of it). Excluded paths are skipped (as in
+    get_files_in_directory).
 
-    >>> split_path("this/./is/a/very/../fucked\\path/file.ext")
-    ['this', 'is', 'a', 'fucked', 'path', 'file.ext']
+    Nothing is checked on disk here, i.e. missing files and wrong sizes are only noticed when the files are opened for
+    hashing (see open_data_file). Raise ValueError if the list is invalid.
     """
-    if not isinstance(path, str):
-        raise TypeError("path must be instance of: str")
+    if path == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(path, "rb") as fh:
+            data = fh.read()
 
-    parts: List[str] = []
+    directory = os.path.abspath(directory)
+    separator = b"\0" if b"\0" in data else b"\n"
+    fingerprints: List[List[Any]] = []
+    seen: Set[str] = set()
+    for number, entry in enumerate(data.split(separator), 1):
+        if separator == b"\n":
+            entry = entry.rstrip(b"\r")
+        if not entry:
+            continue
 
-    path = os.path.normpath(path)
+        # The size and the modification time are the trailing numeric fields.
+        fields = os.fsdecode(entry).split("\t")
+        numbers: List[int] = []
+        while len(fields) > 1 and len(numbers) < 2 and fields[-1].isdigit():
+            numbers.insert(0, int(fields.pop()))
+        file = os.path.normpath(os.path.join(directory, "\t".join(fields)))
+
+        relative = os.path.relpath(file, directory)
+        if relative == os.curdir or relative.split(os.sep)[0] == os.pardir:
+            raise ValueError("entry %d: '%s' is not a file in '%s'" % (number, "\t".join(fields), directory))
+        if os.path.normcase(relative) in seen:
+            raise ValueError("entry %d: '%s' is listed twice" % (number, relative))
+        seen.add(os.path.normcase(relative))
+
+        if excluded_paths and os.path.normcase(file) in excluded_paths:
+            printv("Skipping '%s' due to explicit exclusion." % clean_str_for_console(relative))
+            continue
+        if excluded_regexps and any(regexp.search(file) for regexp in excluded_regexps):
+            printv("Skipping '%s' due to pattern exclusion." % clean_str_for_console(relative))
+            continue
 
-    head = path
+        fingerprints.append([relative] + numbers + [None] * (2 - len(numbers)))
 
-    while len(head) != 0:
-        (head, tail) = os.path.split(head)
-        parts.insert(0, tail)
+    return fingerprints
 
-    return parts
 
-
-def remove_duplicates(old_list: List[Any]) -> List[Any]:
+def load_layout(
+    maps: List[str],
+    layout_path: Optional[str] = None,
+    excluded_paths: Optional[Set[str]] = None,
+    excluded_regexps: Optional[Set[Pattern[str]]] = None,
+) -> Tuple[List[Tuple[str, str]], str]:
     """
-    Remove any duplicates in old_list, preserving the order of its elements.
+    Return the files (path in the torrent and local path) of a torrent whose layout is composed from local files and
+    directories, and the name of the torrent ("" if it is not given).
 
-    Thus, for all duplicate entries only the first entry is kept in the list.
+    The layout is given as mappings "local_path=torrent/path" (split at the last "=") and/or as JSON layout file like
+    {"name": "...", "files": [{"source": "local_path", "path": "torrent/path"}, ...]} with optional name. Relative
+    sources in the layout file are relative to its directory. A directory is mapped with all of its files (the torrent
+    path may be empty to map its contents to the torrent's root). Excluded paths are skipped (as in
+    get_files_in_directory). The files are ordered like the files of a directory, regardless of the order of the
+    mappings.
+
+    Raise ValueError if the layout is invalid or if a local path does not exist.
     """
-    new_list = list()
-    added_items = set()
+    if excluded_paths is None:
+        excluded_paths = set()
+    if excluded_regexps is None:
+        excluded_regexps = set()
 
-    for item in old_list:
-        if item in added_items:
-            continue
+    entries: List[Tuple[str, str]] = []
+    for mapping in maps:
+        source, separator, path = mapping.rpartition("=")
+        if not separator or not source:
+            raise ValueError("invalid mapping (expected local_path=torrent/path): '%s'" % mapping)
+        entries.append((source, path))
+
+    name = ""
+    if layout_path is not None:
+        with open(layout_path, "r", encoding="utf-8") as fh:
+            layout = json.load(fh)
+        if not isinstance(layout, dict) or not isinstance(layout.get("files"), list):
+            raise ValueError("'%s' is not a valid layout" % layout_path)
+        name = layout.get("name", "")
+        if not isinstance(name, str):
+            raise ValueError("invalid name: %r" % (name, ))
+        # The sources are relative to the layout file.
+        layout_directory = os.path.dirname(os.path.abspath(layout_path))
+        for entry in layout["files"]:
+            if (not isinstance(entry, dict) or not isinstance(entry.get("source"), str)
+                    or not isinstance(entry.get("path"), str)):
+                raise ValueError("invalid entry: %r" % (entry, ))
+            entries.append((os.path.join(layout_directory, entry["source"]), entry["path"]))
+
+    if not entries:
+        raise ValueError("no files mapped")
+
+    files: List[Tuple[List[str], Tuple[str, str]]] = []
+    mapped: Dict[str, str] = {}
+    for source, path in entries:
+        if os.path.isabs(path) or os.path.splitdrive(path)[0]:
+            raise ValueError("invalid path in the torrent: '%s'" % path)
+        components = split_path(path) if os.path.normpath(path) != os.curdir else []
+        if os.pardir in components:
+            raise ValueError("invalid path in the torrent: '%s'" % path)
+
+        source = os.path.abspath(source)
+        if os.path.isdir(source):
+            found = [(components + split_path(file), os.path.join(source, file))
+                     for file in iter_files_in_directory(source, excluded_paths, excluded_regexps=excluded_regexps)]
+        elif not os.path.isfile(source):
+            raise ValueError("'%s' neither is a file nor a directory" % source)
+        elif not components:
+            raise ValueError("the file '%s' needs a path in the torrent" % source)
+        elif os.path.normcase(source) in excluded_paths:
+            printv("Skipping '%s' due to explicit exclusion." % clean_str_for_console(source))
+            found = []
+        elif any(regexp.search(source) for regexp in excluded_regexps):
+            printv("Skipping '%s' due to pattern exclusion." % clean_str_for_console(source))
+            found = []
+        else:
+            found = [(components, source)]
 
-        added_items.add(item)
-        new_list.append(item)
+        for file_components, file_source in found:
+            key = "/".join(file_components)
+            if key in mapped:
+                raise ValueError("'%s' is mapped from '%s' and '%s'" % (key, mapped[key], file_source))
+            mapped[key] = file_source
+            files.append((file_components, (os.path.join(*file_components), file_source)))
 
-    return new_list
+    return sort_like_directory(files, ""), name
 
 
-def replace_in_list(old_list: List[Any], replacements: Dict[Any, Any]) -> List[Any]:
+def clean_str_for_console(path: str) -> str:
     """
-    Replace specific items in a list.
+    Returns the string for printing to the console.
+    
+    Non-printable characters are replaced by a backslashed escape sequence like \\xhh, \\uxxxx or \\Uxxxxxxxx.
+    """
+    encoding = sys.stdout.encoding
+    errors = "backslashreplace"
+    return path.encode(encoding, errors).decode(encoding, errors)
 
-    Note that one element may be replaced by multiple new elements. However, this also makes it impossible to
-    replace an item with a list.
 
-    Example given:
-    >>> replace_in_list(['dont',
-                         'replace',
-                         'us',
-                         'replace me'],
-                        {'replace me': ['you',
-                                        'are',
-                                        'welcome']})
-    ['dont', 'replace', 'us', 'you', 'are', 'welcome']
-    """
-    new_list = list()
+def printv(*args: Any, **kwargs: Any) -> None:
+    """If VERBOSE is True, act as an alias for print. Else do nothing."""
+    if VERBOSE:
+        print(*args, **kwargs)
 
-    replacements_from = set(replacements.keys())
 
-    for item in old_list:
-        if item in replacements_from:
-            new_item = replacements[item]
+def throttle(count: int) -> None:
+    """Account for count bytes that have been read for hashing. Sleep if THROTTLE's limits have been exceeded."""
+    if THROTTLE is not None:
+        THROTTLE.consume(count)
 
-            if isinstance(new_item, list):
-                new_list.extend(new_item)
-            else:
-                new_list.append(new_item)
-        else:
-            new_list.append(item)
 
-    return new_list
+F = TypeVar("F", bound=Callable[..., Any])
 
 
-def calculate_piece_length(size: int) -> int:
-    """
-    Calculate a reasonable piece length for the given torrent size.
+def resets_throttle(fn: F) -> F:
+    """Decorate a function that sets THROTTLE, so that the limits do not apply to later calls of other functions."""
 
-    Proceeding:
-    1. Start with 256 KIB.
-    2. While piece count > 2000: double piece length.
-    3. While piece count < 8:    use half the piece length.
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        global THROTTLE
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            THROTTLE = None
 
-    However, enforce these bounds:
-    - minimum piece length = 16 KiB.
-    - maximum piece length = 64 MiB.
-    """
-    if not isinstance(size, int):
-        raise TypeError("size must be instance of: int")
+    return cast(F, wrapper)
 
-    if size <= 0:
-        raise ValueError("size must be greater than 0 (given: %d)" % size)
 
-    if size < 16 * KIB:
-        return 16 * KIB
+def sha1(data: bytes) -> bytes:
+    """Return the given data's SHA-1 hash (= always 20 bytes)."""
+    m = hashlib.sha1()
+    m.update(data)
+    return m.digest()
 
-    piece_length = 256 * KIB
 
-    while size / piece_length > 2000:
-        piece_length *= 2
+def is_free_threaded() -> bool:
+    """Return True if this is a free-threaded build of CPython (e.g. python3.13t) running without the GIL."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
 
-    while size / piece_length < 8:
-        piece_length //= 2
 
-    # Ensure that: 16 KIB <= piece_length <= 64 * MIB
-    piece_length = max(min(piece_length, 64 * MIB), 16 * KIB)
+# Serializes the writes of the hashing threads into the pieces bytearrays (see store_piece_hashes).
+PIECES_LOCK = threading.Lock()
 
-    return int(piece_length)
 
+def store_piece_hashes(pieces: bytearray, i: int, digests: bytes) -> None:
+    """
+    Store the sha1 hashes of piece i and the following pieces (given as concatenated 20 byte hashes) in pieces (the
+    concatenated hashes of all pieces).
 
-def get_best_trackers(count: int, url: str) -> List[str]:
-    if count < 0:
-        raise ValueError("count must be positive")
+    The hashing threads store their hashes concurrently. Without the GIL (see is_free_threaded), concurrent writes into
+    the same bytearray are not guaranteed to be safe, even if they do not overlap.
+    """
+    with PIECES_LOCK:
+        pieces[i * 20:i * 20 + len(digests)] = digests
 
-    if count == 0:
-        return []
 
-    with urllib.request.urlopen(url) as f:
-        text = f.read().decode("utf-8")
+class SerialStage(object):
+    """
+    Pipeline stage that runs functions in a background thread, one after another in the order of submission.
 
-    best = []
-    i = 0
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        best.append(line)
-        i += 1
-        if i == count:
-            break
+    This allows to calculate md5 sums (which need the data of each file in order) concurrently with reading the data
+    and calculating the sha1 hashes of the pieces. submit() blocks while max_pending functions are pending, which
+    limits the amount of data held by the stage.
+    """
 
-    return best
+    def __init__(self, max_pending: int = 8) -> None:
+        self.max_pending = max_pending
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._futures: List[concurrent.futures.Future[Any]] = []
 
+    def __enter__(self) -> "SerialStage":
+        return self
 
-def raise_error(
-    message: str,
-    parser: Optional[argparse.ArgumentParser] = None,
-):
-    if parser is not None:
-        parser.error(message)
-    else:
-        raise Exception(message)
+    def __exit__(self, *args: Any) -> None:
+        self.close()
 
+    def close(self) -> None:
+        """Stop the background thread (after the pending functions have finished)."""
+        self._executor.shutdown(wait=True)
 
-def create_torrent(
-    path: str,
-    trackers: List[str] = [],
-    nodes: List[str] = [],
-    piece_length: int = 0,
-    private: bool = False,
-    comment: Optional[str] = None,
-    source: Optional[str] = None,
-    force: bool = False,
-    verbose: bool = False,
-    quiet: bool = False,
-    output: Optional[str] = None,
-    exclude: List[str] = [],
-    exclude_pattern: List[str] = [],
-    exclude_pattern_ci: List[str] = [],
-    date: Optional[Union[Literal[False], int]] = None,
-    name: Optional[str] = None,
-    threads: int = 4,
-    include_md5: bool = False,
-    config_path: Optional[str] = None,
-    webseeds: List[str] = [],
-    no_created_by: bool = False,
-    _parser: Optional[argparse.ArgumentParser] = None,
-):
-    """Creates a torrent from a file or Folder
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Run fn(*args) after all functions submitted before."""
+        self._futures.append(self._executor.submit(fn, *args))
 
-    Parameters
-    ----------
-    path
-        File or folder for which to create a torrent
-    trackers, optional
-        Add one or multiple tracker (announce) URLs to the torrent file, by default []
-    nodes, optional
-        Add one or multiple DHT bootstrap nodes, by default []
-    piece_length, optional
-        Set piece size in KiB, by default 0 which means automatic selection
-    private, optional
-        Set the private flag to disable DHT and PEX, by default False
-    comment, optional
-        Add a comment, by default None
-    source, optional
-        Add a source tag, by default None
-    force, optional
-        Overwrite existing .torrent files without asking and disable the piece size, tracker and node validations, by default False
-    verbose, optional
-        Enable output of diagnostic information, by default False
-    quiet, optional
-        Suppress output, e.g. don't print summary, by default False
-    output, optional
-        Set the filename and/or output directory of the created file. By default None, which means <name>.torrent
-    exclude, optional
-        Exclude specific paths, by default []
-    exclude_pattern, optional
-        Exclude paths matching a regular expression, by default []
-    exclude_pattern_ci, optional
-        Same as exclude_pattern but case-insensitive, by default []
-    date, optional
-        Overwrite creation date. This option expects a unix timestamp, None means current time, False means no time at all, by default None
-    name, optional
-        Set the name of the torrent. This changes the filename for single file torrents or the root directory name for multi-file torrents. By default None, which means file name without extension or folder name.
-    threads, optional
-        Set the maximum number of threads to use for hashing pieces, will never use more threads than there are CPU cores, by default 4
-    include_md5, optional
-        Include MD5 hashes in torrent file, by default False
-    config, optional
-        Specify location of config file. By default None, which means <home directiory>/.py3createtorrent.cfg
-    webseeds, optional
-        Add one or multiple HTTP/FTP urls as seeds (GetRight-style), by default []
-    no_created_by, optional
-        Prevents py3createtorrrent from setting the "created by" info to be itself and its version, by default False
-    _parser, optional
-        DO NOT TOUCH THIS, its just used for the function to know if you are using it directly or as a cli tool. For interactivity and different error handeling.
+        # The functions finish in order. Collect the finished ones (raising their errors) and wait for the oldest
+        # ones if too many are pending.
+        while self._futures and (self._futures[0].done() or len(self._futures) > self.max_pending):
+            self._futures.pop(0).result()
+
+    def wait(self) -> None:
+        """Wait until all submitted functions have finished."""
+        while self._futures:
+            self._futures.pop(0).result()
+
+
+class HashWorkers(object):
     """
+    Long-lived threads that calculate the sha1 hashes of pieces and store them in the pieces bytearray.
 
-    global VERBOSE
-    VERBOSE = verbose
+    Consecutive pieces passed to submit() are collected into batches of about BATCH_SIZE bytes (at least one piece),
+    so that the threads pick up work per batch rather than per piece, which matters for small pieces. The batches are
+    passed to the threads through a bounded queue, i.e. submit() blocks while max_pending batches are waiting.
 
-    if config_path:
-        if not os.path.isfile(config_path):
-            raise_error("The config file at '%s' does not exist" % config_path, _parser)
+    The threads pass the piece data to hash_piece, which returns the piece's hash. By default, the data is the piece's
+    bytes, but it can be anything that hash_piece accepts (e.g. the ranges of the files for an AfAlgHasher).
+    """
 
-    config: Config = Config(config_path, advertise=not no_created_by)
+    BATCH_SIZE = 1 * MIB
+
+    def __init__(self,
+                 pieces: bytearray,
+                 piece_length: int,
+                 threads: int,
+                 max_pending: Optional[int] = None,
+                 hash_piece: Callable[[Any], bytes] = sha1) -> None:
+        self.pieces = pieces
+        self.batch_pieces = max(1, self.BATCH_SIZE // piece_length)
+        self.hash_piece = hash_piece
+
+        self._queue: "queue.Queue[Optional[Tuple[int, List[Any]]]]" = queue.Queue(max_pending or threads)
+        self._first = 0
+        self._batch: List[Any] = []
+        self._error: Optional[BaseException] = None
+        self._stopping = False
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self) -> "HashWorkers":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None and not self._stopping:
+                    first, batch = item
+                    store_piece_hashes(self.pieces, first, b"".join(self.hash_piece(data) for data in batch))
+            except BaseException as exc:
+                self._error = exc
+            finally:
+                self._queue.task_done()
+
+    def _flush(self) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._batch:
+            self._queue.put((self._first, self._batch))
+            self._batch = []
+
+    def submit(self, i: int, piece_data: Any) -> None:
+        """Hash piece i with the given data."""
+        if self._batch and i != self._first + len(self._batch):
+            self._flush()
+        if not self._batch:
+            self._first = i
+        self._batch.append(piece_data)
+        if len(self._batch) >= self.batch_pieces:
+            self._flush()
+
+    def wait(self) -> None:
+        """Wait until the hashes of all submitted pieces have been stored."""
+        self._flush()
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        """Stop the threads. Pending batches are dropped (call wait() before to hash them)."""
+        self._stopping = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class FileChecksums(object):
+    """
+    Calculate checksums of files (see ALGORITHMS) from the data that is read for hashing the pieces.
 
-    try:
-        config.load_config()
-    except json.JSONDecodeError as exc:
-        print(
-            "Could not parse config file at '%s'" % config.get_path_to_config_file(),
-            file=sys.stderr,
-        )
-        print(exc, file=sys.stderr)
-        sys.exit(1)
-    except Config.InvalidConfigError as exc:
-        print(exc, file=sys.stderr)
-        sys.exit(1)
+    Each algorithm runs in its own SerialStage, i.e. in parallel to the other algorithms, to reading the data and to
+    the sha1 hashing of the pieces. The data of each file must be passed completely and in order.
+    """
 
-    printv("Config / Tracker abbreviations:\n" + pprint.pformat(config.tracker_abbreviations))
-    printv("Config / Advertise:         " + str(config.advertise))
-    printv("Config / Best trackers URL: " + config.best_trackers_url)
+    ALGORITHMS = ("md5", "sha1", "sha256", "sha512", "blake2b", "crc32")
 
-    # Ask the user if he really wants to use uncommon piece lengths.
-    # (Unless the force option has been set.)
-    if not force and 0 < piece_length < 16:
-        if _parser is not None:
-            if "yes" != input("It is strongly recommended to use a piece length greater or equal than 16 KiB! Do you "
-                              "really want to continue? yes/no: "):
-                raise_error("Aborted.", _parser)
-        else:
-            raise_error("Uncommon piece length, and no force flag set.")
+    # Names of the checksum files (see write_files). The SFV file is named like the torrent.
+    FILENAMES = {
+        "md5": "MD5SUMS",
+        "sha1": "SHA1SUMS",
+        "sha256": "SHA256SUMS",
+        "sha512": "SHA512SUMS",
+        "blake2b": "B2SUMS",
+    }
 
-    if not force and piece_length > 16384:
-        if _parser is not None:
-            if "yes" != input(
-                    "It is strongly recommended to use a maximum piece length of 16384 KiB (16 MiB)! Do you really "
-                    "want to continue? yes/no: "):
-                raise_error("Aborted.", _parser)
-        else:
-            raise_error("Piece length over 16384, and no force flag set.")
+    def __init__(self, algorithms: List[str], count: int) -> None:
+        self.algorithms = algorithms
+        self._stages = {algorithm: SerialStage() for algorithm in algorithms}
 
-    if not force and piece_length % 16 != 0:
-        if _parser is not None:
-            if "yes" != input(
-                    "It is strongly recommended to use a piece length that is a multiple of 16 KiB! Do you really "
-                    "want to continue? yes/no: "):
-                raise_error("Aborted.", _parser)
-        else:
-            raise_error("Piece length not a multiple of 16 KiB, and no force flag set.")
+        # The running checksums of the files that are currently being read and the finished checksums.
+        self._states: Dict[str, Dict[int, Any]] = {algorithm: {} for algorithm in algorithms}
+        self._checksums: Dict[str, List[Optional[str]]] = {algorithm: [None] * count for algorithm in algorithms}
 
-    # Verbose and quiet options may not be used together.
-    if verbose and quiet:
-        raise_error("Being verbose and quiet exclude each other.", _parser)
+    def __enter__(self) -> "FileChecksums":
+        return self
 
-    # ##########################################
-    # CALCULATE/SET THE FOLLOWING METAINFO DATA:
-    # - info
-    #   - pieces (concatenated 20 byte sha1 hashes of all the data)
-    #   - files (if multiple files)
-    #   - length and md5sum (if single file)
-    #   - name (may be overwritten in the next section by the --name option)
+    def __exit__(self, *args: Any) -> None:
+        self.close()
 
-    input_path: str = path
+    def close(self) -> None:
+        for stage in self._stages.values():
+            stage.close()
 
-    # Validate the given path.
-    if not os.path.isfile(input_path) and not os.path.isdir(input_path):
-        raise_error("'%s' neither is a file nor a directory." % input_path, _parser)
+    def _update(self, algorithm: str, k: int, data: bytes) -> None:
+        states = self._states[algorithm]
+        if algorithm == "crc32":
+            states[k] = zlib.crc32(data, states.get(k, 0))
+        else:
+            if k not in states:
+                states[k] = hashlib.new(algorithm)
+            states[k].update(data)
+
+    def _finish(self, algorithm: str, k: int) -> None:
+        state = self._states[algorithm].pop(k, None)
+        if algorithm == "crc32":
+            self._checksums[algorithm][k] = "%08X" % (state or 0)
+        else:
+            self._checksums[algorithm][k] = (state or hashlib.new(algorithm)).hexdigest()
 
-    # Evaluate / apply the tracker abbreviations.
-    trackers = replace_in_list(trackers, config.tracker_abbreviations)
+    def update(self, k: int, data: bytes) -> None:
+        """Add data of the k-th file."""
+        for algorithm, stage in self._stages.items():
+            stage.submit(self._update, algorithm, k, data)
 
-    # Remove duplicate trackers.
-    trackers = remove_duplicates(trackers)
+    def finish(self, k: int) -> None:
+        """Finish the checksums of the k-th file (after all of its data has been added)."""
+        for algorithm, stage in self._stages.items():
+            stage.submit(self._finish, algorithm, k)
 
-    # Validate tracker URLs.
-    invalid_trackers = False
-    best_shortcut_present = False
-    regexp = re.compile(r"^(http|https|udp)://", re.I)
-    regexp_best = re.compile(r"best([0-9]+)", re.I)
-    for t in trackers:
-        m = regexp_best.match(t)
-        if m:
-            best_shortcut_present = True
-        if not regexp.search(t) and not m:
-            print("Warning: Not a valid tracker URL: %s" % t, file=sys.stderr)
-            invalid_trackers = True
+    def get_checksums(self, algorithm: str) -> List[str]:
+        """
+        Return the checksums of all files as hex strings (CRC32 in upper case, as in SFV files).
 
-    if invalid_trackers and not force:
-        if _parser is not None:
-            if "yes" != input("Some tracker URLs are invalid. Continue? yes/no: "):
-                raise_error("Aborted.", _parser)
-        else:
-            raise_error("Some tracker URLs are invalid, and force flag is not set.")
+        Files that have not been finished (i.e. empty files, that are not read) get the checksum of empty data.
+        """
+        self._stages[algorithm].wait()
+        for k, checksum in enumerate(self._checksums[algorithm]):
+            if checksum is None:
+                self._finish(algorithm, k)
+        return self._checksums[algorithm]  # type:ignore
 
-    # Validate number of threads.
-    if threads <= 0:
-        raise_error("Number of threads must be positive.", _parser)
+    def write_files(self, directory: str, name: str, files: List[str], algorithms: List[str]) -> List[str]:
+        """
+        Write the checksums of the files (paths relative to the torrent's root directory) for the given algorithms to
+        directory, in the formats of sha256sum etc. and SFV (for CRC32). Return the paths of the written checksum
+        files.
 
-    # Handle best[0-9] shortcut.
-    if best_shortcut_present:
-        new_trackers = []
-        for t in trackers:
-            m = regexp_best.match(t)
-            if m:
-                try:
-                    new_trackers.extend(get_best_trackers(int(m.group(1)), config.best_trackers_url))
-                except urllib.error.URLError as e:
-                    print(
-                        "Error: Could not download best trackers from '%s'. Reason: %s" % (config.best_trackers_url, e),
-                        file=sys.stderr,
-                    )
-                    sys.exit(1)
-            else:
-                new_trackers.append(t)
-        trackers = new_trackers
+        Except for the SFV file, the checksum files have fixed names (see FILENAMES), i.e. they replace the ones of
+        other torrents in the same directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for algorithm in algorithms:
+            lines = []
+            for file, checksum in zip(files, self.get_checksums(algorithm)):
+                file = "/".join(split_path(file))
+                if algorithm == "crc32":
+                    lines.append("%s %s\n" % (file, checksum))
+                elif "\\" in file or "\n" in file:
+                    # Like sha256sum: Mark the line and escape the file name.
+                    lines.append("\\%s  %s\n" % (checksum, file.replace("\\", "\\\\").replace("\n", "\\n")))
+                else:
+                    lines.append("%s  %s\n" % (checksum, file))
+
+            path = os.path.join(directory, name + ".sfv" if algorithm == "crc32" else self.FILENAMES[algorithm])
+            with open(path, "w", encoding="utf-8", newline="\n") as fh:
+                fh.writelines(lines)
+            paths.append(path)
+
+        return paths
+
+
+class ReadStats(object):
+    """
+    Collect the number of bytes read from each device (st_dev) and the time during which the device was busy, i.e. at
+    least one read from it was in progress.
+    """
 
-    # Disallow DHT bootstrap nodes for private torrents.
-    if nodes and private:
-        raise_error(
-            "DHT bootstrap nodes cannot be specified for a private torrent. Private torrents do not support DHT.",
-            _parser,
-        )
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+        self._devices: Dict[int, List[Any]] = {}  # st_dev -> [bytes, busy seconds, active reads, busy since]
+
+    def begin(self, device: int) -> None:
+        """Record the beginning of a read from the device."""
+        with self._lock:
+            totals = self._devices.setdefault(device, [0, 0.0, 0, 0.0])
+            if totals[2] == 0:
+                totals[3] = time.monotonic()
+            totals[2] += 1
+
+    def end(self, device: int, count: int) -> None:
+        """Record the end of a read of count bytes from the device."""
+        with self._lock:
+            totals = self._devices[device]
+            totals[0] += count
+            totals[2] -= 1
+            if totals[2] == 0:
+                totals[1] += time.monotonic() - totals[3]
+
+    def get_lines(self) -> List[str]:
+        """Return one line with the amount of data and the throughput per device."""
+        lines = []
+        with self._lock:
+            for device, (count, seconds, _, _) in sorted(self._devices.items()):
+                if hasattr(os, "major"):
+                    name = "%d:%d" % (os.major(device), os.minor(device))  # type:ignore
+                else:
+                    name = "%d" % device
+                rate = "%.1f MiB/s" % (count / MIB / seconds) if seconds > 0 else "-"
+                lines.append("Device %s: %.1f MiB in %.1f s (%s)" % (name, count / MIB, seconds, rate))
+        return lines
+
+
+class Throttle(object):
+    """
+    Limit the rate at which the data is read (token bucket) and the CPU usage (duty cycle) while hashing.
 
-    # Validate DHT bootstrap nodes.
-    parsed_nodes = list()
-    invalid_nodes = False
-    for n in nodes:
-        splitted = n.split(",")
-        if len(splitted) != 2:
-            print(
-                "Invalid format for DHT bootstrap node '%s'. Please use the format 'host,port'." % n,
-                file=sys.stderr,
-            )
-            invalid_nodes = True
-            continue
+    consume() is called after each read and sleeps as long as necessary. max_read_rate is in bytes per second and
+    max_cpu in percent of one CPU core (0 means no limit). The CPU time includes all threads of the process.
 
-        host, port = splitted
-        if not port.isdigit():
-            print(
-                "Invalid port number for DHT bootstrap node '%s'. Ports must be numeric." % n,
-                file=sys.stderr,
-            )
-            invalid_nodes = True
+    The limits can be changed at runtime with a control file, a JSON object like {"max_read_rate": "20M",
+    "max_cpu": 50}. The file is checked for changes every CHECK_INTERVAL seconds.
+    """
 
-        parsed_nodes.append([host, int(port)])
+    CHECK_INTERVAL = 1.0
+
+    # The CPU usage is measured over windows of this many seconds.
+    CPU_WINDOW = 10.0
+
+    def __init__(self, max_read_rate: int = 0, max_cpu: float = 0, control_file: Optional[str] = None) -> None:
+        self.max_read_rate = max_read_rate
+        self.max_cpu = max_cpu
+        self.control_file = control_file
+
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._cpu_start = time.process_time()
+        self._wall_start = self._last
+        self._next_check = self._last
+        self._control_mtime: Optional[int] = None
+
+    def consume(self, count: int) -> None:
+        """Account for count bytes that have been read, sleeping if a limit has been exceeded."""
+        delay = 0.0
+        with self._lock:
+            now = time.monotonic()
+            if self.control_file is not None and now >= self._next_check:
+                self._next_check = now + self.CHECK_INTERVAL
+                self._check_control_file()
+
+            # The bucket holds up to one second worth of tokens. Reads beyond that are paid for by sleeping.
+            if self.max_read_rate > 0:
+                self._tokens = min(self.max_read_rate, self._tokens + (now - self._last) * self.max_read_rate)
+                self._tokens -= count
+                if self._tokens < 0:
+                    delay = -self._tokens / self.max_read_rate
+            self._last = now
+
+            if self.max_cpu > 0:
+                cpu = time.process_time() - self._cpu_start
+                wall = now - self._wall_start
+                delay = max(delay, cpu * 100 / self.max_cpu - wall)
+                if wall >= self.CPU_WINDOW:
+                    self._reset_cpu_window()
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def _reset_cpu_window(self) -> None:
+        self._cpu_start = time.process_time()
+        self._wall_start = time.monotonic()
+
+    def _check_control_file(self) -> None:
+        """Load the limits from the control file if it has been changed. Errors are reported, but not fatal."""
+        assert self.control_file is not None
+        try:
+            mtime = os.stat(self.control_file).st_mtime_ns
+            if mtime == self._control_mtime:
+                return
+            self._control_mtime = mtime
+            with open(self.control_file, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            max_read_rate = parse_rate(data.get("max_read_rate", self.max_read_rate))
+            max_cpu = float(data.get("max_cpu", self.max_cpu))
+            if max_cpu < 0:
+                raise ValueError("invalid max_cpu: %s" % max_cpu)
+        except FileNotFoundError:
+            return
+        except (IOError, ValueError, TypeError) as exc:
+            print("Warning: cannot load the limits from '%s': %s" % (self.control_file, exc), file=sys.stderr)
+            return
 
-    if invalid_nodes and not force:
-        if _parser is not None:
-            if "yes" != input("Some DHT bootstrap nodes are invalid. Continue? yes/no: "):
-                raise_error("Aborted.", _parser)
-        else:
-            raise_error("Some DHT bootstrap nodes are invalid, and force flag is not set.")
+        if max_read_rate != self.max_read_rate or max_cpu != self.max_cpu:
+            printv("Limits changed: read rate %s, CPU %s." %
+                   ("%d bytes/s" % max_read_rate if max_read_rate else "-", "%g%%" % max_cpu if max_cpu else "-"))
+        self.max_read_rate = max_read_rate
+        self.max_cpu = max_cpu
+        self._reset_cpu_window()
 
-    # Parse and validate excluded paths.
-    excluded_paths = set([os.path.normcase(os.path.abspath(path)) for path in exclude])
 
-    # Parse exclude patterns.
-    excluded_regexps = set(re.compile(regexp) for regexp in exclude_pattern)
-    excluded_regexps |= set(re.compile(regexp, re.IGNORECASE) for regexp in exclude_pattern_ci)
+class DeviceReaders(object):
+    """
+    Read the data ahead of the hashing with separate reader threads for each device (st_dev), so that files on
+    different disks are read in parallel.
+
+    The data is read in segments, i.e. contiguous ranges of the files, which must be opened with open() in the given
+    order. The blocks read end at multiples of block_size in the concatenated data (i.e. at the pieces' boundaries).
+    Each device has its own queue of segments and its own readers. They read ahead until max_buffered bytes of the
+    device are waiting to be consumed. The oldest unconsumed segment of a device is always read, so the consumer cannot
+    starve.
+    """
 
-    # Warn the user if he attempts to exclude any paths when creating a torrent for a single file (makes no sense).
-    if os.path.isfile(input_path) and (len(excluded_paths) > 0 or len(excluded_regexps) > 0):
-        print(
-            "Warning: Excluding paths is not possible when creating a torrent for a single file.",
-            file=sys.stderr,
-        )
+    class Segment(object):
+        """File-like object for reading a segment that is filled by the readers."""
 
-    # Warn the user if he attempts to exclude a specific path, that does not even exist.
-    for path in excluded_paths:
-        if not os.path.exists(path):
-            print(
-                "Warning: You're excluding a path that does not exist: '%s'" % path,
-                file=sys.stderr,
-            )
+        def __init__(self, readers: "DeviceReaders", index: int) -> None:
+            self._readers = readers
+            self._index = index
+            self._data = memoryview(b"")
 
-    # Get the torrent's files and / or calculate its size.
-    printv("Scanning size of input file/s...")
-    if os.path.isfile(input_path):
-        torrent_size = os.path.getsize(input_path)
-    else:
-        torrent_files = get_files_in_directory(input_path,
-                                               excluded_paths=excluded_paths,
-                                               excluded_regexps=excluded_regexps)
-        torrent_size = sum([os.path.getsize(os.path.join(input_path, file)) for file in torrent_files])
+        def seek(self, pos: int) -> None:
+            # The segment starts at the position that the consumer seeks to.
+            assert pos == self._readers.segments[self._index][1]
 
-    # Torrents for 0 byte data can't be created.
-    if torrent_size == 0:
-        print("Error: Can't create torrent for 0 byte data.", file=sys.stderr)
-        print("Check your files and exclusions!", file=sys.stderr)
-        sys.exit(1)
+        def read(self, count: int) -> bytes:
+            data = bytearray()
+            while len(data) < count:
+                if not self._data:
+                    block = self._readers._take(self._index)
+                    if block is None:
+                        break
+                    if not data and len(block) == count:
+                        # The blocks usually match the reads of the consumer, which avoids copying them.
+                        return block
+                    self._data = memoryview(block)
+                n = min(count - len(data), len(self._data))
+                data += self._data[:n]
+                self._data = self._data[n:]
+            return bytes(data)
+
+        def close(self) -> None:
+            self._readers._release(self._index)
+
+    def __init__(self,
+                 paths: List[str],
+                 offsets: List[int],
+                 lengths: List[int],
+                 devices: List[int],
+                 segments: List[Tuple[int, int, int]],
+                 block_size: int,
+                 readers_per_device: int = 1,
+                 max_buffered: int = 64 * MIB,
+                 read_stats: Optional[ReadStats] = None) -> None:
+        """
+        segments is the list of (file index, start, end) in the order of consumption. offsets, lengths and devices
+        are the offsets of the files in the concatenated data, their sizes and their st_dev.
+        """
+        self.paths = paths
+        self.offsets = offsets
+        self.lengths = lengths
+        self.devices = devices
+        self.segments = segments
+        self.block_size = block_size
+        self.max_buffered = max_buffered
+        self.read_stats = read_stats
+
+        self._condition = threading.Condition()
+        self._closed = False
+        self._next = 0  # index of the next segment to be opened by the consumer
+        self._blocks: List[List[Any]] = [[] for _ in segments]  # blocks read but not consumed (None = end, or error)
+        self._buffered: Dict[int, int] = {}  # st_dev -> bytes read but not consumed
+
+        # Per device: the indexes of its segments, the position of the next one to read and its oldest unconsumed one.
+        self._queues: Dict[int, List[int]] = {}
+        for i, (k, _, _) in enumerate(segments):
+            self._queues.setdefault(devices[k], []).append(i)
+        self._positions = {device: 0 for device in self._queues}
+        self._oldest = {device: 0 for device in self._queues}
+
+        self._threads = []
+        for device in self._queues:
+            self._buffered[device] = 0
+            for _ in range(readers_per_device):
+                thread = threading.Thread(target=self._read, args=(device, ), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def __enter__(self) -> "DeviceReaders":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the readers."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def open(self, k: int) -> "DeviceReaders.Segment":
+        """Return the next segment, which must be one of file k."""
+        assert self.segments[self._next][0] == k
+        self._next += 1
+        return DeviceReaders.Segment(self, self._next - 1)
+
+    def _read(self, device: int) -> None:
+        queue = self._queues[device]
+        while True:
+            with self._condition:
+                if self._closed or self._positions[device] == len(queue):
+                    return
+                i = queue[self._positions[device]]
+                self._positions[device] += 1
+
+            k, start, end = self.segments[i]
+            error: Optional[Exception] = None
+            try:
+                with open_data_file(self.paths[k], self.lengths[k]) as fh:
+                    fh.seek(start)
+                    pos = start
+                    while pos < end:
+                        # Wait until the data can be buffered (unless the consumer needs this segment next).
+                        with self._condition:
+                            while (not self._closed and self._buffered[device] >= self.max_buffered
+                                   and queue[self._oldest[device]] != i):
+                                self._condition.wait()
+                            if self._closed:
+                                return
+
+                        if self.read_stats is not None:
+                            self.read_stats.begin(device)
+                        block = fh.read(min(self.block_size - (self.offsets[k] + pos) % self.block_size, end - pos))
+                        if self.read_stats is not None:
+                            self.read_stats.end(device, len(block))
+                        throttle(len(block))
+                        if not block:
+                            break
+                        pos += len(block)
+
+                        with self._condition:
+                            self._blocks[i].append(block)
+                            self._buffered[device] += len(block)
+                            self._condition.notify_all()
+            except Exception as exc:
+                error = exc
+
+            # The segment ends with None or the error.
+            with self._condition:
+                self._blocks[i].append(error)
+                self._condition.notify_all()
+
+    def _take(self, i: int) -> Optional[bytes]:
+        """Return the next block of segment i or None at its end."""
+        with self._condition:
+            while not self._blocks[i]:
+                self._condition.wait()
+            block = self._blocks[i].pop(0)
+            if isinstance(block, Exception):
+                raise block
+            if block is None:
+                # Keep the end marker for further reads.
+                self._blocks[i].append(None)
+            else:
+                self._buffered[self.devices[self.segments[i][0]]] -= len(block)
+                self._condition.notify_all()
+            return block
+
+    def _release(self, i: int) -> None:
+        """Mark segment i as consumed, dropping the rest of its data."""
+        device = self.devices[self.segments[i][0]]
+        with self._condition:
+            for block in self._blocks[i]:
+                if isinstance(block, bytes):
+                    self._buffered[device] -= len(block)
+            self._blocks[i] = [None]
+            queue = self._queues[device]
+            while self._oldest[device] < len(queue) and queue[self._oldest[device]] <= i:
+                self._oldest[device] += 1
+            self._condition.notify_all()
+
+
+class SmallFilePrefetcher(object):
+    """
+    Open and read small files concurrently in a thread pool, ahead of the hashing. This hides the latency of opening
+    and reading many small files one after another.
 
-    # Calculate or parse the piece size.
-    printv("Total size of input file/s: %d KiB" % torrent_size)
-    if piece_length == 0:
-        piece_length = calculate_piece_length(torrent_size)
-        printv("Calculated piece length:    %d KiB" % (piece_length / KIB))
-    elif piece_length > 0:
-        piece_length = piece_length * KIB
-    else:
-        raise_error("Invalid piece size: '%d'" % piece_length, _parser)
+    Like for DeviceReaders, the data is read in segments which must be opened with open() in the given order. The
+    segments of files up to max_file_size bytes are read by up to workers threads, as long as less than max_buffered
+    bytes are waiting to be consumed. Larger files are opened and streamed by the consumer as usual. Consecutive small
+    segments are read in batches of up to BATCH_SIZE bytes, which reduces the overhead of the thread pool.
+    """
 
-    printv("Torrent will have %d pieces." % int(math.ceil(torrent_size / piece_length)))
+    # Files up to this size are prefetched by default.
+    MAX_FILE_SIZE = 1 * MIB
 
-    # Do the main work now.
-    # -> prepare the metainfo dictionary.
-    if os.path.isfile(input_path):
-        info = create_single_file_info(input_path, piece_length, include_md5, threads=threads)
-    else:
-        info = create_multi_file_info(
-            input_path,
-            torrent_files,  # type:ignore
-            piece_length,
-            include_md5,
-            threads=threads,
-        )
+    BATCH_SIZE = 1 * MIB
 
-    assert len(info["pieces"]) % 20 == 0, "len(pieces) not a multiple of 20"
+    class Segment(object):
+        """File-like object for reading a prefetched segment."""
 
-    # ###########################
-    # FINISH METAINFO DICTIONARY:
-    # - info
-    #   - piece length
-    #   - name (eventually overwrite)
-    #   - private
-    # - announce (if at least one tracker was specified)
-    # - announce-list (if multiple trackers were specified)
-    # - nodes (if at least one DHT bootstrap node was specified)
-    # - creation date (may be disabled as well)
-    # - created by
-    # - comment (may be disabled as well)
+        def __init__(self, data: bytes, start: int) -> None:
+            self._data = data
+            self._start = start
+            self._pos = 0
 
-    # Finish sub-dict "info".
-    info["piece length"] = piece_length
+        def seek(self, pos: int) -> None:
+            # The segment starts at the position that the consumer seeks to.
+            assert pos == self._start
 
-    if private:
-        info["private"] = 1
+        def read(self, count: int) -> bytes:
+            if self._pos == 0 and count >= len(self._data):
+                data = self._data
+            else:
+                data = self._data[self._pos:self._pos + count]
+            self._pos += len(data)
+            return data
+
+        def close(self) -> None:
+            self._data = b""
+
+    def __init__(self,
+                 paths: List[str],
+                 lengths: List[int],
+                 segments: List[Tuple[int, int, int]],
+                 workers: int = 16,
+                 max_file_size: int = MAX_FILE_SIZE,
+                 max_buffered: int = 64 * MIB,
+                 devices: Optional[List[int]] = None,
+                 read_stats: Optional[ReadStats] = None) -> None:
+        """
+        segments is the list of (file index, start, end) in the order of consumption. devices is the st_dev of each
+        file, which is needed for recording the reads in read_stats.
+        """
+        self.paths = paths
+        self.lengths = lengths
+        self.segments = segments
+        self.workers = workers
+        self.max_file_size = max_file_size
+        self.max_buffered = max_buffered
+        self.devices = devices
+        self.read_stats = read_stats
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        # The batch (its future and the position in it) of each prefetched segment that has not been opened yet, and the
+        # number of batches that have not been opened completely.
+        self._segment_batches: Dict[int, Tuple[concurrent.futures.Future[List[bytes]], int, bool]] = {}
+        self._batch_count = 0
+        self._next = 0  # index of the next segment to be opened by the consumer
+        self._submitted = 0  # index of the next segment to be considered for prefetching
+        self._buffered = 0
+
+    def __enter__(self) -> "SmallFilePrefetcher":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop prefetching."""
+        for future, _, _ in self._segment_batches.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def add_file(self, path: str, length: int, device: Optional[int] = None) -> None:
+        """
+        Append a file (read as a whole) to the files and segments, e.g. if the files are found while hashing. Empty
+        files get no segment, as they are not opened.
+        """
+        self.paths.append(path)
+        self.lengths.append(length)
+        if self.devices is not None:
+            assert device is not None
+            self.devices.append(device)
+        if length > 0:
+            self.segments.append((len(self.paths) - 1, 0, length))
+
+    def open(self, k: int) -> Any:
+        """Return the next segment, which must be one of file k."""
+        i = self._next
+        assert self.segments[i][0] == k
+        self._next += 1
+
+        self._prefetch()
+        entry = self._segment_batches.pop(i, None)
+        if entry is None:
+            return open_data_file(self.paths[k], self.lengths[k])
+
+        future, position, last = entry
+        data = future.result()[position]
+        if last:
+            self._batch_count -= 1
+        _, start, end = self.segments[i]
+        self._buffered -= end - start
+        return SmallFilePrefetcher.Segment(data, start)
+
+    def _prefetch(self) -> None:
+        """Submit batches of the next small segments, keeping up to two batches per worker pending."""
+        while self._submitted < len(self.segments) and self._batch_count < 2 * self.workers:
+            batch: List[int] = []
+            size = 0
+            while self._submitted < len(self.segments):
+                k, start, end = self.segments[self._submitted]
+                if self.lengths[k] > self.max_file_size:
+                    if batch:
+                        break
+                    self._submitted += 1
+                    continue
+                if batch and size + end - start > self.BATCH_SIZE:
+                    break
+                if self._buffered + size > 0 and self._buffered + size + end - start > self.max_buffered:
+                    break
+                batch.append(self._submitted)
+                size += end - start
+                self._submitted += 1
+            if not batch:
+                break
+
+            future = self._executor.submit(self._read, batch)
+            for position, i in enumerate(batch):
+                self._segment_batches[i] = (future, position, position == len(batch) - 1)
+            self._buffered += size
+            self._batch_count += 1
+
+    def _read(self, batch: List[int]) -> List[bytes]:
+        blocks = []
+        for i in batch:
+            k, start, end = self.segments[i]
+            if self.read_stats is not None and self.devices is not None:
+                self.read_stats.begin(self.devices[k])
+            data = b""
+            try:
+                with open_data_file(self.paths[k], self.lengths[k]) as fh:
+                    if start > 0:
+                        fh.seek(start)
+                    data = fh.read(end - start)
+            finally:
+                if self.read_stats is not None and self.devices is not None:
+                    self.read_stats.end(self.devices[k], len(data))
+            throttle(len(data))
+            blocks.append(data)
+        return blocks
+
+
+class DirectoryScanner(object):
+    """
+    Find the files in a directory (see iter_files_in_directory) in a background thread, so that the files that have
+    been found so far can be hashed while the directory is still being scanned (see _hash_pieces).
+    """
 
-    # Re-use the name regex for source parameter.
-    if source is not None:
-        source = source.strip()
+    def __init__(self,
+                 directory: str,
+                 excluded_paths: Optional[Set[str]] = None,
+                 excluded_regexps: Optional[Set[Pattern[str]]] = None) -> None:
+        self.directory = directory
+        # The fingerprints (see get_file_fingerprints) of the files returned by get() so far.
+        self.fingerprints: List[List[Any]] = []
+        self.done = False
+
+        # The scanning thread passes batches of the fingerprints and devices of the files it finds, followed by None
+        # (or an exception).
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._scan, args=(excluded_paths, excluded_regexps), daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "DirectoryScanner":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop scanning."""
+        self._stop.set()
+
+    def _scan(self, excluded_paths: Optional[Set[str]], excluded_regexps: Optional[Set[Pattern[str]]]) -> None:
+        try:
+            # The files are passed in small batches, which reduces the overhead of the queue.
+            batch = []
+            for file in iter_files_in_directory(self.directory,
+                                                excluded_paths=excluded_paths,
+                                                excluded_regexps=excluded_regexps):
+                if self._stop.is_set():
+                    return
+                st = os.stat(os.path.join(self.directory, file))
+                batch.append(([file, st.st_size, st.st_mtime_ns], st.st_dev))
+                if len(batch) >= 64 or self._queue.empty():
+                    self._queue.put(batch)
+                    batch = []
+            if batch:
+                self._queue.put(batch)
+            self._queue.put(None)
+        except BaseException as exc:
+            self._queue.put(exc)
+
+    def get(self, block: bool) -> List[Tuple[List[Any], int]]:
+        """
+        Return the fingerprints and devices of the files that have been found since the last call. If block is True,
+        wait until there are any or the scan is done (then done is True).
+        """
+        files: List[Tuple[List[Any], int]] = []
+        while not self.done:
+            try:
+                item = self._queue.get(block=block and not files)
+            except queue.Empty:
+                break
+            if item is None:
+                self.done = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                files.extend(item)
+        self.fingerprints.extend(fingerprint for fingerprint, _ in files)
+        return files
 
-        regexp = re.compile(r"^[A-Z0-9_\-., ]+$", re.I)
 
-        if not regexp.match(source):
-            raise_error("Invalid source: '%s'. Allowed chars: A_Z, a-z, 0-9, any of {.,_-} plus spaces." % source,
-                        _parser)
+class AfAlgHasher(object):
+    """
+    Calculate the sha1 hashes of ranges of files with the Linux kernel crypto API (AF_ALG sockets).
 
-        info["source"] = source
+    The data is spliced from the files through a pipe into the socket, i.e. it is never copied into Python. Each thread
+    uses its own socket and pipe, so hash() can be called concurrently.
+    """
 
-    # Construct outer metainfo dict, which contains the torrent's whole information.
-    metainfo: Dict[str, Any] = {"info": info}
-    if trackers:
-        metainfo["announce"] = trackers[0]
+    PIPE_SIZE = 1 * MIB
+
+    @staticmethod
+    def is_available() -> bool:
+        """Return True if the kernel supports sha1 via AF_ALG and os.splice is available (Python 3.10+)."""
+        if not hasattr(socket, "AF_ALG") or not hasattr(os, "splice"):
+            return False
+        try:
+            with socket.socket(socket.AF_ALG, socket.SOCK_SEQPACKET, 0) as alg:  # type:ignore
+                alg.bind(("hash", "sha1"))
+        except OSError:
+            return False
+        return True
+
+    def __init__(self,
+                 paths: List[str],
+                 lengths: List[int],
+                 devices: Optional[List[int]] = None,
+                 read_stats: Optional[ReadStats] = None) -> None:
+        """
+        lengths are the sizes of the files. devices is the st_dev of each file, which is needed for recording the
+        reads in read_stats.
+        """
+        self.paths = paths
+        self.lengths = lengths
+        self.devices = devices
+        self.read_stats = read_stats
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._states: List[List[Any]] = []
+
+    def __enter__(self) -> "AfAlgHasher":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the sockets, pipes and files of all threads."""
+        with self._lock:
+            for state in self._states:
+                self._close_state(state)
+            self._states = []
+
+    @staticmethod
+    def _close_state(state: List[Any]) -> None:
+        alg, op, pipe_r, pipe_w, _, fd = state
+        op.close()
+        alg.close()
+        os.close(pipe_r)
+        os.close(pipe_w)
+        if fd is not None:
+            os.close(fd)
+
+    def _get_state(self) -> List[Any]:
+        """Return [socket, operation socket, pipe (read end), pipe (write end), file index, fd] of this thread."""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            import fcntl
+
+            alg = socket.socket(socket.AF_ALG, socket.SOCK_SEQPACKET, 0)  # type:ignore
+            alg.bind(("hash", "sha1"))
+            op, _ = alg.accept()
+            pipe_r, pipe_w = os.pipe()
+            if hasattr(fcntl, "F_SETPIPE_SZ"):
+                try:
+                    fcntl.fcntl(pipe_w, fcntl.F_SETPIPE_SZ, self.PIPE_SIZE)  # type:ignore
+                except OSError:
+                    pass
+            state = [alg, op, pipe_r, pipe_w, None, None]
+            self._local.state = state
+            with self._lock:
+                self._states.append(state)
+        return state
+
+    def hash(self, parts: List[Tuple[int, int, int]]) -> bytes:
+        """Return the sha1 hash of the concatenated parts, given as (file index, offset, count)."""
+        state = self._get_state()
+        try:
+            return self._hash(state, parts)
+        except BaseException:
+            # The socket may contain a partial hash now, so the thread starts over with a new one.
+            with self._lock:
+                self._states.remove(state)
+            self._close_state(state)
+            self._local.state = None
+            raise
+
+    def _hash(self, state: List[Any], parts: List[Tuple[int, int, int]]) -> bytes:
+        _, op, pipe_r, pipe_w, _, _ = state
+        for k, offset, count in parts:
+            # Keep the last file open.
+            if state[4] != k:
+                if state[5] is not None:
+                    os.close(state[5])
+                    state[5] = None
+                state[5] = os.open(self.paths[k], os.O_RDONLY)
+                state[4] = k
+                check_file_size(self.paths[k], state[5], self.lengths[k])
+
+            if self.read_stats is not None and self.devices is not None:
+                self.read_stats.begin(self.devices[k])
+            done = 0
+            try:
+                while done < count:
+                    n = os.splice(  # type:ignore
+                        state[5], pipe_w, min(count - done, self.PIPE_SIZE), offset_src=offset + done)
+                    if n == 0:
+                        raise IOError("File '%s' has been truncated while hashing" % self.paths[k])
+                    done += n
+
+                    # MSG_MORE: the hash is finished below.
+                    while n > 0:
+                        n -= os.splice(pipe_r, op.fileno(), n, flags=os.SPLICE_F_MORE)  # type:ignore
+            finally:
+                if self.read_stats is not None and self.devices is not None:
+                    self.read_stats.end(self.devices[k], done)
+            throttle(count)
+
+        op.send(b"")
+        return op.recv(20)
+
+
+class HashEngine(object):
+    """
+    A way of calculating the sha1 hashes of the pieces, which can be selected by its name (see HASH_ENGINES).
 
-    # Make "announce-list" field, if there are multiple trackers.
-    if len(trackers) > 1:
-        metainfo["announce-list"] = [[tracker] for tracker in trackers]
+    If hash_pieces is None, the data is read and hashed with hashlib by _hash_pieces. Otherwise, hash_pieces is called
+    like _hash_pieces_afalg to hash the pieces marked in todo, which is only done if the data is not needed for
+    anything else (md5 sums, checksums, checkpoints or archives). is_available() tells if the engine can be used on
+    this machine.
+    """
 
-    # Set DHT bootstrap nodes.
-    if parsed_nodes:
-        metainfo["nodes"] = parsed_nodes
+    def __init__(self,
+                 name: str,
+                 description: str,
+                 hash_pieces: Optional[Callable[..., None]] = None,
+                 is_available: Callable[[], bool] = lambda: True) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.hash_pieces: Optional[Callable[..., None]] = hash_pieces
+        self.is_available: Callable[[], bool] = is_available
 
-    # Set webseeds (url-list).
-    if webseeds:
-        metainfo["url-list"] = webseeds
 
-    # Set "creation date".
-    # The user may specify a custom creation date. He may also decide not to include the creation date field at all.
-    if date is None or date == -1:
-        # use current time
-        metainfo["creation date"] = int(time.time())
-    elif date >= 0 and not isinstance(date, bool):
-        # use specified timestamp directly
-        metainfo["creation date"] = date
-    elif date < 0 and date != -2:
-        raise_error(
-            "Invalid date: Negative timestamp values are not possible (use None for current date "
-            "or False to disable storing a creation date altogether).",
-            _parser,
-        )
+# The hash engines by name (see register_hash_engine).
+HASH_ENGINES: Dict[str, HashEngine] = {}
 
-    # Add the "created by" field.
-    if not no_created_by:
-        metainfo["created by"] = "py3createtorrent v%s" % __version__
 
-    # Add user's comment or advertise py3createtorrent (unless this behaviour has been disabled by the user).
-    # The user may also decide not to include the comment field at all by specifying an empty comment.
-    if comment is not None:
-        if len(comment) > 0:
-            metainfo["comment"] = comment
-    elif config.advertise:
-        metainfo["comment"] = "created with " + metainfo["created by"]
+def register_hash_engine(engine: HashEngine) -> None:
+    """Make the engine available for create_torrent, the --engine option and the calibration."""
+    HASH_ENGINES[engine.name] = engine
 
-    # Add the name field.
-    # By default this is the name of directory or file the torrent is being created for.
-    if name:
-        name = name.strip()
 
-        regexp = re.compile(r"^[A-Z0-9_\-., ()]+$", re.I)
+def _hash_pieces(
+    paths: List[str],
+    lengths: List[int],
+    piece_length: int,
+    include_md5: bool,
+    threads: int,
+    checkpoint: Optional[Checkpoint] = None,
+    known: Optional[KnownHashes] = None,
+    display_names: Optional[List[str]] = None,
+    open_file: Optional[Callable[[int], Any]] = None,
+    file_checksums: Optional[FileChecksums] = None,
+    read_order: str = "torrent",
+    readers_per_device: int = 1,
+    read_stats: Optional[ReadStats] = None,
+    prefetch_files: int = 16,
+    engine: str = "hashlib",
+    stat_files: bool = True,
+    scanner: Optional[DirectoryScanner] = None,
+) -> Tuple[bytes, List[Optional[str]]]:
+    """
+    Hash the concatenated contents of the given files.
 
-        if not regexp.match(name):
-            raise_error("Invalid name: '%s'. Allowed chars: A_Z, a-z, 0-9, any of {.,_-()} plus spaces." % name,
-                        _parser)
+    Return the concatenated 20-byte-sha1-hashes of the pieces and the files' md5 sums (None unless include_md5).
 
-        metainfo["info"]["name"] = name
+    The files are opened with open_file(index) if given (e.g. for reading the members of an archive). Otherwise they
+    are opened by their paths. If file_checksums is given, the data is passed to it as well (which requires that no
+    hashes are known).
 
-    # ###################################################
-    # BENCODE METAINFO DICTIONARY AND WRITE TORRENT FILE:
-    # - take into consideration the --output option
-    # - properly handle KeyboardInterrupts while writing the file
+    Known pieces and md5 sums are not recomputed. Only the regions of the files that are needed for the remaining
+    pieces and md5 sums are read.
 
-    # Respect the custom output location.
-    if not output:
-        # Use current directory.
-        output_path = metainfo["info"]["name"] + ".torrent"
+    The files are read in the torrent's order by default. With read_order "physical", they are read in the order of
+    their location on disk (see _hash_pieces_physical), which neither supports checkpoints nor open_file.
 
-    else:
-        # Use the directory or filename specified by the user.
-        output = os.path.abspath(output)
+    Unless open_file is given, files on different devices are read in parallel by DeviceReaders, with
+    readers_per_device threads per device (which are also used for a single device if there are several). Otherwise,
+    up to prefetch_files small files are read concurrently by a SmallFilePrefetcher. The reads are recorded in
+    read_stats, if given.
 
-        # The user specified an output directory:
-        if os.path.isdir(output):
-            output_path = os.path.join(output, metainfo["info"]["name"] + ".torrent")
-            if os.path.isfile(output_path):
-                if not force and os.path.exists(output_path):
-                    if _parser is not None:
-                        if "yes" != input("'%s' does already exist. Overwrite? yes/no: " % output_path):
-                            raise_error("Aborted.", _parser)
-                    else:
-                        raise_error("The specified path exists already, and force flag is not set.")
+    The pieces are hashed with the given engine (see HASH_ENGINES), e.g. "afalg" for hashing them in the kernel (see
+    _hash_pieces_afalg), if possible, i.e. if neither md5 sums, checksums, checkpoints nor open_file are needed and the
+    engine is available. Otherwise hashlib is used.
 
-        # The user specified a filename:
+    Unless stat_files is False (e.g. for the files of a file list), the files are stat()-ed before reading them, in
+    order to find their devices and sparse files (see get_holes). The size of each file is checked when it is opened
+    (see open_data_file).
+
+    If a scanner is given, the files that it finds are appended to paths and lengths (and their relative paths to
+    display_names) while hashing. This requires the torrent's read order and that neither checkpoints, known hashes,
+    open_file nor file_checksums are given.
+    """
+    assert scanner is None or (checkpoint is None and known is None and open_file is None and file_checksums is None
+                               and read_order == "torrent")
+    total_length = sum(lengths)
+    piece_count = int(math.ceil(total_length / piece_length))
+
+    # Concatenated 20byte sha1-hashes of all pieces. Preallocating the full space avoids the need for synchronizing
+    # the hashing threads that write into the pieces bytearray.
+    pieces = bytearray(piece_count * 20)
+
+    # Pieces that still need to be hashed.
+    todo = bytearray(b"\x01") * piece_count
+
+    offsets = []
+    offset = 0
+    for length in lengths:
+        offsets.append(offset)
+        offset += length
+
+    md5sums: List[Optional[str]] = [None] * len(paths)
+    if include_md5:
+        for k, length in enumerate(lengths):
+            if length == 0:
+                md5sums[k] = hashlib.md5().hexdigest()
+
+    if known is not None:
+        for start, end in known.runs:
+            pieces[start * 20:end * 20] = known.pieces[start * 20:end * 20]
+            todo[start:end] = bytes(end - start)
+
+        if include_md5:
+            for k, md5sum in known.md5sums.items():
+                md5sums[k] = md5sum
+
+            # Files with unknown md5 sums must be read completely.
+            for k, length in enumerate(lengths):
+                if md5sums[k] is None:
+                    start = offsets[k] // piece_length
+                    end = -(-(offsets[k] + length) // piece_length)
+                    todo[start:end] = b"\x01" * (end - start)
+
+        printv("Re-using %d of %d piece hashes." % (piece_count - todo.count(1), piece_count))
+
+    stats = [os.stat(path) for path in paths] if stat_files and open_file is None and scanner is None else None
+
+    # Pieces that lie entirely in holes of sparse files consist of zeros, i.e. their hashes are known without reading
+    # them. The md5 sums and checksums need all of the data, though. Only files that occupy fewer blocks than they need
+    # and that can contain a whole piece are looked at.
+    if not include_md5 and file_checksums is None and stats is not None:
+        full_piece_count = total_length // piece_length
+        zero_hash = b""
+        zero_pieces = 0
+        for k, path in enumerate(paths):
+            blocks = getattr(stats[k], "st_blocks", None)
+            if lengths[k] < piece_length or blocks is None or blocks * 512 >= lengths[k]:
+                continue
+            for start, end in get_holes(path, lengths[k]):
+                first = -(-(offsets[k] + start) // piece_length)
+                end_piece = piece_count if offsets[k] + end >= total_length else (offsets[k] + end) // piece_length
+                if end_piece <= first:
+                    continue
+
+                full_end = min(end_piece, full_piece_count)
+                if full_end > first:
+                    zero_hash = zero_hash or sha1(bytes(piece_length))
+                    pieces[first * 20:full_end * 20] = zero_hash * (full_end - first)
+                if end_piece > full_piece_count:
+                    # The last piece is shorter.
+                    pieces[full_piece_count * 20:] = sha1(bytes(total_length - full_piece_count * piece_length))
+                todo[first:end_piece] = bytes(end_piece - first)
+                zero_pieces += end_piece - first
+        if zero_pieces:
+            printv("Found %d pieces in holes of sparse files." % zero_pieces)
+
+    if read_order == "physical":
+        assert checkpoint is None and open_file is None
+        _hash_pieces_physical(paths,
+                              lengths,
+                              offsets,
+                              piece_length,
+                              pieces,
+                              todo,
+                              md5sums,
+                              include_md5,
+                              threads,
+                              display_names,
+                              file_checksums,
+                              read_stats=read_stats)
+        return bytes(pieces), md5sums
+
+    hash_engine = HASH_ENGINES[engine]
+    if hash_engine.hash_pieces is not None:
+        if include_md5 or file_checksums is not None:
+            printv("Using hashlib instead of %s, as the data is needed for the md5 sums or checksums." % engine)
+        elif checkpoint is not None or open_file is not None or scanner is not None:
+            printv("Using hashlib instead of %s, which does not support checkpoints, archives and hashing while "
+                   "scanning." % engine)
+        elif not hash_engine.is_available():
+            printv("Using hashlib instead of %s, which is not available." % engine)
         else:
-            # Is there already a file with this path? -> overwrite?!
-            if os.path.isfile(output):
-                if not force and os.path.exists(output):
-                    if _parser is not None:
-                        if "yes" != input("'%s' does already exist. Overwrite? yes/no: " % output):
-                            raise_error("Aborted.", _parser)
-                    else:
-                        raise_error("The specified file exists already, and force flag is not set.")
+            hash_engine.hash_pieces(paths, lengths, offsets, piece_length, pieces, todo, threads, read_stats=read_stats)
+            return bytes(pieces), md5sums
+
+    # Files on different devices are read in parallel, ahead of the hashing. Otherwise, small files are prefetched.
+    readers: Any = None
+    devices = [st.st_dev for st in stats] if stats is not None else []
+    device_count = len(set(device for device, length in zip(devices, lengths) if length > 0))
+    use_device_readers = device_count > 1 or (bool(devices) and readers_per_device > 1)
+    use_prefetcher = (open_file is None and prefetch_files > 0
+                      and (scanner is not None
+                           or sum(1 for length in lengths if 0 < length <= SmallFilePrefetcher.MAX_FILE_SIZE) > 1))
+    if use_device_readers or use_prefetcher:
+        # The contiguous ranges of the files that are read below, in the same order.
+        segments = []
+        run_start = todo.find(1)
+        while run_start != -1:
+            run_end = todo.find(0, run_start)
+            if run_end == -1:
+                run_end = piece_count
+            pos = run_start * piece_length
+            end = min(run_end * piece_length, total_length)
+            k = bisect.bisect_right(offsets, pos) - 1
+            while pos < end:
+                while offsets[k] + lengths[k] <= pos:
+                    k += 1
+                segment_end = min(offsets[k] + lengths[k], end)
+                segments.append((k, pos - offsets[k], segment_end - offsets[k]))
+                pos = segment_end
+            run_start = todo.find(1, run_end)
+
+        if use_device_readers:
+            printv("Reading from %d device/s with %d reader/s each." % (device_count, readers_per_device))
+            readers = DeviceReaders(paths,
+                                    offsets,
+                                    lengths,
+                                    devices,
+                                    segments,
+                                    piece_length,
+                                    readers_per_device,
+                                    read_stats=read_stats)
+        else:
+            readers = SmallFilePrefetcher(paths,
+                                          lengths,
+                                          segments,
+                                          prefetch_files,
+                                          devices=devices if devices or scanner is not None else None,
+                                          read_stats=read_stats)
+        open_file = readers.open
+
+    def take_files(block: bool) -> None:
+        # Append the files that the scanner has found (see DirectoryScanner.get) and make room for their pieces.
+        nonlocal total_length
+        assert scanner is not None
+        for (file, length, _), device in scanner.get(block):
+            offsets.append(total_length)
+            total_length += length
+            md5sums.append(hashlib.md5().hexdigest() if include_md5 and length == 0 else None)
+            if display_names is not None:
+                display_names.append(file)
+            if readers is not None:
+                readers.add_file(os.path.join(scanner.directory, file), length, device)
+            else:
+                paths.append(os.path.join(scanner.directory, file))
+                lengths.append(length)
+                devices.append(device)
+
+        count = -(-total_length // piece_length) - len(todo)
+        with PIECES_LOCK:
+            pieces.extend(bytes(count * 20))
+        todo.extend(b"\x01" * count)
+
+    def finish_md5(k: int, md5: Any) -> None:
+        md5sums[k] = md5.hexdigest()
+
+    def save_checkpoint() -> None:
+        assert checkpoint is not None
+        workers.wait()
+        md5_stage.wait()
+
+        # Save the md5 sums of the first files (as far as they are known).
+        done_md5sums = []
+        for md5sum in md5sums:
+            if md5sum is None:
+                break
+            done_md5sums.append(md5sum)
+
+        checkpoint.save(i, pieces, done_md5sums)
+
+    # The md5 sums are calculated in a separate stage, concurrently with reading and sha1 hashing.
+    MAX_WORKERS = min(threads, multiprocessing.cpu_count())
+    with HashWorkers(pieces, piece_length, MAX_WORKERS) as workers, SerialStage() as md5_stage:
+        i = 0
+        try:
+            if scanner is not None:
+                while not scanner.done and total_length == 0:
+                    take_files(block=True)
+
+            # Process runs of consecutive pieces that need to be hashed.
+            run_start = todo.find(1)
+            while run_start != -1:
+                run_end = todo.find(0, run_start)
+                if run_end == -1:
+                    run_end = len(todo)
+
+                i = run_start
+                pos = run_start * piece_length
+                end = min(run_end * piece_length, total_length)
+
+                # Data of the current piece, if it spans multiple files.
+                data = bytearray()
+
+                k = bisect.bisect_right(offsets, pos) - 1
+                fh = None
+                direct = True
+                md5 = None
+                try:
+                    while pos < end:
+                        # Find the file containing pos (skipping empty files).
+                        while offsets[k] + lengths[k] <= pos:
+                            k += 1
+                            if fh is not None:
+                                fh.close()
+                                fh = None
+
+                        file_pos = pos - offsets[k]
+                        if fh is None:
+                            if scanner is not None:
+                                # Keep the prefetcher busy with the files that have been found in the meantime.
+                                take_files(block=False)
+                                run_end, end = len(todo), total_length
+                            if display_names is not None:
+                                printv("Processing file '%s'... " % clean_str_for_console(display_names[k]))
+                            fh = open_file(k) if open_file is not None else open_data_file(paths[k], lengths[k])
+                            if file_pos > 0:
+                                fh.seek(file_pos)
+                            elif include_md5 and md5sums[k] is None:
+                                md5 = hashlib.md5()
+
+                            # The readers record and throttle their reads themselves.
+                            direct = not isinstance(fh, (DeviceReaders.Segment, SmallFilePrefetcher.Segment))
+
+                        count = min(piece_length - len(data), lengths[k] - file_pos, end - pos)
+                        if direct and read_stats is not None and devices:
+                            read_stats.begin(devices[k])
+                            filedata = fh.read(count)
+                            read_stats.end(devices[k], len(filedata))
+                        else:
+                            filedata = fh.read(count)
+                        if direct:
+                            throttle(len(filedata))
+                        if len(filedata) != count:
+                            raise IOError("File '%s' has been truncated while hashing" % paths[k])
+
+                        if md5:
+                            md5_stage.submit(md5.update, filedata)
+                            if file_pos + count == lengths[k]:
+                                md5_stage.submit(finish_md5, k, md5)
+                                md5 = None
+
+                        if file_checksums is not None:
+                            file_checksums.update(k, filedata)
+                            if file_pos + count == lengths[k]:
+                                file_checksums.finish(k)
+
+                        pos += count
+                        if scanner is not None and pos == total_length:
+                            # This is the end of the data only if the scan is done.
+                            while not scanner.done and pos == total_length:
+                                take_files(block=True)
+                            run_end, end = len(todo), total_length
+
+                        if not data and count == piece_length:
+                            workers.submit(i, filedata)
+                            i += 1
+                        else:
+                            data += filedata
+                            if len(data) == piece_length or pos == total_length:
+                                workers.submit(i, bytes(data))
+                                data = bytearray()
+                                i += 1
+
+                        if checkpoint is not None and checkpoint.is_due():
+                            save_checkpoint()
+                finally:
+                    if fh is not None:
+                        fh.close()
+
+                run_start = todo.find(1, run_end)
+
+            workers.wait()
+            md5_stage.wait()
+        except KeyboardInterrupt:
+            if checkpoint is not None:
+                save_checkpoint()
+            raise
+        finally:
+            if readers is not None:
+                readers.close()
+
+    return bytes(pieces), md5sums
+
+
+def _hash_pieces_physical(
+    paths: List[str],
+    lengths: List[int],
+    offsets: List[int],
+    piece_length: int,
+    pieces: bytearray,
+    todo: bytearray,
+    md5sums: List[Optional[str]],
+    include_md5: bool,
+    threads: int,
+    display_names: Optional[List[str]] = None,
+    file_checksums: Optional[FileChecksums] = None,
+    max_buffered: int = 64 * MIB,
+    read_stats: Optional[ReadStats] = None,
+) -> None:
+    """
+    Hash the pieces marked in todo (and the md5 sums that are None) like _hash_pieces, but read the files in the order
+    of their location on disk instead of the torrent's order. This avoids seeks on hard disks.
+
+    The files are ordered by the physical offsets of their first extents (see get_physical_offset) or, if these are not
+    available for all files, by their inode numbers. Each file is still read front to back.
+
+    Pieces that span several files are kept in a reorder buffer until all of their parts have been read. If the buffer
+    grows beyond max_buffered bytes, the missing parts of the oldest pieces are read directly. The reads are recorded
+    in read_stats, if given.
+    """
+    total_length = sum(lengths)
+
+    # Determine the read order. Empty files are not read at all.
+    non_empty = [k for k, length in enumerate(lengths) if length > 0]
+    stats = {k: os.stat(paths[k]) for k in non_empty}
+    physical_offsets = {k: get_physical_offset(paths[k]) for k in non_empty}
+    if all(offset is not None for offset in physical_offsets.values()):
+        order = sorted(non_empty, key=lambda k: (stats[k].st_dev, physical_offsets[k], k))
+    else:
+        order = sorted(non_empty, key=lambda k: (stats[k].st_dev, stats[k].st_ino, k))
+
+    # The parts of the pieces that span several files, as lists of (offset in piece, data).
+    pending: Dict[int, List[Tuple[int, bytes]]] = {}
+    buffered = 0
+
+    def get_piece_size(i: int) -> int:
+        return min(piece_length, total_length - i * piece_length)
+
+    def finish_md5(k: int, md5: Any) -> None:
+        md5sums[k] = md5.hexdigest()
+
+    def read_range(pos: int, count: int) -> bytes:
+        """Read count bytes of the concatenated files, starting at pos."""
+        data = bytearray()
+        k = bisect.bisect_right(offsets, pos) - 1
+        while count > 0:
+            while offsets[k] + lengths[k] <= pos:
+                k += 1
+            with open_data_file(paths[k], lengths[k]) as fh:
+                fh.seek(pos - offsets[k])
+                filedata = fh.read(min(count, offsets[k] + lengths[k] - pos))
+                throttle(len(filedata))
+            if not filedata:
+                raise IOError("File '%s' has been truncated while hashing" % paths[k])
+            data += filedata
+            pos += len(filedata)
+            count -= len(filedata)
+        return bytes(data)
+
+    MAX_WORKERS = min(threads, multiprocessing.cpu_count())
+    with HashWorkers(pieces, piece_length, MAX_WORKERS) as workers, SerialStage() as md5_stage:
+
+        def submit(i: int, piece_data: bytes) -> None:
+            workers.submit(i, piece_data)
+            todo[i] = 0
+
+        def complete(i: int) -> None:
+            """Hash a pending piece, reading its missing parts."""
+            nonlocal buffered
+            parts = sorted(pending.pop(i))
+            buffered -= sum(len(part) for _, part in parts)
+            piece_data = bytearray()
+            for offset, part in parts + [(get_piece_size(i), b"")]:
+                if offset > len(piece_data):
+                    piece_data += read_range(i * piece_length + len(piece_data), offset - len(piece_data))
+                piece_data += part
+            submit(i, bytes(piece_data))
+
+        for k in order:
+            md5 = hashlib.md5() if include_md5 and md5sums[k] is None else None
+            first = offsets[k] // piece_length
+            last = -(-(offsets[k] + lengths[k]) // piece_length)
+            read_all = md5 is not None or file_checksums is not None
+            if todo.find(1, first, last) == -1 and not read_all:
+                continue
+
+            if display_names is not None:
+                printv("Processing file '%s'... " % clean_str_for_console(display_names[k]))
+            with open_data_file(paths[k], lengths[k]) as fh:
+                file_pos = -1
+                for i in range(first, last):
+                    if not todo[i] and not read_all:
+                        continue
+
+                    # The part of the piece that lies in this file.
+                    start = max(i * piece_length, offsets[k])
+                    end = min(i * piece_length + get_piece_size(i), offsets[k] + lengths[k])
+                    if file_pos != start - offsets[k]:
+                        file_pos = start - offsets[k]
+                        fh.seek(file_pos)
+                    if read_stats is not None:
+                        read_stats.begin(stats[k].st_dev)
+                    filedata = fh.read(end - start)
+                    if read_stats is not None:
+                        read_stats.end(stats[k].st_dev, len(filedata))
+                    throttle(len(filedata))
+                    if len(filedata) != end - start:
+                        raise IOError("File '%s' has been truncated while hashing" % paths[k])
+                    file_pos += len(filedata)
+
+                    if md5:
+                        md5_stage.submit(md5.update, filedata)
+                    if file_checksums is not None:
+                        file_checksums.update(k, filedata)
+
+                    # The piece may have been completed already (see below).
+                    if not todo[i]:
+                        continue
+                    if end - start == get_piece_size(i):
+                        submit(i, filedata)
+                        continue
+
+                    pending.setdefault(i, []).append((start - i * piece_length, filedata))
+                    buffered += len(filedata)
+                    if sum(len(part) for _, part in pending[i]) == get_piece_size(i):
+                        complete(i)
+
+                    # Limit the size of the reorder buffer.
+                    while buffered > max_buffered:
+                        complete(next(iter(pending)))
+
+            if md5:
+                md5_stage.submit(finish_md5, k, md5)
+            if file_checksums is not None:
+                file_checksums.finish(k)
+
+        workers.wait()
+        md5_stage.wait()
+
+    assert not pending and todo.find(1) == -1
 
-            output_path = output
 
-    # Actually write the torrent file now.
+def _hash_pieces_afalg(
+    paths: List[str],
+    lengths: List[int],
+    offsets: List[int],
+    piece_length: int,
+    pieces: bytearray,
+    todo: bytearray,
+    threads: int,
+    read_stats: Optional[ReadStats] = None,
+) -> None:
+    """
+    Hash the pieces marked in todo like _hash_pieces, but in the kernel with an AfAlgHasher, without reading the data
+    into Python. Each thread hashes whole pieces (including the ones that span several files).
+    """
+    total_length = sum(lengths)
+    devices = [os.stat(path).st_dev for path in paths] if read_stats is not None else None
+
+    def get_parts(i: int) -> List[Tuple[int, int, int]]:
+        # The ranges of the files that make up the piece.
+        parts = []
+        pos = i * piece_length
+        end = min(pos + piece_length, total_length)
+        k = bisect.bisect_right(offsets, pos) - 1
+        while pos < end:
+            while offsets[k] + lengths[k] <= pos:
+                k += 1
+            count = min(end, offsets[k] + lengths[k]) - pos
+            parts.append((k, pos - offsets[k], count))
+            pos += count
+        return parts
+
+    MAX_WORKERS = min(threads, multiprocessing.cpu_count())
+    with AfAlgHasher(paths, lengths, devices, read_stats) as hasher, \
+            HashWorkers(pieces, piece_length, MAX_WORKERS, hash_piece=hasher.hash) as workers:
+        i = todo.find(1)
+        while i != -1:
+            workers.submit(i, get_parts(i))
+            i = todo.find(1, i + 1)
+        workers.wait()
+
+
+# Size of the batches of consecutive pieces that the threads of _hash_pieces_parallel take at a time.
+PARALLEL_BATCH_SIZE = 4 * MIB
+
+
+def _hash_pieces_parallel(
+    paths: List[str],
+    lengths: List[int],
+    offsets: List[int],
+    piece_length: int,
+    pieces: bytearray,
+    todo: bytearray,
+    threads: int,
+    read_stats: Optional[ReadStats] = None,
+) -> None:
+    """
+    Hash the pieces marked in todo like _hash_pieces, but each thread reads the pieces that it hashes itself, instead
+    of a single thread reading the data for all of them. This scales with the number of threads on free-threaded builds
+    of CPython (see is_free_threaded), where the reading does not need the GIL either.
+
+    The threads take batches of consecutive pieces of about PARALLEL_BATCH_SIZE bytes, so that the reads are mostly
+    sequential.
+    """
+    total_length = sum(lengths)
+    devices = [os.stat(path).st_dev for path in paths] if read_stats is not None else None
+    batch_pieces = max(1, PARALLEL_BATCH_SIZE // piece_length)
+
+    # Each thread keeps its piece buffer and the last file it has read open.
+    local = threading.local()
+    handles: List[Any] = []
+    handles_lock = threading.Lock()
+
+    def read_into(view: memoryview, k: int, file_pos: int) -> None:
+        if local.k != k:
+            if local.fh is not None:
+                with handles_lock:
+                    handles.remove(local.fh)
+                local.fh.close()
+                local.fh = None
+            local.fh = open_data_file(paths[k], lengths[k])
+            local.k = k
+            with handles_lock:
+                handles.append(local.fh)
+
+        if read_stats is not None and devices is not None:
+            read_stats.begin(devices[k])
+        count = 0
+        try:
+            local.fh.seek(file_pos)
+            count = local.fh.readinto(view)
+        finally:
+            if read_stats is not None and devices is not None:
+                read_stats.end(devices[k], count)
+        throttle(count)
+        if count != len(view):
+            raise IOError("File '%s' has been truncated while hashing" % paths[k])
+
+    def hash_batch(first: int, end: int) -> None:
+        if not hasattr(local, "buffer"):
+            local.buffer = memoryview(bytearray(piece_length))
+            local.k = None
+            local.fh = None
+
+        for i in range(first, end):
+            pos = i * piece_length
+            piece_end = min(pos + piece_length, total_length)
+            size = piece_end - pos
+            k = bisect.bisect_right(offsets, pos) - 1
+            while pos < piece_end:
+                while offsets[k] + lengths[k] <= pos:
+                    k += 1
+                count = min(piece_end, offsets[k] + lengths[k]) - pos
+                filled = pos - i * piece_length
+                read_into(local.buffer[filled:filled + count], k, pos - offsets[k])
+                pos += count
+
+            store_piece_hashes(pieces, i, hashlib.sha1(local.buffer[:size]).digest())
+
+    MAX_FUTURES = min(threads, multiprocessing.cpu_count())
     try:
-        with open(output_path, "wb") as fh:
-            fh.write(bencode(metainfo))
-    except IOError as exc:
-        print("IOError: " + str(exc), file=sys.stderr)
-        print(
-            "Could not write the torrent file. Check torrent name and your privileges.",
-            file=sys.stderr,
-        )
-        print("Absolute output path: '%s'" % os.path.abspath(output_path), file=sys.stderr)
-        sys.exit(1)
-    except KeyboardInterrupt:
-        # Properly handle KeyboardInterrupts.
-        # todo: open()'s context manager may already do this on his own?
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_FUTURES) as executor:
+            futures: Set[concurrent.futures.Future[None]] = set()
+            first = todo.find(1)
+            while first != -1:
+                end = todo.find(0, first, first + batch_pieces)
+                end = min(first + batch_pieces, len(todo)) if end == -1 else end
+                futures.add(executor.submit(hash_batch, first, end))
+                if len(futures) >= 2 * MAX_FUTURES:
+                    done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                first = todo.find(1, end)
+
+            for future in futures:
+                future.result()
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+register_hash_engine(HashEngine("hashlib", "hashlib in a thread pool"))
+register_hash_engine(
+    HashEngine("afalg", "Linux kernel crypto API (AF_ALG)", _hash_pieces_afalg, AfAlgHasher.is_available))
+register_hash_engine(HashEngine("parallel", "hashlib in threads that read the pieces themselves",
+                                _hash_pieces_parallel))
+
+
+def _hash_pieces_multi(
+    paths: List[str],
+    lengths: List[int],
+    piece_lengths: List[int],
+    include_md5: bool,
+    threads: int,
+    display_names: Optional[List[str]] = None,
+    open_file: Optional[Callable[[int], Any]] = None,
+    file_checksums: Optional[FileChecksums] = None,
+) -> Tuple[List[bytes], List[Optional[str]]]:
+    """
+    Hash the concatenated contents of the given files for several piece lengths at once.
+
+    Return the concatenated 20-byte-sha1-hashes of the pieces for each piece length and the files' md5 sums (None
+    unless include_md5). The result is the same as from calling _hash_pieces for each piece length, but the data is
+    read only once: every block read is handed to the hashers of all piece lengths (and to file_checksums, if given).
+    """
+    total_length = sum(lengths)
+    all_pieces = [bytearray(int(math.ceil(total_length / piece_length)) * 20) for piece_length in piece_lengths]
+
+    # For each piece length: the index of the current piece and the data read for it so far (views of the blocks).
+    indexes = [0] * len(piece_lengths)
+    fragments: List[List[memoryview]] = [[] for _ in piece_lengths]
+    fragment_lengths = [0] * len(piece_lengths)
+
+    md5sums: List[Optional[str]] = [None] * len(paths)
+    block_size = max(piece_lengths)
+
+    def sha1_fragments(piece_fragments: List[memoryview]) -> bytes:
+        m = hashlib.sha1()
+        for fragment in piece_fragments:
+            m.update(fragment)
+        return m.digest()
+
+    def finish_md5(k: int, md5: Any) -> None:
+        md5sums[k] = md5.hexdigest()
+
+    # The md5 sums are calculated in a separate stage, concurrently with reading and sha1 hashing. Each piece length
+    # gets its share of the hashing threads (they all hash the same amount of data).
+    MAX_WORKERS = max(1, min(threads, multiprocessing.cpu_count()) // len(piece_lengths))
+    with contextlib.ExitStack() as stack:
+        md5_stage = stack.enter_context(SerialStage())
+        all_workers = [
+            stack.enter_context(HashWorkers(pieces, piece_length, MAX_WORKERS, hash_piece=sha1_fragments))
+            for pieces, piece_length in zip(all_pieces, piece_lengths)
+        ]
+
+        def submit(j: int) -> None:
+            all_workers[j].submit(indexes[j], fragments[j])
+            indexes[j] += 1
+            fragments[j] = []
+            fragment_lengths[j] = 0
+
+        for k, length in enumerate(lengths):
+            md5 = hashlib.md5() if include_md5 else None
+            if length > 0:
+                if display_names is not None:
+                    printv("Processing file '%s'... " % clean_str_for_console(display_names[k]))
+                fh = open_file(k) if open_file is not None else open_data_file(paths[k], length)
+                try:
+                    pos = 0
+                    while pos < length:
+                        block = fh.read(min(block_size, length - pos))
+                        throttle(len(block))
+                        if len(block) != min(block_size, length - pos):
+                            raise IOError("File '%s' has been truncated while hashing" % paths[k])
+                        pos += len(block)
+
+                        if md5:
+                            md5_stage.submit(md5.update, block)
+                        if file_checksums is not None:
+                            file_checksums.update(k, block)
+
+                        # Split the block into the pieces of each piece length.
+                        for j, piece_length in enumerate(piece_lengths):
+                            view = memoryview(block)
+                            while view:
+                                count = min(piece_length - fragment_lengths[j], len(view))
+                                fragments[j].append(view[:count])
+                                fragment_lengths[j] += count
+                                view = view[count:]
+                                if fragment_lengths[j] == piece_length:
+                                    submit(j)
+                finally:
+                    fh.close()
 
-    # #########################
-    # PREPARE AND PRINT SUMMARY
-    # - but check quiet option
+            if md5:
+                md5_stage.submit(finish_md5, k, md5)
+            if file_checksums is not None:
+                file_checksums.finish(k)
 
-    # If the quiet option has been set, we're already finished here, because we don't print a summary in this case.
-    if quiet:
-        if _parser is not None:
-            sys.exit(0)
-    else:
-        # Print summary!
-        print("Successfully created torrent:")
-
-        # Create the list of backup trackers.
-        backup_trackers = ""
-        if "announce-list" in metainfo:
-            _backup_trackers = metainfo["announce-list"][1:]
-            _backup_trackers.sort(key=lambda x: x[0].lower())
-
-            for tracker in _backup_trackers:
-                backup_trackers += "    " + tracker[0] + "\n"
-            backup_trackers = backup_trackers.rstrip()
-        else:
-            backup_trackers = "    (none)"
+        # The last pieces may be shorter.
+        for j in range(len(piece_lengths)):
+            if fragment_lengths[j] > 0:
+                submit(j)
 
-        # Calculate piece count.
-        piece_count = math.ceil(torrent_size / metainfo["info"]["piece length"])
+        for workers in all_workers:
+            workers.wait()
+        md5_stage.wait()
 
-        # Make torrent size human readable.
-        if torrent_size > 10 * MIB:
-            size = "%.2f MiB" % (torrent_size / MIB)
-        else:
-            size = "%d KiB" % (torrent_size / KIB)
+    return [bytes(pieces) for pieces in all_pieces], md5sums
+
+
+def create_single_file_info(
+    file: str,
+    piece_length: int,
+    include_md5: bool = True,
+    threads: int = 4,
+    checkpoint: Optional[Checkpoint] = None,
+    known: Optional[KnownHashes] = None,
+    file_checksums: Optional[FileChecksums] = None,
+    read_stats: Optional[ReadStats] = None,
+    engine: str = "hashlib",
+) -> Dict[str, Any]:
+    """
+    Return dictionary with the following keys:
+      - pieces: concatenated 20-byte-sha1-hashes
+      - name:   basename of the file
+      - length: size of the file in bytes
+      - md5sum: md5sum of the file (unless disabled via include_md5)
+
+    If a checkpoint is given, progress is saved to it periodically. Known piece hashes are re-used. The data is also
+    passed to file_checksums, if given, and the reads are recorded in read_stats. The pieces are hashed with the given
+    engine (see _hash_pieces).
+
+    @see:   BitTorrent Metainfo Specification.
+    @note:  md5 hashes in torrents are actually optional
+    """
+    assert os.path.isfile(file), "not a file"
+
+    # Total byte count.
+    length = os.path.getsize(file)
+    assert length > 0, "empty file"
+
+    printv("Hashing file... ", end="")
+
+    pieces, md5sums = _hash_pieces([file], [length],
+                                   piece_length,
+                                   include_md5,
+                                   threads,
+                                   checkpoint,
+                                   known,
+                                   file_checksums=file_checksums,
+                                   read_stats=read_stats,
+                                   engine=engine)
+
+    printv("done")
+
+    info = {"pieces": pieces, "name": os.path.basename(file), "length": length}
+
+    if include_md5:
+        info["md5sum"] = md5sums[0]
+
+    return info
+
+
+def create_multi_file_info(
+    directory: str,
+    files: List[str],
+    piece_length: int,
+    include_md5: bool = True,
+    threads: int = 4,
+    checkpoint: Optional[Checkpoint] = None,
+    known: Optional[KnownHashes] = None,
+    lengths: Optional[List[int]] = None,
+    file_checksums: Optional[FileChecksums] = None,
+    read_order: str = "torrent",
+    readers_per_device: int = 1,
+    read_stats: Optional[ReadStats] = None,
+    prefetch_files: int = 16,
+    engine: str = "hashlib",
+    sources: Optional[List[str]] = None,
+    stat_files: bool = True,
+) -> Dict[str, Any]:
+    """
+    Return dictionary with the following keys:
+      - pieces: concatenated 20-byte-sha1-hashes
+      - name:   basename of the directory (default name of all torrents)
+      - files:  a list of dictionaries with the following keys:
+        - length: size of the file in bytes
+        - md5sum: md5 sum of the file (unless disabled via include_md5)
+        - path:   path to the file, relative to the initial directory,
+                  given as list.
+                  Examples:
+                  -> ["dir1", "dir2", "file.ext"]
+                  -> ["just_in_the_initial_directory_itself.ext"]
+
+    The files' lengths are determined unless they are given. If a checkpoint is given, progress is saved to it
+    periodically. Known piece hashes are re-used. The data is also passed to file_checksums, if given. The files are
+    read in the given read_order, with readers_per_device threads per device or prefetch_files small files at a time,
+    and the reads are recorded in read_stats. The pieces are hashed with the given engine (see _hash_pieces).
+
+    The files are read from their sources (local paths), if given, instead of from the directory (see load_layout).
+    If stat_files is False, the files are not looked at before they are read (see _hash_pieces).
+
+    @see:   BitTorrent Metainfo Specification.
+    @note:  md5 hashes in torrents are actually optional
+    """
+    assert sources is not None or os.path.isdir(directory), "not a directory"
+
+    paths = sources if sources is not None else [os.path.join(directory, file) for file in files]
+    if lengths is None:
+        lengths = [os.path.getsize(path) for path in paths]
+
+    pieces, md5sums = _hash_pieces(paths,
+                                   lengths,
+                                   piece_length,
+                                   include_md5,
+                                   threads,
+                                   checkpoint,
+                                   known,
+                                   display_names=files,
+                                   file_checksums=file_checksums,
+                                   read_order=read_order,
+                                   readers_per_device=readers_per_device,
+                                   read_stats=read_stats,
+                                   prefetch_files=prefetch_files,
+                                   engine=engine,
+                                   stat_files=stat_files)
+
+    info_files = []
+    for file, length, md5sum in zip(files, lengths, md5sums):
+        # Build the file's dictionary.
+        fdict = {"length": length, "path": split_path(file)}
+
+        if include_md5:
+            fdict["md5sum"] = md5sum
+
+        info_files.append(fdict)
+
+    # Build the final dictionary.
+    info = {
+        "pieces": pieces,
+        "name": os.path.basename(os.path.abspath(directory)),
+        "files": info_files,
+    }
+
+    return info
+
+
+def create_streamed_multi_file_info(
+    directory: str,
+    piece_length: int,
+    include_md5: bool = True,
+    threads: int = 4,
+    excluded_paths: Optional[Set[str]] = None,
+    excluded_regexps: Optional[Set[Pattern[str]]] = None,
+    read_stats: Optional[ReadStats] = None,
+    prefetch_files: int = 16,
+) -> Tuple[Dict[str, Any], List[List[Any]]]:
+    """
+    Return the same dictionary as create_multi_file_info for the files in the directory (see get_files_in_directory)
+    and their fingerprints (see get_file_fingerprints).
+
+    The directory is scanned by a DirectoryScanner while the files that have been found so far are hashed, i.e.
+    neither the list of files nor the total size needs to be known in advance (which requires a fixed piece length).
+    Up to prefetch_files of the small files that have been found are read concurrently (see SmallFilePrefetcher).
+    """
+    assert os.path.isdir(directory), "not a directory"
+
+    files: List[str] = []
+    with DirectoryScanner(directory, excluded_paths, excluded_regexps) as scanner:
+        pieces, md5sums = _hash_pieces([], [],
+                                       piece_length,
+                                       include_md5,
+                                       threads,
+                                       display_names=files,
+                                       read_stats=read_stats,
+                                       prefetch_files=prefetch_files,
+                                       scanner=scanner)
+
+    info_files = []
+    for (file, length, _), md5sum in zip(scanner.fingerprints, md5sums):
+        fdict = {"length": length, "path": split_path(file)}
+        if include_md5:
+            fdict["md5sum"] = md5sum
+        info_files.append(fdict)
+
+    info = {
+        "pieces": pieces,
+        "name": os.path.basename(os.path.abspath(directory)),
+        "files": info_files,
+    }
+
+    return info, scanner.fingerprints
+
+
+def create_archive_info(
+    reader: ArchiveReader,
+    files: List[str],
+    lengths: List[int],
+    piece_length: int,
+    name: str,
+    include_md5: bool = True,
+    threads: int = 4,
+    file_checksums: Optional[FileChecksums] = None,
+) -> Dict[str, Any]:
+    """
+    Return the same dictionary as create_multi_file_info, but for the files in an archive (see ArchiveReader).
+
+    files and lengths must be the paths and sizes returned by reader.get_files(). The data is also passed to
+    file_checksums, if given.
+    """
+    pieces, md5sums = _hash_pieces(files,
+                                   lengths,
+                                   piece_length,
+                                   include_md5,
+                                   threads,
+                                   display_names=files,
+                                   open_file=reader.open,
+                                   file_checksums=file_checksums)
+
+    info_files = []
+    for file, length, md5sum in zip(files, lengths, md5sums):
+        fdict = {"length": length, "path": split_path(file)}
+
+        if include_md5:
+            fdict["md5sum"] = md5sum
+
+        info_files.append(fdict)
+
+    return {"pieces": pieces, "name": name, "files": info_files}
+
+
+def create_infos_for_piece_lengths(
+    path: str,
+    files: List[str],
+    lengths: List[int],
+    piece_lengths: List[int],
+    name: str,
+    include_md5: bool = True,
+    threads: int = 4,
+    archive_reader: Optional[ArchiveReader] = None,
+    file_checksums: Optional[FileChecksums] = None,
+    sources: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Return the info dictionaries (see create_single_file_info and create_multi_file_info) for each of the given piece
+    lengths, including the piece length. The data is read only once (and also passed to file_checksums, if given).
+
+    path is a file (then files must be its basename), a directory or an archive (if archive_reader is given). files
+    and lengths are the paths (relative to the directory) and sizes of the files. The files are read from their
+    sources (local paths), if given, instead of from the directory.
+    """
+    single_file = archive_reader is None and sources is None and os.path.isfile(path)
+    if single_file:
+        paths = [path]
+    elif archive_reader is not None:
+        paths = files
+    elif sources is not None:
+        paths = sources
+    else:
+        paths = [os.path.join(path, file) for file in files]
+
+    if single_file:
+        printv("Hashing file... ", end="")
+    all_pieces, md5sums = _hash_pieces_multi(paths,
+                                             lengths,
+                                             piece_lengths,
+                                             include_md5,
+                                             threads,
+                                             display_names=None if single_file else files,
+                                             open_file=archive_reader.open if archive_reader is not None else None,
+                                             file_checksums=file_checksums)
+    if single_file:
+        printv("done")
+
+    infos = []
+    for pieces, piece_length in zip(all_pieces, piece_lengths):
+        info: Dict[str, Any] = {"pieces": pieces, "name": name, "piece length": piece_length}
+        if single_file:
+            info["length"] = lengths[0]
+            if include_md5:
+                info["md5sum"] = md5sums[0]
+        else:
+            info_files = []
+            for file, length, md5sum in zip(files, lengths, md5sums):
+                fdict = {"length": length, "path": split_path(file)}
+
+                if include_md5:
+                    fdict["md5sum"] = md5sum
+
+                info_files.append(fdict)
+            info["files"] = info_files
+        infos.append(info)
+
+    return infos
+
+
+def create_stream_info(
+    stream: Any,
+    piece_length: int,
+    name: str,
+    include_md5: bool = True,
+    threads: int = 4,
+    tee: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """
+    Return dictionary with the following keys:
+      - pieces: concatenated 20-byte-sha1-hashes
+      - name:   the given name
+      - length: number of bytes read from the stream
+      - md5sum: md5sum of the data (unless disabled via include_md5)
+
+    The data is read from the given binary stream (e.g. stdin) until EOF and hashed as it streams through. If tee is
+    given (a binary file object), the data is also written to it.
+    """
+    printv("Hashing stream... ", end="")
+
+    # The hashes are stored by piece index, as the hashing threads may finish in any order. The length of the stream
+    # is not known in advance, so room for each piece's hash is added before it is submitted.
+    pieces = bytearray()
+    md5 = hashlib.md5() if include_md5 else None
+    length = 0
+
+    MAX_WORKERS = min(threads, multiprocessing.cpu_count())
+    with HashWorkers(pieces, piece_length, MAX_WORKERS) as workers, SerialStage() as md5_stage:
+        i = 0
+        while True:
+            # Read a full piece (reads from pipes may return less).
+            data = stream.read(piece_length)
+            while data and len(data) < piece_length:
+                more = stream.read(piece_length - len(data))
+                if not more:
+                    break
+                data += more
+            if not data:
+                break
+            throttle(len(data))
+
+            length += len(data)
+            if md5:
+                md5_stage.submit(md5.update, data)
+            if tee is not None:
+                tee.write(data)
+
+            with PIECES_LOCK:
+                pieces.extend(bytes(20))
+            workers.submit(i, data)
+            i += 1
+
+        workers.wait()
+        md5_stage.wait()
+
+    printv("done (%d bytes)" % length)
+
+    info = {"pieces": bytes(pieces), "name": name, "length": length}
+
+    if md5:
+        info["md5sum"] = md5.hexdigest()
+
+    return info
+
+
+class HttpSource(object):
+    """
+    Fetch (byte ranges of) files served over HTTP or HTTPS, using pooled keep-alive connections.
+
+    At most connections_per_host requests are sent to the same host at the same time. Requests that fail because of
+    connection errors, server errors (5xx) or incomplete responses are retried with exponential backoff.
+    """
+
+    class HttpError(IOError):
+        pass
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, connections_per_host: int = 4, retries: int = 3, timeout: float = 60) -> None:
+        self.connections_per_host: int = connections_per_host
+        self.retries: int = retries
+        self.timeout: float = timeout
+
+        # Idle connections and the semaphores limiting the number of requests, by (scheme, host, port).
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._semaphores: Dict[Tuple[str, str, int], threading.Semaphore] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def __enter__(self) -> "HttpSource":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _request_once(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise HttpSource.HttpError("Unsupported URL: '%s'" % url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        with self._lock:
+            semaphore = self._semaphores.setdefault(key, threading.Semaphore(self.connections_per_host))
+
+        with semaphore:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                connection = idle.pop() if idle else None
+            if connection is None:
+                if parts.scheme == "https":
+                    connection = http.client.HTTPSConnection(key[1], key[2], timeout=self.timeout)
+                else:
+                    connection = http.client.HTTPConnection(key[1], key[2], timeout=self.timeout)
+
+            try:
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except BaseException:
+                connection.close()
+                raise
+            throttle(len(body))
+
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle[key].append(connection)
+
+        return response.status, response.headers, body
+
+    def request(self,
+                method: str,
+                url: str,
+                headers: Optional[Dict[str, str]] = None,
+                expected_length: Optional[int] = None) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        """
+        Send a request, following redirects and retrying failed attempts. Return status, headers and body.
+
+        If expected_length is given, a partial response (206) with a different length counts as failed attempt.
+        """
+        attempt = 0
+        redirects = 0
+        while True:
+            try:
+                status, response_headers, body = self._request_once(method, url, headers or {})
+                if status in (301, 302, 303, 307, 308) and response_headers.get("Location"):
+                    redirects += 1
+                    if redirects > self.MAX_REDIRECTS:
+                        raise HttpSource.HttpError("Too many redirects: '%s'" % url)
+                    url = urllib.parse.urljoin(url, response_headers["Location"])
+                    continue
+                if status >= 500:
+                    raise IOError("HTTP status %d" % status)
+                if status == 206 and expected_length is not None and len(body) != expected_length:
+                    raise IOError("incomplete response (%d of %d bytes)" % (len(body), expected_length))
+                return status, response_headers, body
+            except HttpSource.HttpError:
+                raise
+            except (IOError, http.client.HTTPException) as exc:
+                if attempt >= self.retries:
+                    raise HttpSource.HttpError("Request for '%s' failed: %s" % (url, exc))
+                printv("Request for '%s' failed (%s), retrying..." % (url, exc))
+                time.sleep(0.5 * 2**attempt)
+                attempt += 1
+
+    def get_size(self, url: str) -> int:
+        """Return the size of the file at url."""
+        status, headers, _ = self.request("HEAD", url)
+        if status == 200 and headers.get("Content-Length", "").isdigit():
+            return int(headers["Content-Length"])
+
+        # Some servers do not support HEAD requests (properly). Request the first byte instead.
+        status, headers, body = self.request("GET", url, {"Range": "bytes=0-0"})
+        match = re.match(r"^bytes \d+-\d+/(\d+)$", headers.get("Content-Range", ""))
+        if status == 206 and match:
+            return int(match.group(1))
+        if status == 200:
+            return len(body)
+        raise HttpSource.HttpError("Cannot determine the size of '%s' (HTTP status %d)" % (url, status))
+
+    def fetch(self, url: str, offset: int, length: int) -> bytes:
+        """Return length bytes of the file at url, starting at offset."""
+        headers = {"Range": "bytes=%d-%d" % (offset, offset + length - 1)}
+        status, _, body = self.request("GET", url, headers, expected_length=length)
+        if status == 206 and len(body) == length:
+            return body
+        if status == 200 and offset == 0 and len(body) >= length:
+            # The server does not support range requests, but sent the whole file.
+            return body[:length]
+        raise HttpSource.HttpError("Range request for '%s' failed (HTTP status %d)" % (url, status))
+
+
+def load_url_sources(
+    urls: List[str],
+    manifest_path: Optional[str] = None,
+) -> Tuple[List[Tuple[str, List[str], Optional[int]]], str, bool]:
+    """
+    Return the files (URL, path components and size, if known), the name and whether it is a single file torrent.
+
+    The files are given as URLs and/or as manifest, i.e. a JSON file like
+    {"name": "...", "files": [{"url": "...", "path": "dir/file", "size": 123}, ...]} with optional name, path and size.
+    If no paths are specified, the name and the paths are derived from the URLs (relative to their common directory)
+    and the files are ordered like the files of a directory. Otherwise the files are used in the given order.
+    The name is "" if it cannot be derived.
+
+    Raise ValueError if the manifest is invalid.
+    """
+    entries: List[Dict[str, Any]] = [{"url": url} for url in urls]
+    manifest_name = ""
+    if manifest_path is not None:
+        with open(manifest_path, "r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), list):
+            raise ValueError("'%s' is not a valid manifest" % manifest_path)
+        manifest_name = manifest.get("name", "")
+        entries += manifest["files"]
+
+    if not entries:
+        raise ValueError("no URLs given")
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("url"), str):
+            raise ValueError("invalid entry: %r" % (entry, ))
+        if entry.get("size") is not None and (not isinstance(entry["size"], int) or entry["size"] < 0):
+            raise ValueError("invalid size: %r" % (entry, ))
+
+    # Explicit paths.
+    if any("path" in entry for entry in entries):
+        files = []
+        for entry in entries:
+            if not isinstance(entry.get("path"), str):
+                raise ValueError("either all or no files must have a path: %r" % (entry, ))
+            files.append((entry["url"], split_path(entry["path"]), entry.get("size")))
+        return files, manifest_name, False
+
+    # Derive the paths from the URLs.
+    all_components = []
+    for entry in entries:
+        path = urllib.parse.urlsplit(entry["url"]).path
+        components = [urllib.parse.unquote(part) for part in path.split("/") if part]
+        if not components:
+            raise ValueError("cannot derive a file name from '%s'" % entry["url"])
+        all_components.append(components)
+
+    if len(entries) == 1:
+        return [(entries[0]["url"], all_components[0][-1:], entries[0].get("size"))], all_components[0][-1], True
+
+    # The name is the common directory of all files.
+    common = os.path.commonprefix([components[:-1] for components in all_components])
+    name = manifest_name or (common[-1] if common else "")
+    files = [(entry["url"], components[len(common):], entry.get("size"))
+             for entry, components in zip(entries, all_components)]
+    return sort_like_directory([(file[1], file) for file in files], ""), name, False
+
+
+def get_webseed_url(files: List[Tuple[str, List[str], int]], name: str, single_file: bool) -> Optional[str]:
+    """
+    Return the webseed URL (see BEP 19) under which the files are available, or None if there is none.
+
+    For multi file torrents, the URL of each file must be the webseed URL followed by the name and the file's path.
+    """
+    if single_file:
+        return files[0][0]
+
+    base = None
+    for url, components, _ in files:
+        parts = urllib.parse.urlsplit(url)
+        segments = parts.path.split("/")
+        tail = [urllib.parse.unquote(part) for part in segments[-len(components) - 1:]]
+        if parts.query or tail != [name] + components:
+            return None
+        file_base = urllib.parse.urlunsplit(parts._replace(path="/".join(segments[:-len(components) - 1]) + "/"))
+        if base is not None and file_base != base:
+            return None
+        base = file_base
+
+    return base
+
+
+def create_http_info(
+    source: HttpSource,
+    files: List[Tuple[str, List[str], int]],
+    piece_length: int,
+    name: str,
+    single_file: bool,
+    include_md5: bool = True,
+) -> Dict[str, Any]:
+    """
+    Return the same dictionary as create_single_file_info or create_multi_file_info, but for files served over HTTP.
+
+    The files are given as URL, path components and size. The pieces are fetched with concurrent range requests (up
+    to source.connections_per_host per host) and hashed in order.
+    """
+    urls = [url for url, _, _ in files]
+    lengths = [length for _, _, length in files]
+    total_length = sum(lengths)
+    piece_count = int(math.ceil(total_length / piece_length))
+
+    offsets = []
+    offset = 0
+    for length in lengths:
+        offsets.append(offset)
+        offset += length
+
+    def get_segments(i: int) -> List[Tuple[int, int, int]]:
+        """Return the parts of the files (index, offset in file, length) that make up the given piece."""
+        pos = i * piece_length
+        end = min(pos + piece_length, total_length)
+        segments = []
+        k = bisect.bisect_right(offsets, pos) - 1
+        while pos < end:
+            while offsets[k] + lengths[k] <= pos:
+                k += 1
+            count = min(end - pos, offsets[k] + lengths[k] - pos)
+            segments.append((k, pos - offsets[k], count))
+            pos += count
+        return segments
+
+    def fetch_piece(i: int) -> Tuple[bytes, bytes]:
+        data = b"".join(source.fetch(urls[k], file_offset, count) for k, file_offset, count in get_segments(i))
+        return sha1(data), data if include_md5 else b""
+
+    md5s = [hashlib.md5() for _ in files]
+    md5sums: List[Optional[str]] = [None] * len(files)
+    if include_md5:
+        for k, length in enumerate(lengths):
+            if length == 0:
+                md5sums[k] = md5s[k].hexdigest()
+
+    # Keep enough requests in flight to use all connections to all hosts.
+    hosts = set(urllib.parse.urlsplit(url).netloc for url in urls)
+    workers = source.connections_per_host * len(hosts)
+
+    pieces = bytearray()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures: Dict[int, concurrent.futures.Future[Tuple[bytes, bytes]]] = {}
+        try:
+            for i in range(piece_count):
+                for j in range(i + len(futures), min(i + 2 * workers, piece_count)):
+                    futures[j] = executor.submit(fetch_piece, j)
+
+                piece_hash, data = futures.pop(i).result()
+                pieces += piece_hash
+
+                if include_md5:
+                    pos = 0
+                    for k, file_offset, count in get_segments(i):
+                        md5s[k].update(data[pos:pos + count])
+                        pos += count
+                        if file_offset + count == lengths[k]:
+                            md5sums[k] = md5s[k].hexdigest()
+
+                if i % 100 == 99:
+                    printv("Fetched %d of %d pieces." % (i + 1, piece_count))
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    if single_file:
+        info = {"pieces": bytes(pieces), "name": name, "length": lengths[0]}
+        if include_md5:
+            info["md5sum"] = md5sums[0]
+        return info
+
+    info_files = []
+    for (_, components, length), md5sum in zip(files, md5sums):
+        fdict = {"length": length, "path": components}
+
+        if include_md5:
+            fdict["md5sum"] = md5sum
+
+        info_files.append(fdict)
+
+    return {"pieces": bytes(pieces), "name": name, "files": info_files}
+
+
+def get_reusable_hashes(
+    torrent: str,
+    fingerprints: List[List[Any]],
+    piece_length: int,
+    name: str,
+    single_file: bool,
+    trust: str = "mtime",
+) -> Optional[KnownHashes]:
+    """
+    Return the piece hashes (and md5 sums) of an existing torrent that are valid for the given files, too.
+
+    The files are given as fingerprints (see get_file_fingerprints). name and single_file describe the new torrent.
+    A file is considered unchanged if its path and size did not change and (if trust is "mtime") it has not been
+    modified after the torrent was created.
+
+    Return None if the torrent's piece length, name or type (single file or multiple files) differs.
+    """
+    if trust not in ("mtime", "size"):
+        raise ValueError("trust must be 'mtime' or 'size'")
+
+    metainfo = read_torrent_file(torrent)
+    info = metainfo["info"]
+
+    if info["piece length"] != piece_length:
+        print(
+            "Warning: cannot re-use piece hashes from '%s' because its piece length differs (%d KiB). "
+            "Use -p to select the same piece length." % (torrent, info["piece length"] / KIB),
+            file=sys.stderr,
+        )
+        return None
+
+    # The paths of the files are relative to the torrent's name, so a torrent with another name (or a single file
+    # torrent for a folder and vice versa) describes different data.
+    if ("files" not in info) != single_file or info["name"] != name:
+        print(
+            "Warning: cannot re-use piece hashes from '%s' because it was created for other data ('%s'). "
+            "Use --name to select the same name." % (torrent, info["name"]),
+            file=sys.stderr,
+        )
+        return None
+
+    # Build the old torrent's list of files.
+    if "files" in info:
+        old_files = []
+        for f in info["files"]:
+            if any(not isinstance(part, str) for part in f["path"]):
+                raise ValueError("'%s' contains paths that are not valid UTF-8" % torrent)
+            old_files.append([os.path.join(*f["path"]), f["length"], None])
+        old_md5sums = [f.get("md5sum") for f in info["files"]]
+    else:
+        # Single file torrent: the name is the file's path, which may differ from the file name (--name).
+        old_files = [[fingerprints[0][0], info["length"], None]]
+        old_md5sums = [info.get("md5sum")]
+
+    # Files modified after the creation of the torrent cannot be trusted.
+    if "creation date" in metainfo:
+        created_ns = metainfo["creation date"] * 10**9
+    else:
+        created_ns = os.stat(torrent).st_mtime_ns
+
+    def is_unchanged(old: List[Any], new: List[Any]) -> bool:
+        return trust == "size" or new[2] <= created_ns
+
+    return KnownHashes.find(old_files, info["pieces"], fingerprints, piece_length, old_md5sums, is_unchanged)
+
+
+def verify_known_hashes(known: KnownHashes, paths: List[str], lengths: List[int], piece_length: int,
+                        count: int) -> bool:
+    """
+    Spot-check the known piece hashes: rehash count randomly chosen known pieces and compare.
+
+    Return False if any of the pieces does not match.
+    """
+    indices = [i for start, end in known.runs for i in range(start, end)]
+    total_length = sum(lengths)
+
+    offsets = []
+    offset = 0
+    for length in lengths:
+        offsets.append(offset)
+        offset += length
+
+    for i in random.sample(indices, min(count, len(indices))):
+        # Read the piece, which may span multiple files.
+        pos = i * piece_length
+        end = min(pos + piece_length, total_length)
+        data = bytearray()
+        k = bisect.bisect_right(offsets, pos) - 1
+        while pos < end:
+            while offsets[k] + lengths[k] <= pos:
+                k += 1
+            n = min(end - pos, offsets[k] + lengths[k] - pos)
+            with open_data_file(paths[k], lengths[k]) as fh:
+                fh.seek(pos - offsets[k])
+                data += fh.read(n)
+            pos += n
+
+        if hashlib.sha1(data).digest() != known.pieces[i * 20:(i + 1) * 20]:
+            printv("Piece %d does not match." % i)
+            return False
+
+    return True
+
+
+def get_files_in_directory(
+    directory: str,
+    excluded_paths: Optional[Set[str]] = None,
+    relative_to: Optional[str] = None,
+    excluded_regexps: Optional[Set[Pattern[str]]] = None,
+) -> List[str]:
+    """
+    Return a list containing the paths to all files in the given directory.
+
+    See iter_files_in_directory for the details.
+    """
+    return list(iter_files_in_directory(directory, excluded_paths, relative_to, excluded_regexps))
+
+
+def iter_files_in_directory(
+    directory: str,
+    excluded_paths: Optional[Set[str]] = None,
+    relative_to: Optional[str] = None,
+    excluded_regexps: Optional[Set[Pattern[str]]] = None,
+) -> Iterator[str]:
+    """
+    Return an iterator over the paths to all files in the given directory, in a deterministic order. The directory is
+    walked as the iterator advances, i.e. the files can be processed before the walk is complete.
+
+    Paths in excluded_paths are skipped. These should be os.path.normcase()-d.
+    Of course, the initial directory cannot be excluded.
+    Paths matching any of the regular expressions in excluded_regexps are
+    skipped, too. The regexps must be compiled by the caller.
+    In both cases, absolute paths are used for matching.
+
+    The paths may be returned relative to a specific directory. By default,
+    this is the initial directory itself.
+
+    Please note: Only paths to files are returned!
+
+    @param excluded_regexps: A set of compiled regular expressions.
+    """
+    # Argument validation:
+    if not isinstance(directory, str):
+        raise TypeError("directory must be instance of: str")
+
+    if excluded_paths is None:
+        excluded_paths = set()
+    elif not isinstance(excluded_paths, set):
+        raise TypeError("excluded_paths must be instance of: set")
+
+    if relative_to is not None:
+        if not isinstance(relative_to, str):
+            raise TypeError("relative_to must be instance of: str")
+
+        if not os.path.isdir(relative_to):
+            raise ValueError("relative_to: '%s' is not a valid directory" % relative_to)
+
+    if excluded_regexps is None:
+        excluded_regexps = set()
+    elif not isinstance(excluded_regexps, set):
+        raise TypeError("excluded_regexps must be instance of: set")
+
+    # Helper function:
+    def _iter_files_in_directory(
+        directory: str,
+        excluded_paths: Optional[Set[str]] = None,
+        relative_to: Optional[str] = None,
+        excluded_regexps: Optional[Set[Pattern[str]]] = None,
+        processed_paths: Optional[Set[str]] = None,
+    ) -> Iterator[str]:
+        if excluded_paths is None:
+            excluded_paths = set()
+        if excluded_regexps is None:
+            excluded_regexps = set()
+        if processed_paths is None:
+            processed_paths = set()
+
+        # Improve consistency across platforms.
+        # Note:
+        listdir = os.listdir(directory)
+        listdir.sort(key=str.lower)
+
+        processed_paths.add(os.path.normcase(os.path.realpath(directory)))
+
+        for node in listdir:
+            path = os.path.join(directory, node)
+
+            if os.path.normcase(path) in excluded_paths:
+                printv("Skipping '%s' due to explicit exclusion." %
+                       clean_str_for_console(os.path.relpath(path, relative_to)))
+                continue
+
+            regexp_match = False
+            for regexp in excluded_regexps:
+                if regexp.search(path):
+                    printv("Skipping '%s' due to pattern exclusion." %
+                           clean_str_for_console(os.path.relpath(path, relative_to)))
+                    regexp_match = True
+                    break
+            if regexp_match:
+                continue
+
+            if os.path.normcase(os.path.realpath(path)) in processed_paths:
+                print(
+                    "Warning: skipping symlink '%s', because it's target "
+                    "has already been processed." % clean_str_for_console(path),
+                    file=sys.stderr,
+                )
+                continue
+            processed_paths.add(os.path.normcase(os.path.realpath(path)))
+
+            if os.path.isfile(path):
+                if relative_to:
+                    path = os.path.relpath(path, relative_to)
+                yield path
+            elif os.path.isdir(path):
+                yield from _iter_files_in_directory(
+                    path,
+                    excluded_paths=excluded_paths,
+                    relative_to=relative_to,
+                    excluded_regexps=excluded_regexps,
+                    processed_paths=processed_paths,
+                )
+            else:
+                assert False, "not a valid node: '%s'" % node
+
+    # Final preparations:
+    directory = os.path.abspath(directory)
+
+    if not relative_to:
+        relative_to = directory
+
+    # Now do the main work (as the iterator advances).
+    return _iter_files_in_directory(
+        directory,
+        excluded_paths=excluded_paths,
+        relative_to=relative_to,
+        excluded_regexps=excluded_regexps,
+    )
+
+
+def sort_like_directory(
+    files: List[Tuple[List[str], Any]],
+    root: str,
+    excluded_paths: Optional[Set[str]] = None,
+    excluded_regexps: Optional[Set[Pattern[str]]] = None,
+) -> List[Any]:
+    """
+    Return the values of the given files in the order in which get_files_in_directory would return the files if they
+    were stored in the directory root. Excluded paths are skipped (as in get_files_in_directory).
+
+    The files are given as (path components, value). Later files replace earlier ones with the same path. Raise
+    ValueError if a path is used for a file and a directory.
+    """
+    if excluded_paths is None:
+        excluded_paths = set()
+    if excluded_regexps is None:
+        excluded_regexps = set()
+
+    # Build the directory tree. Files are stored as single-element lists to distinguish them from directories.
+    tree: Dict[str, Any] = {}
+    for components, value in files:
+        node = tree
+        for part in components[:-1]:
+            node = node.setdefault(part, {})
+            if not isinstance(node, dict):
+                raise ValueError("'%s' is both a file and a directory" % part)
+        if isinstance(node.get(components[-1]), dict):
+            raise ValueError("'%s' is both a file and a directory" % components[-1])
+        node.pop(components[-1], None)
+        node[components[-1]] = [value]
+
+    result: List[Any] = []
+
+    def walk(node: Dict[str, Any], prefix: List[str]) -> None:
+        for name in sorted(node, key=str.lower):
+            path = os.path.join(root, *prefix, name)
+
+            if os.path.normcase(path) in excluded_paths:
+                printv("Skipping '%s' due to explicit exclusion." % clean_str_for_console(os.path.relpath(path, root)))
+                continue
+            if any(regexp.search(path) for regexp in excluded_regexps):
+                printv("Skipping '%s' due to pattern exclusion." % clean_str_for_console(os.path.relpath(path, root)))
+                continue
+
+            if isinstance(node[name], dict):
+                walk(node[name], prefix + [name])
+            else:
+                result.append(node[name][0])
+
+    walk(tree, [])
+    return result
+
+
+def split_path(path: str) -> List[str]:
+    """
+    Return a list containing all of a path's components.
+
+    Paths containing relative components get resolved first.
+
+    >>> split_path("this/./is/a/very/../fucked\\path/file.ext")
+    ['this', 'is', 'a', 'fucked', 'path', 'file.ext']
+    """
+    if not isinstance(path, str):
+        raise TypeError("path must be instance of: str")
+
+    parts: List[str] = []
+
+    path = os.path.normpath(path)
+
+    head = path
+
+    while len(head) != 0:
+        (head, tail) = os.path.split(head)
+        parts.insert(0, tail)
+
+    return parts
+
+
+def remove_duplicates(old_list: List[Any]) -> List[Any]:
+    """
+    Remove any duplicates in old_list, preserving the order of its elements.
+
+    Thus, for all duplicate entries only the first entry is kept in the list.
+    """
+    new_list = list()
+    added_items = set()
+
+    for item in old_list:
+        if item in added_items:
+            continue
+
+        added_items.add(item)
+        new_list.append(item)
+
+    return new_list
+
+
+def replace_in_list(old_list: List[Any], replacements: Dict[Any, Any]) -> List[Any]:
+    """
+    Replace specific items in a list.
+
+    Note that one element may be replaced by multiple new elements. However, this also makes it impossible to
+    replace an item with a list.
+
+    Example given:
+    >>> replace_in_list(['dont',
+                         'replace',
+                         'us',
+                         'replace me'],
+                        {'replace me': ['you',
+                                        'are',
+                                        'welcome']})
+    ['dont', 'replace', 'us', 'you', 'are', 'welcome']
+    """
+    new_list = list()
+
+    replacements_from = set(replacements.keys())
+
+    for item in old_list:
+        if item in replacements_from:
+            new_item = replacements[item]
+
+            if isinstance(new_item, list):
+                new_list.extend(new_item)
+            else:
+                new_list.append(new_item)
+        else:
+            new_list.append(item)
+
+    return new_list
+
+
+def calculate_piece_length(size: int) -> int:
+    """
+    Calculate a reasonable piece length for the given torrent size.
+
+    Proceeding:
+    1. Start with 256 KIB.
+    2. While piece count > 2000: double piece length.
+    3. While piece count < 8:    use half the piece length.
+
+    However, enforce these bounds:
+    - minimum piece length = 16 KiB.
+    - maximum piece length = 64 MiB.
+    """
+    if not isinstance(size, int):
+        raise TypeError("size must be instance of: int")
+
+    if size <= 0:
+        raise ValueError("size must be greater than 0 (given: %d)" % size)
+
+    if size < 16 * KIB:
+        return 16 * KIB
+
+    piece_length = 256 * KIB
+
+    while size / piece_length > 2000:
+        piece_length *= 2
+
+    while size / piece_length < 8:
+        piece_length //= 2
+
+    # Ensure that: 16 KIB <= piece_length <= 64 * MIB
+    piece_length = max(min(piece_length, 64 * MIB), 16 * KIB)
+
+    return int(piece_length)
+
+
+def get_best_trackers(count: int, url: str) -> List[str]:
+    if count < 0:
+        raise ValueError("count must be positive")
+
+    if count == 0:
+        return []
+
+    with urllib.request.urlopen(url) as f:
+        text = f.read().decode("utf-8")
+
+    best = []
+    i = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        best.append(line)
+        i += 1
+        if i == count:
+            break
+
+    return best
+
+
+def raise_error(
+    message: str,
+    parser: Optional[argparse.ArgumentParser] = None,
+) -> NoReturn:
+    if parser is not None:
+        parser.error(message)
+    else:
+        raise Exception(message)
+
+
+def get_hash_configuration(config: Config, piece_length: int, threads: Optional[int],
+                           engine: Optional[str]) -> Tuple[int, str]:
+    """
+    Return the number of threads and the hash engine for hashing pieces of the given length (in bytes).
+
+    If threads or engine is None, the calibrated value for the closest piece length is used (see calibrate). Without a
+    (usable) calibration, 4 threads and hashlib are used, or one thread per CPU core and the parallel engine on
+    free-threaded builds of CPython (see is_free_threaded), where reading and hashing scale with the threads.
+    """
+    calibration = config.get_calibration(piece_length) if threads is None or engine is None else None
+    if calibration is not None and calibration["engine"] not in HASH_ENGINES:
+        calibration = None
+    if threads is None:
+        if calibration is not None:
+            threads = int(calibration["threads"])
+        else:
+            threads = multiprocessing.cpu_count() if is_free_threaded() else 4
+    if engine is None:
+        if calibration is not None:
+            engine = str(calibration["engine"])
+        else:
+            engine = "parallel" if is_free_threaded() else "hashlib"
+    return threads, engine
+
+
+def calibrate(config: Config, piece_lengths: List[int], size: int = 64 * MIB) -> Dict[str, Dict[str, Any]]:
+    """
+    Find the fastest hash engine and number of threads for each of the given piece lengths (in bytes) and add them to
+    the config file, so that they are used by default (see get_hash_configuration).
+
+    Each available engine is timed with 1, 2, 4, ... threads (up to the number of CPU cores) by hashing a temporary
+    file of (at least) the given size, which is read once beforehand, so that it is cached and only the hashing is
+    measured. Return the new calibration like Config.calibration.
+    """
+    cpu_count = multiprocessing.cpu_count()
+    thread_counts = sorted(set([2**i for i in range(cpu_count.bit_length())] + [cpu_count]))
+    engines = [name for name, engine in sorted(HASH_ENGINES.items()) if engine.is_available()]
+    size = max(size, 4 * max(piece_lengths))
+
+    fd, path = tempfile.mkstemp(suffix=".calibration")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for pos in range(0, size, MIB):
+                fh.write(os.urandom(min(MIB, size - pos)))
+        _hash_pieces([path], [size], MIB, False, 1, prefetch_files=0)
+
+        calibration = {}
+        for piece_length in piece_lengths:
+            best: Optional[Tuple[float, str, int]] = None
+            for engine in engines:
+                for threads in thread_counts:
+                    elapsed = math.inf
+                    for _ in range(3):
+                        start = time.perf_counter()
+                        _hash_pieces([path], [size], piece_length, False, threads, prefetch_files=0, engine=engine)
+                        elapsed = min(elapsed, time.perf_counter() - start)
+                    rate = size / MIB / elapsed
+                    print("  %d KiB pieces, %s, %d thread/s: %.1f MiB/s" % (piece_length // KIB, engine, threads, rate))
+                    if best is None or rate > best[0]:
+                        best = (rate, engine, threads)
+
+            assert best is not None
+            print("Fastest for %d KiB pieces: %s with %d thread/s" % (piece_length // KIB, best[1], best[2]))
+            calibration[str(piece_length // KIB)] = {"engine": best[1], "threads": best[2], "rate": round(best[0], 1)}
+    finally:
+        os.remove(path)
+
+    config.save_calibration(calibration)
+    return calibration
+
+
+def load_config(
+    config_path: Optional[str],
+    advertise: bool = True,
+    _parser: Optional[argparse.ArgumentParser] = None,
+) -> Config:
+    """Load the config file (or the default configuration, if there is none). Exit on errors."""
+    if config_path:
+        if not os.path.isfile(config_path):
+            raise_error("The config file at '%s' does not exist" % config_path, _parser)
+
+    config: Config = Config(config_path, advertise=advertise)
+
+    try:
+        config.load_config()
+    except json.JSONDecodeError as exc:
+        print(
+            "Could not parse config file at '%s'" % config.get_path_to_config_file(),
+            file=sys.stderr,
+        )
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+    except Config.InvalidConfigError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+
+    printv("Config / Tracker abbreviations:\n" + pprint.pformat(config.tracker_abbreviations))
+    printv("Config / Advertise:         " + str(config.advertise))
+    printv("Config / Best trackers URL: " + config.best_trackers_url)
+
+    return config
+
+
+def process_trackers(
+    trackers: List[str],
+    config: Config,
+    force: bool = False,
+    _parser: Optional[argparse.ArgumentParser] = None,
+    interactive: bool = True,
+) -> List[str]:
+    """
+    Return the final list of tracker URLs.
+
+    Tracker abbreviations are applied, duplicates are removed, the URLs are validated and bestN shortcuts are replaced
+    with the best N trackers.
+    """
+    # Evaluate / apply the tracker abbreviations.
+    trackers = replace_in_list(trackers, config.tracker_abbreviations)
+
+    # Remove duplicate trackers.
+    trackers = remove_duplicates(trackers)
+
+    # Validate tracker URLs.
+    invalid_trackers = False
+    best_shortcut_present = False
+    regexp = re.compile(r"^(http|https|udp)://", re.I)
+    regexp_best = re.compile(r"best([0-9]+)", re.I)
+    for t in trackers:
+        m = regexp_best.match(t)
+        if m:
+            best_shortcut_present = True
+        if not regexp.search(t) and not m:
+            print("Warning: Not a valid tracker URL: %s" % t, file=sys.stderr)
+            invalid_trackers = True
+
+    if invalid_trackers and not force:
+        if _parser is not None and interactive:
+            if "yes" != input("Some tracker URLs are invalid. Continue? yes/no: "):
+                raise_error("Aborted.", _parser)
+        else:
+            raise_error("Some tracker URLs are invalid, and force flag is not set.", _parser)
+
+    # Handle best[0-9] shortcut.
+    if best_shortcut_present:
+        new_trackers = []
+        for t in trackers:
+            m = regexp_best.match(t)
+            if m:
+                try:
+                    new_trackers.extend(get_best_trackers(int(m.group(1)), config.best_trackers_url))
+                except urllib.error.URLError as e:
+                    print(
+                        "Error: Could not download best trackers from '%s'. Reason: %s" % (config.best_trackers_url, e),
+                        file=sys.stderr,
+                    )
+                    sys.exit(1)
+            else:
+                new_trackers.append(t)
+        trackers = new_trackers
+
+    return trackers
+
+
+def parse_nodes(
+    nodes: List[str],
+    force: bool = False,
+    _parser: Optional[argparse.ArgumentParser] = None,
+    interactive: bool = True,
+) -> List[List[Any]]:
+    """Parse and validate DHT bootstrap nodes given in the format 'host,port'."""
+    parsed_nodes = list()
+    invalid_nodes = False
+    for n in nodes:
+        splitted = n.split(",")
+        if len(splitted) != 2:
+            print(
+                "Invalid format for DHT bootstrap node '%s'. Please use the format 'host,port'." % n,
+                file=sys.stderr,
+            )
+            invalid_nodes = True
+            continue
+
+        host, port = splitted
+        if not port.isdigit():
+            print(
+                "Invalid port number for DHT bootstrap node '%s'. Ports must be numeric." % n,
+                file=sys.stderr,
+            )
+            invalid_nodes = True
+
+        parsed_nodes.append([host, int(port)])
+
+    if invalid_nodes and not force:
+        if _parser is not None and interactive:
+            if "yes" != input("Some DHT bootstrap nodes are invalid. Continue? yes/no: "):
+                raise_error("Aborted.", _parser)
+        else:
+            raise_error("Some DHT bootstrap nodes are invalid, and force flag is not set.", _parser)
+
+    return parsed_nodes
+
+
+def validate_source(source: str, _parser: Optional[argparse.ArgumentParser] = None) -> str:
+    """Return the stripped source tag or raise an error if it is invalid."""
+    source = source.strip()
+
+    # Re-use the name regex for source parameter.
+    regexp = re.compile(r"^[A-Z0-9_\-., ]+$", re.I)
+
+    if not regexp.match(source):
+        raise_error("Invalid source: '%s'. Allowed chars: A_Z, a-z, 0-9, any of {.,_-} plus spaces." % source, _parser)
+
+    return source
+
+
+def validate_name(name: str, _parser: Optional[argparse.ArgumentParser] = None) -> str:
+    """Return the stripped torrent name or raise an error if it is invalid."""
+    name = name.strip()
+
+    regexp = re.compile(r"^[A-Z0-9_\-., ()]+$", re.I)
+
+    if not regexp.match(name):
+        raise_error("Invalid name: '%s'. Allowed chars: A_Z, a-z, 0-9, any of {.,_-()} plus spaces." % name, _parser)
+
+    return name
+
+
+def parse_piece_lengths(value: str, _parser: Optional[argparse.ArgumentParser] = None) -> Union[int, List[int]]:
+    """Parse a piece length or a comma-separated list of piece lengths (in KiB)."""
+    try:
+        piece_lengths = [int(part) for part in value.split(",")]
+    except ValueError:
+        raise_error("Invalid piece length: '%s'" % value, _parser)
+    return piece_lengths[0] if len(piece_lengths) == 1 else piece_lengths
+
+
+def parse_rate(value: Union[int, str]) -> int:
+    """
+    Parse a rate in bytes per second, optionally with one of the (binary) suffixes K, M or G (e.g. "20M").
+
+    Raise ValueError if the rate is invalid.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        rate = value
+    else:
+        match = re.match(r"^(\d+(?:\.\d+)?)([KMG]?)$", str(value).strip(), re.IGNORECASE)
+        if not match:
+            raise ValueError("invalid rate: '%s'" % value)
+        rate = int(float(match.group(1)) * {"": 1, "K": KIB, "M": MIB, "G": KIB * MIB}[match.group(2).upper()])
+    if rate < 0:
+        raise ValueError("invalid rate: '%s'" % value)
+    return rate
+
+
+def load_variants(specs: List[str], path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Return the variants given as specs and/or in a JSON file (the variants from the file come first).
+
+    A variant has a label and overrides some of the options trackers, nodes, webseeds (lists of strings), private
+    (bool), source and comment (strings, an empty source means no source tag). The file contains a list like
+    [{"label": "a", "trackers": ["..."], "private": true, "source": "A"}, ...]. A spec is a string like
+    "a:tracker=...;tracker=...;private=yes;source=A", where tracker, node and webseed may be repeated.
+
+    Raise ValueError if a variant is invalid.
+    """
+    loaded_variants: List[Any] = []
+    if path is not None:
+        with open(path, "r", encoding="utf-8") as fh:
+            loaded_variants = json.load(fh)
+        if not isinstance(loaded_variants, list):
+            raise ValueError("'%s' does not contain a list of variants" % path)
+
+    for spec in specs:
+        label, _, options = spec.partition(":")
+        variant: Dict[str, Any] = {"label": label}
+        for option in filter(None, options.split(";")):
+            key, separator, value = option.partition("=")
+            if not separator or key not in ("tracker", "node", "webseed", "private", "source", "comment"):
+                raise ValueError("invalid option '%s' in variant '%s'" % (option, spec))
+            if key in ("tracker", "node", "webseed"):
+                variant.setdefault(key + "s", []).append(value)
+            elif key == "private":
+                if value.lower() not in ("yes", "no", "true", "false", "1", "0"):
+                    raise ValueError("invalid value for private in variant '%s'" % spec)
+                variant["private"] = value.lower() in ("yes", "true", "1")
+            else:
+                variant[key] = value
+        loaded_variants.append(variant)
+
+    types = {
+        "label": str,
+        "trackers": list,
+        "nodes": list,
+        "webseeds": list,
+        "private": bool,
+        "source": str,
+        "comment": str,
+    }
+    labels = set()
+    for variant in loaded_variants:
+        if not isinstance(variant, dict) or any(key not in types or not isinstance(value, types[key]) or
+                                                (isinstance(value, list) and not all(isinstance(v, str) for v in value))
+                                                for key, value in variant.items()):
+            raise ValueError("invalid variant: %r" % (variant, ))
+        if not re.match(r"^[A-Z0-9_\-]+$", variant.get("label", ""), re.I):
+            raise ValueError("invalid label: %r. Allowed chars: A-Z, a-z, 0-9, _ and -" % variant.get("label", ""))
+        if variant["label"] in labels:
+            raise ValueError("duplicate label: '%s'" % variant["label"])
+        labels.add(variant["label"])
+
+    return loaded_variants
+
+
+@resets_throttle
+def create_torrent(
+    path: Optional[str],
+    trackers: List[str] = [],
+    nodes: List[str] = [],
+    piece_length: Union[int, List[int]] = 0,
+    private: bool = False,
+    comment: Optional[str] = None,
+    source: Optional[str] = None,
+    force: bool = False,
+    verbose: bool = False,
+    quiet: bool = False,
+    output: Optional[str] = None,
+    exclude: List[str] = [],
+    exclude_pattern: List[str] = [],
+    exclude_pattern_ci: List[str] = [],
+    date: Optional[Union[Literal[False], int]] = None,
+    name: Optional[str] = None,
+    threads: Optional[int] = None,
+    include_md5: bool = False,
+    config_path: Optional[str] = None,
+    webseeds: List[str] = [],
+    no_created_by: bool = False,
+    resume: bool = False,
+    checkpoint_interval: float = 60,
+    watch: bool = False,
+    watch_debounce: float = 5,
+    watch_hook: Optional[str] = None,
+    reuse_from: Optional[str] = None,
+    reuse_trust: str = "mtime",
+    reuse_verify: int = 0,
+    export_index: Optional[str] = None,
+    from_index: Optional[str] = None,
+    tee: Optional[str] = None,
+    archive: bool = False,
+    strip_components: int = 0,
+    urls: List[str] = [],
+    url_manifest: Optional[str] = None,
+    http_connections: int = 4,
+    http_retries: int = 3,
+    auto_webseed: bool = True,
+    variants: List[str] = [],
+    variants_file: Optional[str] = None,
+    checksums: List[str] = [],
+    checksums_out: Optional[str] = None,
+    include_sha1: bool = False,
+    read_order: str = "torrent",
+    readers_per_device: int = 1,
+    prefetch_files: int = 16,
+    stats: bool = False,
+    max_read_rate: int = 0,
+    max_cpu: float = 0,
+    throttle_file: Optional[str] = None,
+    nice: int = 0,
+    ionice: Optional[str] = None,
+    engine: Optional[str] = None,
+    hash_while_scanning: bool = False,
+    files_from: Optional[str] = None,
+    maps: List[str] = [],
+    layout: Optional[str] = None,
+    _parser: Optional[argparse.ArgumentParser] = None,
+) -> Dict[str, Any]:
+    """Creates a torrent from a file or Folder
+
+    Parameters
+    ----------
+    path
+        File or folder for which to create a torrent (None if from_index is given). "-" means that the data is read
+        from stdin, which requires piece_length and name.
+    trackers, optional
+        Add one or multiple tracker (announce) URLs to the torrent file, by default []
+    nodes, optional
+        Add one or multiple DHT bootstrap nodes, by default []
+    piece_length, optional
+        Set piece size in KiB, by default 0 which means automatic selection. If a list of piece sizes is given, one
+        torrent is created per piece size (named <name>.p<piece size>.torrent) while reading the data only once. The
+        metainfo of the first one is returned then.
+    private, optional
+        Set the private flag to disable DHT and PEX, by default False
+    comment, optional
+        Add a comment, by default None
+    source, optional
+        Add a source tag, by default None
+    force, optional
+        Overwrite existing .torrent files without asking and disable the piece size, tracker and node validations, by default False
+    verbose, optional
+        Enable output of diagnostic information, by default False
+    quiet, optional
+        Suppress output, e.g. don't print summary, by default False
+    output, optional
+        Set the filename and/or output directory of the created file. By default None, which means <name>.torrent
+    exclude, optional
+        Exclude specific paths, by default []
+    exclude_pattern, optional
+        Exclude paths matching a regular expression, by default []
+    exclude_pattern_ci, optional
+        Same as exclude_pattern but case-insensitive, by default []
+    date, optional
+        Overwrite creation date. This option expects a unix timestamp, None means current time, False means no time at all, by default None
+    name, optional
+        Set the name of the torrent. This changes the filename for single file torrents or the root directory name for multi-file torrents. By default None, which means file name without extension or folder name.
+    threads, optional
+        Set the maximum number of threads to use for hashing pieces, will never use more threads than there are CPU
+        cores, by default the calibrated number (see calibrate) or 4 (the number of CPU cores on free-threaded builds)
+    include_md5, optional
+        Include MD5 hashes in torrent file, by default False
+    config, optional
+        Specify location of config file. By default None, which means <home directiory>/.py3createtorrent.cfg
+    webseeds, optional
+        Add one or multiple HTTP/FTP urls as seeds (GetRight-style), by default []
+    no_created_by, optional
+        Prevents py3createtorrrent from setting the "created by" info to be itself and its version, by default False
+    resume, optional
+        Resume an interrupted run from its checkpoint file (<output path>.checkpoint), by default False
+    checkpoint_interval, optional
+        Save a checkpoint every N seconds while hashing, 0 disables checkpoints, by default 60
+    watch, optional
+        Keep running and update the torrent whenever the input changes, by default False. Only the pieces that are
+        affected by changed files are rehashed. This function does not return in watch mode.
+    watch_debounce, optional
+        In watch mode, wait until there have been no changes for N seconds before updating the torrent, by default 5
+    watch_hook, optional
+        In watch mode, a shell command to run after each update of the torrent, by default None. The path to the
+        torrent file is passed in the environment variable PY3CREATETORRENT_TORRENT.
+    reuse_from, optional
+        Path to an existing torrent for (an older version of) the same data, by default None. Its piece hashes are
+        re-used for all pieces that lie entirely in unchanged files at unchanged offsets.
+    reuse_trust, optional
+        When re-using piece hashes, consider files with the same path and size unchanged if they have not been modified
+        after the existing torrent was created ("mtime") or in any case ("size"), by default "mtime"
+    reuse_verify, optional
+        When re-using piece hashes, rehash N randomly chosen re-used pieces and hash everything if any of them does not
+        match, by default 0
+    export_index, optional
+        Also write a binary index of the piece hashes and the file table to this path (see PieceIndex), by default
+        None
+    from_index, optional
+        Create the torrent from an index written by export_index instead of hashing the data at path (which must be
+        None then), by default None
+    tee, optional
+        When reading from stdin, also write the data to this file, by default None
+    archive, optional
+        Treat the file at path (or stdin) as a tar or zip archive and create a torrent for its contents, as if it had
+        been extracted to a directory next to it (named like the archive without extension), by default False
+    strip_components, optional
+        Strip this number of leading components from the paths of the archive's members, by default 0
+    urls, optional
+        Create the torrent for files served over HTTP(S) instead of the data at path (which must be None then), by
+        default []. The name and the paths are derived from the URLs (see load_url_sources).
+    url_manifest, optional
+        Path to a JSON manifest with URLs, paths and sizes of files served over HTTP(S) (see load_url_sources), by
+        default None
+    http_connections, optional
+        Maximum number of concurrent requests per host, by default 4
+    http_retries, optional
+        Number of retries for failed HTTP requests, by default 3
+    auto_webseed, optional
+        Add the origin of the URLs as webseed (if possible), by default True
+    variants, optional
+        Create one torrent per variant from the same hashing run, by default []. A variant has a label (which is added
+        to the name of the torrent file) and overrides some of the trackers, nodes, webseeds, private flag, source tag
+        and comment (see load_variants). The metainfo of the first variant is returned.
+    variants_file, optional
+        Path to a JSON file with more variants (see load_variants), by default None
+    checksums, optional
+        Also calculate these checksums of the files while hashing (see FileChecksums.ALGORITHMS) and write them to
+        checksum files like SHA256SUMS or an SFV file (for crc32), by default []
+    checksums_out, optional
+        Directory for the checksum files, by default None which means the directory of the torrent file
+    include_sha1, optional
+        Include the sha1 hashes of the files in the torrent file (BEP 47), by default False
+    read_order, optional
+        Read the files of a directory in the torrent's order ("torrent") or in the order of their location on disk
+        ("physical"), which reduces seeking on hard disks, by default "torrent". The torrent is the same either way.
+    readers_per_device, optional
+        Number of threads reading from each device (st_dev) of a directory's files, by default 1. Files on different
+        devices are read in parallel.
+    prefetch_files, optional
+        Number of small files (up to 1 MiB) of a directory that are opened and read concurrently, ahead of the
+        hashing, by default 16. 0 disables this.
+    stats, optional
+        Print statistics about the hashing time and the throughput of each device, by default False
+    max_read_rate, optional
+        Limit the rate at which the data is read to N bytes per second, by default 0 which means no limit
+    max_cpu, optional
+        Limit the CPU usage to N percent of one CPU core (by pausing the reading), by default 0 which means no limit
+    throttle_file, optional
+        Path to a JSON file like {"max_read_rate": "20M", "max_cpu": 50} that can be changed while hashing in order
+        to adjust the limits (see Throttle), by default None
+    nice, optional
+        Lower the CPU priority of the process by N (see os.nice), by default 0
+    ionice, optional
+        Set the I/O scheduling class of the process, e.g. "idle" or "best-effort:7" (Linux only), by default None
+    engine, optional
+        Calculate the sha1 hashes with "hashlib", with "parallel" threads that also read the data, or in the Linux
+        kernel ("afalg"). The latter two fall back to hashlib if they are not available or if the data is needed for
+        other purposes, e.g. for md5 sums (see HASH_ENGINES), by default the calibrated engine (see calibrate) or
+        "hashlib" ("parallel" on free-threaded builds of CPython)
+    hash_while_scanning, optional
+        Hash a directory while it is being scanned (see create_streamed_multi_file_info), if the piece length is given
+        and this is possible with the other options (not with e.g. watch, resume, reuse or checksums). No checkpoints
+        are written then. By default False
+    files_from, optional
+        Path to a list of the files of the folder at path ("-" for stdin), which is used instead of scanning the
+        folder (see read_file_list). The files are not checked before hashing them. By default None
+    maps, optional
+        Compose the torrent from local files and directories instead of the data at path (which must be None then),
+        given as mappings "local_path=torrent/path" (see load_layout), by default []
+    layout, optional
+        Path to a JSON layout file with the local paths and the paths in the torrent of the files and directories the
+        torrent is composed from (see load_layout), by default None
+    _parser, optional
+        DO NOT TOUCH THIS, its just used for the function to know if you are using it directly or as a cli tool. For interactivity and different error handeling.
+    """
+
+    global VERBOSE
+    VERBOSE = verbose
+
+    config = load_config(config_path, not no_created_by, _parser)
+
+    # Limit the read rate and the CPU usage, and lower the priority (before any threads are started, as they inherit
+    # it).
+    global THROTTLE
+    if max_read_rate < 0 or max_cpu < 0:
+        raise_error("The limits for the read rate and the CPU usage must not be negative.", _parser)
+    if ionice is not None and not re.match(r"^(idle|best-effort|realtime)(:[0-7])?$", ionice):
+        raise_error("Invalid I/O scheduling class: '%s'" % ionice, _parser)
+    THROTTLE = Throttle(max_read_rate, max_cpu, throttle_file) if max_read_rate or max_cpu or throttle_file else None
+    if nice or ionice:
+        try:
+            lower_priority(nice, ionice)
+        except OSError as exc:
+            raise_error("Cannot lower the priority: %s" % exc, _parser)
+
+    # The user cannot be asked anything if the data is read from stdin.
+    interactive = _parser is not None and path != "-"
+
+    # Multiple piece lengths produce one torrent each, from a single pass over the data.
+    piece_lengths = piece_length if isinstance(piece_length, list) else [piece_length]
+    if len(piece_lengths) > 1:
+        if any(length <= 0 for length in piece_lengths) or len(set(piece_lengths)) != len(piece_lengths):
+            raise_error("Multiple piece lengths must be positive and distinct.", _parser)
+        if watch or resume or reuse_from or export_index or from_index or urls or url_manifest:
+            raise_error("Multiple piece lengths cannot be used together with watch, resume, reuse, indexes or URLs.",
+                        _parser)
+        if path == "-" and not archive:
+            raise_error("Multiple piece lengths cannot be used when reading a single file from stdin.", _parser)
+    piece_length = piece_lengths[0]
+
+    # Checksums of the files are calculated from the data that is read for the pieces, so everything must be read.
+    if checksums or include_sha1:
+        for algorithm in checksums:
+            if algorithm not in FileChecksums.ALGORITHMS:
+                raise_error(
+                    "Unknown checksum algorithm: '%s'. Supported: %s" %
+                    (algorithm, ", ".join(FileChecksums.ALGORITHMS)), _parser)
+        if watch or resume or reuse_from or from_index or urls or url_manifest or (path == "-" and not archive):
+            raise_error("Checksums cannot be used together with watch, resume, reuse, indexes, URLs or stdin.", _parser)
+    elif checksums_out:
+        raise_error("The checksum files can only be written if checksums are calculated.", _parser)
+
+    if engine is not None and engine not in HASH_ENGINES:
+        raise_error("Invalid hash engine: '%s'" % engine, _parser)
+
+    # Reading in physical order requires that the files can be read in any order.
+    if read_order not in ("torrent", "physical"):
+        raise_error("Invalid read order: '%s'" % read_order, _parser)
+    if read_order == "physical":
+        if resume or len(piece_lengths) > 1 or archive or from_index or urls or url_manifest or path == "-":
+            raise_error(
+                "The physical read order cannot be used together with resume, multiple piece lengths, "
+                "archives, indexes, URLs or stdin.", _parser)
+
+    # Ask the user if he really wants to use uncommon piece lengths.
+    # (Unless the force option has been set.)
+    if not force and any(0 < length < 16 for length in piece_lengths):
+        if interactive:
+            if "yes" != input("It is strongly recommended to use a piece length greater or equal than 16 KiB! Do you "
+                              "really want to continue? yes/no: "):
+                raise_error("Aborted.", _parser)
+        else:
+            raise_error("Uncommon piece length, and no force flag set.", _parser)
+
+    if not force and any(length > 16384 for length in piece_lengths):
+        if interactive:
+            if "yes" != input(
+                    "It is strongly recommended to use a maximum piece length of 16384 KiB (16 MiB)! Do you really "
+                    "want to continue? yes/no: "):
+                raise_error("Aborted.", _parser)
+        else:
+            raise_error("Piece length over 16384, and no force flag set.", _parser)
+
+    if not force and any(length % 16 != 0 for length in piece_lengths):
+        if interactive:
+            if "yes" != input(
+                    "It is strongly recommended to use a piece length that is a multiple of 16 KiB! Do you really "
+                    "want to continue? yes/no: "):
+                raise_error("Aborted.", _parser)
+        else:
+            raise_error("Piece length not a multiple of 16 KiB, and no force flag set.", _parser)
+
+    # Verbose and quiet options may not be used together.
+    if verbose and quiet:
+        raise_error("Being verbose and quiet exclude each other.", _parser)
+
+    input_path: str = path or ""
+
+    # Load the index, archive or URLs, or validate the given path.
+    index = None
+    archive_reader = None
+    http_source = None
+    url_files: List[Tuple[str, List[str], int]] = []
+    url_name = ""
+    url_single_file = False
+    if from_index is not None:
+        if path:
+            raise_error("A path cannot be specified together with an index.", _parser)
+        if watch or resume or reuse_from or export_index or tee:
+            raise_error("An index cannot be used together with watch, resume, reuse, index export or tee.", _parser)
+        try:
+            index = PieceIndex(from_index)
+        except (IOError, PieceIndex.InvalidIndexError) as exc:
+            raise_error("Cannot load index: %s" % exc, _parser)
+        if piece_length and piece_length * KIB != index.piece_length:
+            raise_error("The piece length of the index is %d KiB." % (index.piece_length / KIB), _parser)
+    elif urls or url_manifest:
+        if path:
+            raise_error("A path cannot be specified together with URLs.", _parser)
+        if watch or resume or reuse_from or archive or tee:
+            raise_error("URLs cannot be used together with watch, resume, reuse, archive or tee.", _parser)
+        if http_connections <= 0 or http_retries < 0:
+            raise_error("Invalid number of HTTP connections or retries.", _parser)
+        try:
+            url_sources, url_name, url_single_file = load_url_sources(urls, url_manifest)
+        except (IOError, ValueError) as exc:
+            raise_error("Cannot load URLs: %s" % exc, _parser)
+        if not name and not url_name:
+            raise_error("The name cannot be derived from the URLs and must be specified.", _parser)
+
+        # Determine the sizes that are not given in the manifest (concurrently, there may be many files).
+        http_source = HttpSource(http_connections, http_retries)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=http_connections) as executor:
+                sizes = list(executor.map(http_source.get_size, [url for url, _, size in url_sources if size is None]))
+            url_files = [(url, components, size if size is not None else sizes.pop(0))
+                         for url, components, size in url_sources]
+        except HttpSource.HttpError as exc:
+            raise_error(str(exc), _parser)
+        if sum(size for _, _, size in url_files) == 0:
+            raise_error("Can't create torrent for 0 byte data.", _parser)
+    elif maps or layout:
+        if path:
+            raise_error("A path cannot be specified together with a layout.", _parser)
+        if watch or resume or archive or tee or files_from:
+            raise_error("A layout cannot be used together with watch, resume, archive, tee or a file list.", _parser)
+    elif archive:
+        if watch or resume or reuse_from:
+            raise_error("Archives cannot be used together with watch, resume or reuse.", _parser)
+        if input_path == "-" and not name:
+            raise_error("The name must be specified when reading an archive from stdin.", _parser)
+        if input_path == "-" and sys.stdin.isatty():
+            raise_error("Refusing to read the torrent's data from a terminal.", _parser)
+        if input_path != "-" and not os.path.isfile(input_path):
+            raise_error("'%s' is not a file." % input_path, _parser)
+        if strip_components < 0:
+            raise_error("The number of components to strip must not be negative.", _parser)
+        try:
+            archive_reader = ArchiveReader(input_path, strip_components)
+        except (IOError, ArchiveReader.InvalidArchiveError) as exc:
+            raise_error("Cannot read archive: %s" % exc, _parser)
+    elif input_path == "-":
+        if piece_length <= 0 or not name:
+            raise_error("The piece length and the name must be specified when reading from stdin.", _parser)
+        if watch or resume or reuse_from:
+            raise_error("Reading from stdin cannot be used together with watch, resume or reuse.", _parser)
+        if sys.stdin.isatty():
+            raise_error("Refusing to read the torrent's data from a terminal.", _parser)
+        if tee and os.path.exists(tee) and not force:
+            raise_error("'%s' does already exist, and force flag is not set." % tee, _parser)
+    elif not os.path.isfile(input_path) and not os.path.isdir(input_path):
+        raise_error("'%s' neither is a file nor a directory." % input_path, _parser)
+    if tee and (input_path != "-" or archive):
+        raise_error("Copying the data (tee) is only possible when reading a single file from stdin.", _parser)
+
+    # Evaluate / apply the tracker abbreviations, remove duplicates, validate and resolve bestN shortcuts.
+    trackers = process_trackers(trackers, config, force, _parser, interactive)
+
+    # Validate number of threads.
+    if threads is not None and threads <= 0:
+        raise_error("Number of threads must be positive.", _parser)
+    if readers_per_device <= 0:
+        raise_error("Number of readers per device must be positive.", _parser)
+    if prefetch_files < 0:
+        raise_error("Number of files to prefetch must not be negative.", _parser)
+
+    # Disallow DHT bootstrap nodes for private torrents.
+    if nodes and private:
+        raise_error(
+            "DHT bootstrap nodes cannot be specified for a private torrent. Private torrents do not support DHT.",
+            _parser,
+        )
+
+    # Validate DHT bootstrap nodes.
+    parsed_nodes = parse_nodes(nodes, force, _parser, interactive)
+
+    # Parse and validate excluded paths.
+    excluded_paths = set([os.path.normcase(os.path.abspath(path)) for path in exclude])
+
+    # Parse exclude patterns.
+    excluded_regexps = set(re.compile(regexp) for regexp in exclude_pattern)
+    excluded_regexps |= set(re.compile(regexp, re.IGNORECASE) for regexp in exclude_pattern_ci)
+
+    # Warn the user if he attempts to exclude any paths when creating a torrent for a single file (makes no sense).
+    if os.path.isfile(input_path) and not archive and (len(excluded_paths) > 0 or len(excluded_regexps) > 0):
+        print(
+            "Warning: Excluding paths is not possible when creating a torrent for a single file.",
+            file=sys.stderr,
+        )
+
+    # Warn the user if he attempts to exclude a specific path, that does not even exist.
+    for path in excluded_paths:
+        if not os.path.exists(path):
+            print(
+                "Warning: You're excluding a path that does not exist: '%s'" % path,
+                file=sys.stderr,
+            )
+
+    # The files of a folder can be given by a file list instead of scanning the folder.
+    file_list = None
+    if files_from is not None:
+        if index is not None or http_source is not None or archive or not os.path.isdir(input_path):
+            raise_error("A file list can only be used for a folder.", _parser)
+        if watch:
+            raise_error("A file list cannot be used together with watch.", _parser)
+        try:
+            file_list = read_file_list(files_from, input_path, excluded_paths, excluded_regexps)
+        except (IOError, ValueError) as exc:
+            raise_error("Cannot read the file list '%s': %s" % (files_from, exc), _parser)
+
+    # The torrent can be composed from local files and directories, which are mapped to their paths in the torrent.
+    layout_files = None
+    layout_sources = None
+    if maps or layout:
+        try:
+            layout_files, layout_name = load_layout(maps, layout, excluded_paths, excluded_regexps)
+        except (IOError, ValueError) as exc:
+            raise_error("Cannot load the layout: %s" % exc, _parser)
+        if not name and not layout_name:
+            raise_error("The name cannot be derived from the layout and must be specified.", _parser)
+        name = name or layout_name
+        layout_sources = [source for _, source in layout_files]
+
+    # Validate the source tag.
+    if source is not None:
+        source = validate_source(source, _parser)
+
+    # Load and validate the variants. Each variant overrides some of the options above.
+    try:
+        loaded_variants = load_variants(variants, variants_file)
+    except (IOError, ValueError) as exc:
+        raise_error("Cannot load variants: %s" % exc, _parser)
+    variant_options: List[Tuple[Optional[str], Dict[str, Any]]] = []
+    for variant in loaded_variants:
+        overrides: Dict[str, Any] = {}
+        if "trackers" in variant:
+            overrides["trackers"] = process_trackers(variant["trackers"], config, force, _parser, interactive)
+        if "nodes" in variant:
+            overrides["nodes"] = parse_nodes(variant["nodes"], force, _parser, interactive)
+        if "webseeds" in variant:
+            overrides["webseeds"] = variant["webseeds"]
+        if "private" in variant:
+            overrides["private"] = variant["private"]
+        if "source" in variant:
+            overrides["source"] = validate_source(variant["source"], _parser) if variant["source"] else None
+        if "comment" in variant:
+            overrides["comment"] = variant["comment"]
+        if overrides.get("nodes", parsed_nodes) and overrides.get("private", private):
+            raise_error(
+                "DHT bootstrap nodes cannot be specified for a private torrent (variant %s)." % variant["label"],
+                _parser)
+        variant_options.append((variant["label"], overrides))
+    if not variant_options:
+        variant_options = [(None, {})]
+
+    # Validate the creation date.
+    if date is not None and date is not False and date < 0 and date not in (-1, -2):
+        raise_error(
+            "Invalid date: Negative timestamp values are not possible (use None for current date "
+            "or False to disable storing a creation date altogether).",
+            _parser,
+        )
+
+    # Validate the name.
+    # By default this is the name of directory or file the torrent is being created for.
+    if name:
+        name = validate_name(name, _parser)
+        torrent_name = name
+    elif index is not None:
+        torrent_name = index.name
+    elif http_source is not None:
+        torrent_name = url_name
+    elif archive:
+        torrent_name = ArchiveReader.get_name(input_path)
+    else:
+        torrent_name = os.path.basename(os.path.abspath(input_path))
+
+    # With multiple piece lengths and/or variants, the piece length and the variant's label are added to the names of
+    # the torrent files.
+    suffixes = [
+        piece_length_suffix + variant_suffix
+        for piece_length_suffix in ([".p%d" % length for length in piece_lengths] if len(piece_lengths) > 1 else [""])
+        for variant_suffix in ["." + label if label is not None else "" for label, _ in variant_options]
+    ]
+
+    # Respect the custom output location.
+    if not output:
+        # Use current directory.
+        output_paths = [torrent_name + suffix + ".torrent" for suffix in suffixes]
+
+    else:
+        # Use the directory or filename specified by the user.
+        output = os.path.abspath(output)
+
+        # The user specified an output directory:
+        if os.path.isdir(output):
+            output_paths = [os.path.join(output, torrent_name + suffix + ".torrent") for suffix in suffixes]
+            for output_path in output_paths:
+                if os.path.isfile(output_path):
+                    if not force and os.path.exists(output_path):
+                        if interactive:
+                            if "yes" != input("'%s' does already exist. Overwrite? yes/no: " % output_path):
+                                raise_error("Aborted.", _parser)
+                        else:
+                            raise_error("The specified path exists already, and force flag is not set.", _parser)
+
+        # The user specified a filename:
+        else:
+            root, extension = os.path.splitext(output)
+            output_paths = [root + suffix + extension for suffix in suffixes]
+
+            # Is there already a file with this path? -> overwrite?!
+            for output_path in output_paths:
+                if os.path.isfile(output_path):
+                    if not force and os.path.exists(output_path):
+                        if interactive:
+                            if "yes" != input("'%s' does already exist. Overwrite? yes/no: " % output_path):
+                                raise_error("Aborted.", _parser)
+                        else:
+                            raise_error("The specified file exists already, and force flag is not set.", _parser)
+
+    output_path = output_paths[0]
+
+    def write_torrents(infos: List[Dict[str, Any]], torrent_size: int) -> List[Dict[str, Any]]:
+        """
+        Finish the metainfo dictionaries for the info dictionaries (one per piece length) and the variants, write the
+        torrent files and print the summaries. Return the metainfo dictionaries.
+        """
+        metainfos = []
+        torrent_paths = iter(output_paths)
+        for info in infos:
+            assert len(info["pieces"]) % 20 == 0, "len(pieces) not a multiple of 20"
+
+            for label, overrides in variant_options:
+                options = {
+                    "trackers": trackers,
+                    "nodes": parsed_nodes,
+                    "webseeds": webseeds,
+                    "private": private,
+                    "source": source,
+                    "comment": comment,
+                }
+                options.update(overrides)
+
+                # Finish the metainfo dictionary. The info dictionary is copied, as it is shared by the variants.
+                metainfo = _finish_metainfo(
+                    dict(info),
+                    name=name,
+                    date=date,
+                    created_by=not no_created_by,
+                    advertise=config.advertise,
+                    **options,
+                )
+                metainfos.append(metainfo)
+
+                # Bencode the metainfo dictionary and write the torrent file.
+                write_torrent_file(metainfo, next(torrent_paths))
+
+                # If the quiet option has been set, we don't print a summary.
+                if not quiet:
+                    if label is None:
+                        print_summary(metainfo, torrent_size)
+                    else:
+                        title = "Successfully created torrent (variant %s):" % label
+                        print_summary(metainfo, torrent_size, title=title)
+                        print("  Info hash:           %s" % get_info_hash(metainfo))
+
+        return metainfos
+
+    # Create the torrent from the index without touching the data, or from the data streamed through stdin.
+    if index is not None or http_source is not None or (input_path == "-" and not archive):
+        if index is not None:
+            with index:
+                info = index.get_info()
+        elif http_source is not None:
+            torrent_size = sum(size for _, _, size in url_files)
+            if piece_length == 0:
+                piece_length = calculate_piece_length(torrent_size) // KIB
+            printv("Fetching %d KiB from %d URL/s..." % (torrent_size / KIB, len(url_files)))
+            with http_source:
+                try:
+                    info = create_http_info(http_source, url_files, piece_length * KIB, url_name, url_single_file,
+                                            include_md5)
+                except HttpSource.HttpError as exc:
+                    raise_error(str(exc), _parser)
+            info["piece length"] = piece_length * KIB
+
+            # The origin serves the files, so it can be used as webseed.
+            if auto_webseed:
+                webseed = get_webseed_url(url_files, url_name, url_single_file)
+                if webseed is None or (name and name != url_name and not url_single_file):
+                    printv("The URLs cannot be used as webseed.")
+                elif webseed not in webseeds:
+                    webseeds = webseeds + [webseed]
+        else:
+            threads, _ = get_hash_configuration(config, piece_length * KIB, threads, engine)
+            try:
+                if tee:
+                    with open(tee, "wb") as tee_fh:
+                        info = create_stream_info(sys.stdin.buffer, piece_length * KIB, torrent_name, include_md5,
+                                                  threads, tee_fh)
+                else:
+                    info = create_stream_info(sys.stdin.buffer, piece_length * KIB, torrent_name, include_md5, threads)
+            except IOError as exc:
+                raise_error("Could not read or copy the data: %s" % exc, _parser)
+
+            if info["length"] == 0:
+                raise_error("Can't create torrent for 0 byte data.", _parser)
+            info["piece length"] = piece_length * KIB
+
+        torrent_size = info["length"] if "length" in info else sum(f["length"] for f in info["files"])
+        metainfo = write_torrents([info], torrent_size)[0]
+
+        if export_index:
+            try:
+                PieceIndex.write(export_index, metainfo["info"])
+            except IOError as exc:
+                raise_error("Could not write the index: %s" % exc, _parser)
+            printv("Wrote index '%s'." % export_index)
+
+        return metainfo
+
+    # In watch mode, the torrent file and its checkpoint must not become part of the watched data.
+    watcher = None
+    if watch:
+        for torrent_path in output_paths:
+            excluded_paths.add(os.path.normcase(os.path.abspath(torrent_path)))
+        excluded_paths.add(os.path.normcase(os.path.abspath(output_path + ".checkpoint")))
+        watcher = DirectoryWatcher(input_path)
+
+    # The file fingerprints and the info dict of the previous run in watch mode.
+    previous_fingerprints: Optional[List[List[Any]]] = None
+    previous_info: Optional[Dict[str, Any]] = None
+
+    requested_piece_length = piece_length
+    requested_threads = threads
+    requested_engine = engine
+
+    # With a fixed piece length, the files of a directory can be hashed while the directory is still being scanned.
+    # This is done by hashlib (see create_streamed_multi_file_info), and only if everything else works without
+    # knowing the files in advance.
+    streaming = (hash_while_scanning and requested_piece_length > 0 and archive_reader is None and file_list is None
+                 and layout_files is None and os.path.isdir(input_path) and watcher is None and not resume
+                 and not reuse_from and not checksums and not include_sha1 and len(piece_lengths) == 1
+                 and read_order == "torrent" and readers_per_device == 1)
+    if streaming:
+        _, streaming_engine = get_hash_configuration(config, requested_piece_length * KIB, threads, engine)
+        streaming = HASH_ENGINES[streaming_engine].hash_pieces is None
+    if hash_while_scanning and not streaming:
+        print(
+            "Warning: Hashing while scanning is not possible with these options. Scanning the files first.",
+            file=sys.stderr,
+        )
+
+    while True:
+        if watcher is not None and previous_fingerprints is not None:
+            printv("Watching '%s' for changes..." % clean_str_for_console(input_path))
+            watcher.wait(watch_debounce)
+
+        # Get the torrent's files and calculate its size.
+        printv("Scanning and hashing input file/s..." if streaming else "Scanning size of input file/s...")
+        if streaming:
+            # The files are found while hashing.
+            fingerprints = []
+        elif file_list is not None:
+            # Only the files whose sizes are not given are looked at.
+            try:
+                fingerprints = [
+                    fingerprint if fingerprint[1] is not None else get_file_fingerprints(input_path, fingerprint[:1])[0]
+                    for fingerprint in file_list
+                ]
+            except OSError as exc:
+                raise_error("Cannot read the file list '%s': %s" % (files_from, exc), _parser)
+            torrent_files = [file for file, _, _ in fingerprints]
+        elif layout_files is not None:
+            fingerprints = []
+            try:
+                for file, layout_source in layout_files:
+                    st = os.stat(layout_source)
+                    fingerprints.append([file, st.st_size, st.st_mtime_ns])
+            except OSError as exc:
+                raise_error("Cannot load the layout: %s" % exc, _parser)
+            torrent_files = [file for file, _ in layout_files]
+        elif archive_reader is not None:
+            # The archive is considered to be extracted next to it, into a directory named like the torrent.
+            extract_directory = os.path.join(os.path.dirname(os.path.abspath(input_path)), torrent_name)
+            try:
+                archive_files = archive_reader.get_files(extract_directory,
+                                                         excluded_paths=excluded_paths,
+                                                         excluded_regexps=excluded_regexps)
+            except (IOError, tarfile.TarError, zipfile.BadZipFile, ArchiveReader.InvalidArchiveError) as exc:
+                archive_reader.close()
+                raise_error("Cannot read archive: %s" % exc, _parser)
+            fingerprints = [[file, length, None] for file, length in archive_files]
+        elif os.path.isfile(input_path):
+            fingerprints = get_file_fingerprints(os.path.dirname(input_path), [os.path.basename(input_path)])
+        else:
+            torrent_files = get_files_in_directory(input_path,
+                                                   excluded_paths=excluded_paths,
+                                                   excluded_regexps=excluded_regexps)
+            fingerprints = get_file_fingerprints(input_path, torrent_files)
+        torrent_size = sum(length for _, length, _ in fingerprints)
+
+        if previous_fingerprints is not None and fingerprints == previous_fingerprints:
+            printv("No relevant changes.")
+            continue
+
+        # Torrents for 0 byte data can't be created.
+        if torrent_size == 0 and not streaming:
+            print("Error: Can't create torrent for 0 byte data.", file=sys.stderr)
+            print("Check your files and exclusions!", file=sys.stderr)
+            if watcher is None or previous_fingerprints is None:
+                sys.exit(1)
+            previous_fingerprints = fingerprints
+            continue
+
+        # Calculate or parse the piece size.
+        if not streaming:
+            printv("Total size of input file/s: %d KiB" % torrent_size)
+        if requested_piece_length == 0:
+            piece_length = calculate_piece_length(torrent_size)
+            printv("Calculated piece length:    %d KiB" % (piece_length / KIB))
+        elif requested_piece_length > 0:
+            piece_length = requested_piece_length * KIB
+        else:
+            raise_error("Invalid piece size: '%d'" % requested_piece_length, _parser)
+
+        if not streaming:
+            for length in piece_lengths if len(piece_lengths) > 1 else [piece_length // KIB]:
+                printv("Torrent will have %d pieces." % int(math.ceil(torrent_size / (length * KIB))))
+
+        threads, engine = get_hash_configuration(config, piece_length, requested_threads, requested_engine)
+        printv("Hashing with %s and %d thread/s." % (engine, threads))
+
+        # Re-use the piece hashes of the previous run in watch mode.
+        known = None
+        if (previous_info is not None and previous_fingerprints is not None
+                and previous_info["piece length"] == piece_length):
+            known = KnownHashes.find(previous_fingerprints, previous_info["pieces"], fingerprints, piece_length,
+                                     [f.get("md5sum") for f in previous_info.get("files", [previous_info])])
+
+        # Re-use the piece hashes of an existing torrent.
+        if reuse_from and previous_info is None:
+            try:
+                known = get_reusable_hashes(reuse_from, fingerprints, piece_length, torrent_name,
+                                            os.path.isfile(input_path), reuse_trust)
+            except (IOError, BencodeDecodeError, KeyError, TypeError, ValueError) as exc:
+                raise_error("Cannot re-use piece hashes from '%s': %s" % (reuse_from, exc), _parser)
+
+            if known is not None and reuse_verify > 0:
+                if os.path.isfile(input_path):
+                    paths = [input_path]
+                elif layout_sources is not None:
+                    paths = layout_sources
+                else:
+                    paths = [os.path.join(input_path, file) for file in torrent_files]  # type:ignore
+                if not verify_known_hashes(known, paths, [length for _, length, _ in fingerprints], piece_length,
+                                           reuse_verify):
+                    print("Warning: the spot-check of the piece hashes from '%s' failed. Hashing everything." %
+                          reuse_from,
+                          file=sys.stderr)
+                    known = None
+
+        # Set up the checkpoint sidecar file, which allows to resume an interrupted run.
+        checkpoint = None
+        if ((resume or checkpoint_interval > 0) and archive_reader is None and layout_files is None
+                and len(piece_lengths) == 1 and not streaming and read_order == "torrent"
+                and (resume or HASH_ENGINES[engine].hash_pieces is None)):
+            checkpoint = Checkpoint(output_path + ".checkpoint",
+                                    input_path,
+                                    piece_length,
+                                    include_md5,
+                                    fingerprints,
+                                    interval=checkpoint_interval if checkpoint_interval > 0 else math.inf)
+
+            if resume and previous_fingerprints is None:
+                try:
+                    if checkpoint.load():
+                        printv("Loaded checkpoint '%s' (%d pieces done)." % (checkpoint.path, checkpoint.pieces_done))
+                        known = checkpoint.get_known_hashes()
+                    else:
+                        printv("No checkpoint found at '%s', starting from scratch." % checkpoint.path)
+                except Checkpoint.InvalidCheckpointError as exc:
+                    raise_error("%s\nDelete the checkpoint or run without --resume." % exc, _parser)
+
+        # ##########################################
+        # CALCULATE/SET THE FOLLOWING METAINFO DATA:
+        # - info
+        #   - pieces (concatenated 20 byte sha1 hashes of all the data)
+        #   - files (if multiple files)
+        #   - length and md5sum (if single file)
+        #   - name (may be overwritten later by the --name option)
+
+        # The checksums of the files are calculated along with the pieces.
+        file_checksums = None
+        if checksums or include_sha1:
+            file_checksums = FileChecksums(remove_duplicates(checksums + (["sha1"] if include_sha1 else [])),
+                                           len(fingerprints))
+
+        # The reads from each device are recorded for the statistics.
+        read_stats = ReadStats() if stats or verbose else None
+
+        # Do the main work now.
+        # -> prepare the metainfo dictionary (or one for each piece length).
+        infos: List[Dict[str, Any]] = []
+        info: Optional[Dict[str, Any]] = None
+        try:
+            if len(piece_lengths) > 1:
+                infos = create_infos_for_piece_lengths(
+                    input_path,
+                    [file for file, _, _ in fingerprints],
+                    [length for _, length, _ in fingerprints],
+                    [length * KIB for length in piece_lengths],
+                    torrent_name,
+                    include_md5,
+                    threads=threads,
+                    archive_reader=archive_reader,
+                    file_checksums=file_checksums,
+                    sources=layout_sources,
+                )
+            elif archive_reader is not None:
+                info = create_archive_info(
+                    archive_reader,
+                    [file for file, _, _ in fingerprints],
+                    [length for _, length, _ in fingerprints],
+                    piece_length,
+                    torrent_name,
+                    include_md5,
+                    threads=threads,
+                    file_checksums=file_checksums,
+                )
+            elif streaming:
+                info, fingerprints = create_streamed_multi_file_info(input_path,
+                                                                     piece_length,
+                                                                     include_md5,
+                                                                     threads=threads,
+                                                                     excluded_paths=excluded_paths,
+                                                                     excluded_regexps=excluded_regexps,
+                                                                     read_stats=read_stats,
+                                                                     prefetch_files=prefetch_files)
+            elif os.path.isfile(input_path):
+                info = create_single_file_info(input_path,
+                                               piece_length,
+                                               include_md5,
+                                               threads=threads,
+                                               checkpoint=checkpoint,
+                                               known=known,
+                                               file_checksums=file_checksums,
+                                               read_stats=read_stats,
+                                               engine=engine)
+            else:
+                info = create_multi_file_info(
+                    input_path,
+                    torrent_files,  # type:ignore
+                    piece_length,
+                    include_md5,
+                    threads=threads,
+                    checkpoint=checkpoint,
+                    known=known,
+                    lengths=[length for _, length, _ in fingerprints],
+                    file_checksums=file_checksums,
+                    read_order=read_order,
+                    readers_per_device=readers_per_device,
+                    read_stats=read_stats,
+                    prefetch_files=prefetch_files,
+                    engine=engine,
+                    sources=layout_sources,
+                    stat_files=file_list is None,
+                )
+        except KeyboardInterrupt:
+            if checkpoint is not None and checkpoint.pieces_done > 0:
+                print("\nSaved progress to '%s'. Use --resume to continue." % checkpoint.path, file=sys.stderr)
+            raise
+        except IOError as exc:
+            if file_list is None and layout_files is None:
+                raise
+            # The files of a file list or a layout are not checked before hashing.
+            raise_error("Could not read the files: %s" % exc, _parser)
+        finally:
+            if archive_reader is not None:
+                archive_reader.close()
+            if file_checksums is not None:
+                file_checksums.close()
+
+        if checkpoint is not None:
+            checkpoint.remove()
+
+        # The total size is known after hashing the files that were found by the scan.
+        if streaming:
+            torrent_size = sum(length for _, length, _ in fingerprints)
+            if torrent_size == 0:
+                print("Error: Can't create torrent for 0 byte data.", file=sys.stderr)
+                print("Check your files and exclusions!", file=sys.stderr)
+                sys.exit(1)
+            printv("Total size of input file/s: %d KiB" % torrent_size)
+            printv("Torrent has %d pieces." % int(math.ceil(torrent_size / piece_length)))
+
+        hashing_time = time.monotonic() - read_stats.start if read_stats is not None else 0.0
+        if read_stats is not None and not stats:
+            for line in read_stats.get_lines():
+                printv(line)
+
+        if info is not None:
+            infos = [info]
+            info["piece length"] = piece_length
+
+        # Write the checksum files (e.g. SHA256SUMS). The paths are relative to the torrent's root directory.
+        if file_checksums is not None and checksums:
+            try:
+                checksum_files = file_checksums.write_files(checksums_out or os.path.dirname(output_path) or ".",
+                                                            torrent_name, [file for file, _, _ in fingerprints],
+                                                            remove_duplicates(checksums))
+            except IOError as exc:
+                raise_error("Could not write the checksum files: %s" % exc, _parser)
+            printv("Wrote checksum files: %s" % ", ".join(checksum_files))
+
+        # Include the sha1 hashes of the files (BEP 47), in the file dictionaries or the info dictionary.
+        if file_checksums is not None and include_sha1:
+            for info in infos:
+                for fdict, sha1sum in zip(info.get("files", [info]), file_checksums.get_checksums("sha1")):
+                    fdict["sha1"] = bytes.fromhex(sha1sum)
+        previous_info = dict(infos[0])
+        previous_fingerprints = fingerprints
+
+        metainfo = write_torrents(infos, torrent_size)[0]
+
+        if stats:
+            assert read_stats is not None
+            print("Statistics:")
+            print("  Hashing time:        %.1f s" % hashing_time)
+            if hashing_time > 0:
+                print("  Throughput:          %.1f MiB/s" % (torrent_size / MIB / hashing_time))
+            for line in read_stats.get_lines():
+                print("  " + line)
+
+        if export_index:
+            try:
+                PieceIndex.write(export_index, metainfo["info"])
+            except IOError as exc:
+                raise_error("Could not write the index: %s" % exc, _parser)
+            printv("Wrote index '%s'." % export_index)
+
+        if watcher is None:
+            break
+
+        # Run the hook command after each update in watch mode.
+        if watch_hook:
+            for torrent_path in output_paths:
+                run_hook(watch_hook, torrent_path)
+
+    return metainfo
+
+
+def _finish_metainfo(
+    info: Dict[str, Any],
+    trackers: List[str],
+    nodes: List[List[Any]],
+    webseeds: List[str],
+    private: bool,
+    source: Optional[str],
+    name: Optional[str],
+    date: Optional[Union[Literal[False], int]],
+    comment: Optional[str],
+    created_by: bool,
+    advertise: Optional[bool],
+) -> Dict[str, Any]:
+    """
+    Return the complete metainfo dictionary for the given info dictionary.
+
+    All of the given options must have been validated by the caller already.
+    """
+    # ###########################
+    # FINISH METAINFO DICTIONARY:
+    # - info
+    #   - name (eventually overwrite)
+    #   - private
+    #   - source
+    # - announce (if at least one tracker was specified)
+    # - announce-list (if multiple trackers were specified)
+    # - nodes (if at least one DHT bootstrap node was specified)
+    # - creation date (may be disabled as well)
+    # - created by
+    # - comment (may be disabled as well)
+
+    # Finish sub-dict "info".
+    if private:
+        info["private"] = 1
+
+    if source is not None:
+        info["source"] = source
+
+    # Construct outer metainfo dict, which contains the torrent's whole information.
+    metainfo: Dict[str, Any] = {"info": info}
+    if trackers:
+        metainfo["announce"] = trackers[0]
+
+    # Make "announce-list" field, if there are multiple trackers.
+    if len(trackers) > 1:
+        metainfo["announce-list"] = [[tracker] for tracker in trackers]
+
+    # Set DHT bootstrap nodes.
+    if nodes:
+        metainfo["nodes"] = nodes
+
+    # Set webseeds (url-list).
+    if webseeds:
+        metainfo["url-list"] = webseeds
+
+    # Set "creation date".
+    # The user may specify a custom creation date. He may also decide not to include the creation date field at all.
+    if date is None or date == -1:
+        # use current time
+        metainfo["creation date"] = int(time.time())
+    elif date >= 0 and not isinstance(date, bool):
+        # use specified timestamp directly
+        metainfo["creation date"] = date
+
+    # Add the "created by" field.
+    if created_by:
+        metainfo["created by"] = "py3createtorrent v%s" % __version__
+
+    # Add user's comment or advertise py3createtorrent (unless this behaviour has been disabled by the user).
+    # The user may also decide not to include the comment field at all by specifying an empty comment.
+    if comment is not None:
+        if len(comment) > 0:
+            metainfo["comment"] = comment
+    elif advertise:
+        metainfo["comment"] = "created with " + metainfo["created by"]
+
+    # Add the name field.
+    # By default this is the name of directory or file the torrent is being created for.
+    if name:
+        metainfo["info"]["name"] = name
+
+    return metainfo
+
+
+def write_torrent_file(metainfo: Dict[str, Any], output_path: str) -> None:
+    """
+    Bencode the metainfo dictionary and write it to output_path.
+
+    The file is written atomically: readers either see the previous file or the complete new one.
+    """
+    tmp_path = output_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as fh:
+            fh.write(bencode(metainfo))
+        os.replace(tmp_path, output_path)
+    except IOError as exc:
+        print("IOError: " + str(exc), file=sys.stderr)
+        print(
+            "Could not write the torrent file. Check torrent name and your privileges.",
+            file=sys.stderr,
+        )
+        print("Absolute output path: '%s'" % os.path.abspath(output_path), file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        # Properly handle KeyboardInterrupts.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def print_summary(metainfo: Dict[str, Any], torrent_size: int, title: str = "Successfully created torrent:") -> None:
+    print(title)
+
+    # Create the list of backup trackers.
+    backup_trackers = ""
+    if "announce-list" in metainfo:
+        _backup_trackers = metainfo["announce-list"][1:]
+        _backup_trackers.sort(key=lambda x: x[0].lower())
+
+        for tracker in _backup_trackers:
+            backup_trackers += "    " + tracker[0] + "\n"
+        backup_trackers = backup_trackers.rstrip()
+    else:
+        backup_trackers = "    (none)"
+
+    # Calculate piece count.
+    piece_length = metainfo["info"]["piece length"]
+    piece_count = math.ceil(torrent_size / piece_length)
+
+    # Make torrent size human readable.
+    if torrent_size > 10 * MIB:
+        size = "%.2f MiB" % (torrent_size / MIB)
+    else:
+        size = "%d KiB" % (torrent_size / KIB)
+
+    # Make creation date human readable (ISO format).
+    if "creation date" in metainfo:
+        creation_date = datetime.datetime.fromtimestamp(metainfo["creation date"]).isoformat(" ")
+    else:
+        creation_date = "(none)"
+
+    # Now actually print the summary table.
+    print("  Name:                %s\n"
+          "  Size:                %s\n"
+          "  Pieces:              %d x %d KiB\n"
+          "  Comment:             %s\n"
+          "  Private:             %s\n"
+          "  Creation date:       %s\n"
+          "  DHT bootstrap nodes: %s\n"
+          "  Webseeds:            %s\n"
+          "  Primary tracker:     %s\n"
+          "  Backup trackers:\n"
+          "%s" % (
+              metainfo["info"]["name"],
+              size,
+              piece_count,
+              piece_length / KIB,
+              metainfo["comment"] if "comment" in metainfo else "(none)",
+              "yes" if metainfo["info"].get("private") else "no",
+              creation_date,
+              metainfo["nodes"] if "nodes" in metainfo else "(none)",
+              metainfo["url-list"] if "url-list" in metainfo else "(none)",
+              metainfo["announce"] if "announce" in metainfo else "(none)",
+              backup_trackers,
+          ))
+
+
+def run_hook(command: str, torrent_path: str) -> None:
+    """
+    Run the given shell command after a torrent has been written.
+
+    The path to the torrent file is passed in the environment variable PY3CREATETORRENT_TORRENT.
+    """
+    env = dict(os.environ)
+    env["PY3CREATETORRENT_TORRENT"] = os.path.abspath(torrent_path)
+
+    printv("Running hook: %s" % command)
+    result = subprocess.run(command, shell=True, env=env)
+    if result.returncode != 0:
+        print("Warning: hook command exited with code %d: %s" % (result.returncode, command), file=sys.stderr)
+
+
+def lower_priority(nice: int = 0, ionice: Optional[str] = None) -> None:
+    """
+    Lower the CPU priority of the process by nice (see os.nice) and set its I/O scheduling class with the ionice tool
+    (Linux only), given as CLASS[:LEVEL] like "idle" or "best-effort:7". This also applies to threads that are
+    started afterwards.
+
+    Raise OSError if this is not possible.
+    """
+    if nice:
+        if not hasattr(os, "nice"):
+            raise OSError("nice is not supported on this platform")
+        os.nice(nice)  # type:ignore
+
+    if ionice:
+        if not sys.platform.startswith("linux") or shutil.which("ionice") is None:
+            raise OSError("ionice is not available")
+        io_class, _, level = ionice.partition(":")
+        cmd = ["ionice", "-c", io_class] + (["-n", level] if level else []) + ["-p", str(os.getpid())]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            raise OSError("ionice failed: %s" % result.stderr.strip())
+
+
+def _decode_strings(value: Any, key: Optional[str] = None) -> Any:
+    """
+    Decode the byte strings of a bdecoded structure to str where this is possible without loss.
+
+    Byte strings that are not valid UTF-8 (and the binary "pieces") are kept as bytes, so that bencoding the result
+    yields the original data.
+    """
+    if isinstance(value, dict):
+        return {_decode_strings(k): _decode_strings(v, k) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_decode_strings(v, key) for v in value]
+    elif isinstance(value, bytes) and key != "pieces":
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return value
+    return value
+
+
+def read_torrent_file(path: str) -> Dict[str, Any]:
+    """Read and decode the given torrent file. Strings are decoded where possible (see _decode_strings)."""
+    with open(path, "rb") as fh:
+        return _decode_strings(bdecode(fh.read()))
+
+
+def get_info_hash(metainfo: Dict[str, Any]) -> str:
+    """Return the (v1) info hash of the given metainfo dictionary as hex string."""
+    return hashlib.sha1(bencode(metainfo["info"])).hexdigest()
+
+
+def edit_torrent(
+    torrent: str,
+    output: Optional[str] = None,
+    trackers: Optional[List[str]] = None,
+    nodes: Optional[List[str]] = None,
+    webseeds: Optional[List[str]] = None,
+    comment: Optional[str] = None,
+    date: Optional[Union[Literal[False], int]] = None,
+    source: Optional[str] = None,
+    private: Optional[bool] = None,
+    name: Optional[str] = None,
+    force: bool = False,
+    verbose: bool = False,
+    quiet: bool = False,
+    config_path: Optional[str] = None,
+    _parser: Optional[argparse.ArgumentParser] = None,
+) -> Dict[str, Any]:
+    """Edits an existing torrent file without rehashing its data
+
+    All options default to None, which means that the corresponding field is left unchanged.
+
+    Parameters
+    ----------
+    torrent
+        The torrent file to edit
+    output, optional
+        Set the filename of the edited torrent file. By default None, which means the torrent file is replaced
+    trackers, optional
+        Replace the tracker (announce) URLs, [] removes all trackers. Tracker abbreviations and bestN are supported.
+    nodes, optional
+        Replace the DHT bootstrap nodes, [] removes all nodes
+    webseeds, optional
+        Replace the webseeds (url-list), [] removes all webseeds
+    comment, optional
+        Replace the comment, "" removes the comment
+    date, optional
+        Replace the creation date with a unix timestamp, -1 means current time, -2 or False removes the creation date
+    source, optional
+        Replace the source tag, "" removes the source tag. This changes the info hash!
+    private, optional
+        Set or clear the private flag. This changes the info hash!
+    name, optional
+        Replace the name of the torrent. This changes the info hash!
+    force, optional
+        Overwrite existing .torrent files without asking and disable the tracker and node validations, by default False
+    verbose, optional
+        Enable output of diagnostic information, by default False
+    quiet, optional
+        Suppress output, e.g. don't print summary, by default False
+    config, optional
+        Specify location of config file. By default None, which means <home directiory>/.py3createtorrent.cfg
+    _parser, optional
+        DO NOT TOUCH THIS, its just used for the function to know if you are using it directly or as a cli tool. For interactivity and different error handeling.
+    """
+
+    global VERBOSE
+    VERBOSE = verbose
+
+    if verbose and quiet:
+        raise_error("Being verbose and quiet exclude each other.", _parser)
+
+    if not os.path.isfile(torrent):
+        raise_error("'%s' is not a file." % torrent, _parser)
+
+    config = load_config(config_path, _parser=_parser)
+
+    with open(torrent, "rb") as fh:
+        raw = fh.read()
+    try:
+        metainfo = _decode_strings(bdecode(raw))
+    except BencodeDecodeError:
+        raise_error("'%s' is not a valid torrent file." % torrent, _parser)
+    if not isinstance(metainfo, dict) or not isinstance(metainfo.get("info"), dict):
+        raise_error("'%s' is not a valid torrent file." % torrent, _parser)
+
+    if bencode(metainfo) != raw:
+        print("Warning: '%s' is not encoded canonically. Rewriting it changes its info hash." % torrent,
+              file=sys.stderr)
+
+    info = metainfo["info"]
+    old_info_hash = get_info_hash(metainfo)
+
+    if trackers is not None:
+        trackers = process_trackers(trackers, config, force, _parser)
+        metainfo.pop("announce", None)
+        metainfo.pop("announce-list", None)
+        if trackers:
+            metainfo["announce"] = trackers[0]
+        if len(trackers) > 1:
+            metainfo["announce-list"] = [[tracker] for tracker in trackers]
+
+    if private is not None:
+        if private:
+            info["private"] = 1
+        else:
+            info.pop("private", None)
+
+    if nodes is not None:
+        parsed_nodes = parse_nodes(nodes, force, _parser)
+        metainfo.pop("nodes", None)
+        if parsed_nodes:
+            metainfo["nodes"] = parsed_nodes
+
+    # Disallow DHT bootstrap nodes for private torrents.
+    if info.get("private") and metainfo.get("nodes"):
+        raise_error(
+            "DHT bootstrap nodes cannot be specified for a private torrent. Private torrents do not support DHT.",
+            _parser,
+        )
+
+    if webseeds is not None:
+        metainfo.pop("url-list", None)
+        if webseeds:
+            metainfo["url-list"] = webseeds
+
+    if comment is not None:
+        metainfo.pop("comment", None)
+        if comment:
+            metainfo["comment"] = comment
+
+    if source is not None:
+        info.pop("source", None)
+        if source:
+            info["source"] = validate_source(source, _parser)
+
+    if name is not None:
+        info["name"] = validate_name(name, _parser)
+
+    if date is not None:
+        if date is False or date == -2:
+            metainfo.pop("creation date", None)
+        elif date == -1:
+            metainfo["creation date"] = int(time.time())
+        elif date >= 0 and not isinstance(date, bool):
+            metainfo["creation date"] = date
+        else:
+            raise_error(
+                "Invalid date: Negative timestamp values are not possible (use -1 for current date "
+                "or -2 to remove the creation date).",
+                _parser,
+            )
+
+    # Warn the user if the edit results in a different swarm.
+    new_info_hash = get_info_hash(metainfo)
+    if new_info_hash != old_info_hash:
+        print(
+            "Warning: the info hash has changed from %s to %s. The edited torrent belongs to a different swarm." %
+            (old_info_hash, new_info_hash),
+            file=sys.stderr,
+        )
+
+    # Replace the torrent file unless another output file has been specified.
+    output_path = torrent
+    if output:
+        output_path = os.path.abspath(output)
+        if os.path.isdir(output_path):
+            output_path = os.path.join(output_path, os.path.basename(torrent))
+        if os.path.isfile(output_path) and not os.path.samefile(output_path, torrent) and not force:
+            if _parser is not None:
+                if "yes" != input("'%s' does already exist. Overwrite? yes/no: " % output_path):
+                    raise_error("Aborted.", _parser)
+            else:
+                raise_error("The specified file exists already, and force flag is not set.")
+
+    write_torrent_file(metainfo, output_path)
+
+    if not quiet:
+        if "files" in info:
+            torrent_size = sum(f["length"] for f in info["files"])
+        else:
+            torrent_size = info["length"]
+        print_summary(metainfo, torrent_size, title="Successfully edited torrent:")
+        print("  Info hash:           %s" % new_info_hash)
+
+    return metainfo
+
+
+def _write_json(data: Dict[str, Any], path: str) -> None:
+    """Write data as JSON to path atomically."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_plan(path: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Load a plan written by plan_torrent.
+
+    Return the plan and its id (sha1 of its canonical JSON encoding), which is used to verify that shards have been
+    hashed for the same plan. Raise ValueError if the plan is invalid.
+    """
+    with open(path, "r", encoding="utf-8") as fh:
+        try:
+            plan = json.load(fh)
+        except ValueError:
+            raise ValueError("'%s' is not a valid plan" % path)
+
+    if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION:
+        raise ValueError("'%s' is not a valid plan or has an unsupported version" % path)
+
+    plan_id = hashlib.sha1(json.dumps(plan, sort_keys=True).encode("utf-8")).hexdigest()
+    return plan, plan_id
+
+
+def _get_shard_range(piece_count: int, shard: int, shard_count: int) -> Tuple[int, int]:
+    """Return the range of pieces (first piece, last piece + 1) of the given shard."""
+    return piece_count * shard // shard_count, piece_count * (shard + 1) // shard_count
+
+
+def plan_torrent(
+    path: str,
+    output: str,
+    piece_length: int = 0,
+    include_md5: bool = False,
+    exclude: List[str] = [],
+    exclude_pattern: List[str] = [],
+    exclude_pattern_ci: List[str] = [],
+    force: bool = False,
+    verbose: bool = False,
+    _parser: Optional[argparse.ArgumentParser] = None,
+) -> Dict[str, Any]:
+    """Scans a file or folder and writes a plan for hashing it in shards (on multiple machines)
+
+    The plan fixes the piece length, the md5 option and the files (in torrent order, with their sizes).
+
+    Parameters
+    ----------
+    path
+        File or folder for which to create a torrent
+    output
+        Path of the plan file
+    piece_length, optional
+        Piece size in KiB, by default 0, which means the piece size is calculated automatically
+    include_md5, optional
+        Include md5 sums in the torrent, by default False
+    exclude, optional
+        Exclude specific paths, by default []
+    exclude_pattern, optional
+        Exclude paths matching the regular expressions, by default []
+    exclude_pattern_ci, optional
+        Exclude paths matching the case-insensitive regular expressions, by default []
+    force, optional
+        Overwrite an existing plan without asking, by default False
+    verbose, optional
+        Enable output of diagnostic information, by default False
+    _parser, optional
+        DO NOT TOUCH THIS, its just used for the function to know if you are using it directly or as a cli tool.
+    """
+    global VERBOSE
+    VERBOSE = verbose
+
+    if os.path.isfile(path):
+        files = [[[os.path.basename(path)], os.path.getsize(path)]]
+    elif os.path.isdir(path):
+        excluded_paths = set([os.path.normcase(os.path.abspath(p)) for p in exclude])
+        excluded_regexps = set(re.compile(regexp) for regexp in exclude_pattern)
+        excluded_regexps |= set(re.compile(regexp, re.IGNORECASE) for regexp in exclude_pattern_ci)
+        excluded_paths.add(os.path.normcase(os.path.abspath(output)))
+
+        printv("Scanning size of input file/s...")
+        torrent_files = get_files_in_directory(path, excluded_paths=excluded_paths, excluded_regexps=excluded_regexps)
+        files = [[split_path(file), length] for file, length, _ in get_file_fingerprints(path, torrent_files)]
+    else:
+        raise_error("'%s' neither is a file nor a directory." % path, _parser)
+
+    torrent_size = sum(length for _, length in files)
+    if torrent_size == 0:
+        raise_error("Can't create torrent for 0 byte data.", _parser)
+
+    if piece_length == 0:
+        piece_length = calculate_piece_length(torrent_size)
+    elif piece_length > 0:
+        piece_length *= KIB
+    else:
+        raise_error("Invalid piece size: '%d'" % piece_length, _parser)
+
+    if os.path.exists(output) and not force:
+        if _parser is not None:
+            if "yes" != input("'%s' does already exist. Overwrite? yes/no: " % output):
+                raise_error("Aborted.", _parser)
+        else:
+            raise_error("The specified file exists already, and force flag is not set.")
+
+    plan = {
+        "version": PLAN_VERSION,
+        "target": os.path.abspath(path),
+        "single_file": os.path.isfile(path),
+        "name": os.path.basename(os.path.abspath(path)),
+        "piece_length": piece_length,
+        "include_md5": include_md5,
+        "files": files,
+    }
+    _write_json(plan, output)
+
+    printv("Wrote plan '%s' (%d files, %d pieces of %d KiB)." %
+           (output, len(files), math.ceil(torrent_size / piece_length), piece_length / KIB))
+
+    return plan
+
+
+def hash_shard(
+    plan_path: str,
+    shard: int,
+    shard_count: int,
+    output: str,
+    root: Optional[str] = None,
+    threads: int = 4,
+    verbose: bool = False,
+    _parser: Optional[argparse.ArgumentParser] = None,
+) -> None:
+    """Hashes one shard (a contiguous range of pieces) of a plan written by plan_torrent
+
+    Pieces spanning the boundaries between files are hashed by the shard that contains them. The md5 sum of a file is
+    calculated by the shard that contains the file's first byte (which reads the whole file then).
+
+    Parameters
+    ----------
+    plan_path
+        Path of the plan file
+    shard
+        Index of the shard, starting at 0
+    shard_count
+        Total number of shards
+    output
+        Path of the shard file to write
+    root, optional
+        Location of the target on this machine, by default None, which means the path stored in the plan
+    threads, optional
+        Set the maximum number of threads to use for hashing pieces, by default 4
+    verbose, optional
+        Enable output of diagnostic information, by default False
+    _parser, optional
+        DO NOT TOUCH THIS, its just used for the function to know if you are using it directly or as a cli tool.
+    """
+    global VERBOSE
+    VERBOSE = verbose
+
+    if not 0 <= shard < shard_count:
+        raise_error("Invalid shard: %d/%d" % (shard, shard_count), _parser)
+    if threads <= 0:
+        raise_error("Number of threads must be positive.", _parser)
+
+    try:
+        plan, plan_id = load_plan(plan_path)
+    except (IOError, ValueError) as exc:
+        raise_error("Cannot load plan: %s" % exc, _parser)
+
+    target = root or plan["target"]
+    if plan["single_file"]:
+        paths = [target]
+    else:
+        paths = [os.path.join(target, *components) for components, _ in plan["files"]]
+    lengths = [length for _, length in plan["files"]]
+
+    # The files must not have changed since the plan has been made.
+    for path, length in zip(paths, lengths):
+        if not os.path.isfile(path) or os.path.getsize(path) != length:
+            raise_error("'%s' is missing or has changed since the plan has been made." % path, _parser)
+
+    piece_length = plan["piece_length"]
+    piece_count = int(math.ceil(sum(lengths) / piece_length))
+    start, end = _get_shard_range(piece_count, shard, shard_count)
+    printv("Hashing pieces %d to %d of %d." % (start, end - 1, piece_count))
+
+    # Mark all pieces (and md5 sums) outside of the shard as known, so that only the shard's data is read.
+    md5sums = {}
+    offset = 0
+    for k, length in enumerate(lengths):
+        if not start * piece_length <= offset < end * piece_length:
+            md5sums[k] = ""
+        offset += length
+
+    known = KnownHashes(bytes(piece_count * 20), [(0, start), (end, piece_count)], md5sums)
+    pieces, all_md5sums = _hash_pieces(paths, lengths, piece_length, plan["include_md5"], threads, known=known)
+
+    _write_json(
+        {
+            "version": PLAN_VERSION,
+            "plan": plan_id,
+            "shard": [shard, shard_count],
+            "pieces": base64.b64encode(pieces[start * 20:end * 20]).decode("ascii"),
+            "md5sums": {
+                str(k): md5sum
+                for k, md5sum in enumerate(all_md5sums) if k not in md5sums and lengths[k]
+            },
+        },
+        output,
+    )
+
+    printv("Wrote shard '%s'." % output)
+
+
+def merge_shards(plan_path: str, shard_paths: List[str]) -> Dict[str, Any]:
+    """
+    Merge the shards hashed by hash_shard and return the torrent's info dictionary.
+
+    Raise ValueError if the shards are incomplete or do not belong to the plan.
+    """
+    plan, plan_id = load_plan(plan_path)
+    lengths = [length for _, length in plan["files"]]
+    piece_count = int(math.ceil(sum(lengths) / plan["piece_length"]))
+
+    shards: Dict[int, Dict[str, Any]] = {}
+    shard_count = None
+    for path in shard_paths:
+        with open(path, "r", encoding="utf-8") as fh:
+            try:
+                data = json.load(fh)
+            except ValueError:
+                raise ValueError("'%s' is not a valid shard" % path)
+
+        if not isinstance(data, dict) or data.get("version") != PLAN_VERSION:
+            raise ValueError("'%s' is not a valid shard or has an unsupported version" % path)
+        if data["plan"] != plan_id:
+            raise ValueError("'%s' has been hashed for a different plan" % path)
+
+        shard, count = data["shard"]
+        if shard_count is None:
+            shard_count = count
+        elif count != shard_count:
+            raise ValueError("'%s' is shard %d/%d, but other shards are out of %d" % (path, shard, count, shard_count))
+        if shard in shards:
+            raise ValueError("'%s': shard %d/%d is given twice" % (path, shard, count))
+
+        start, end = _get_shard_range(piece_count, shard, count)
+        if len(base64.b64decode(data["pieces"])) != 20 * (end - start):
+            raise ValueError("'%s' has an unexpected number of pieces" % path)
+
+        shards[shard] = data
+
+    missing = [str(i) for i in range(shard_count or 0) if i not in shards]
+    if not shards or missing:
+        raise ValueError("missing shards: %s" % (", ".join(missing) or "all"))
+
+    pieces = b"".join(base64.b64decode(shards[i]["pieces"]) for i in range(len(shards)))
+
+    md5sums: Dict[int, str] = {}
+    for data in shards.values():
+        md5sums.update((int(k), md5sum) for k, md5sum in data["md5sums"].items())
+
+    info_files = []
+    for k, (components, length) in enumerate(plan["files"]):
+        fdict = {"length": length, "path": components}
+        if plan["include_md5"]:
+            fdict["md5sum"] = md5sums[k] if length else hashlib.md5().hexdigest()
+        info_files.append(fdict)
+
+    info: Dict[str, Any] = {"pieces": pieces, "name": plan["name"], "piece length": plan["piece_length"]}
+    if plan["single_file"]:
+        info["length"] = info_files[0]["length"]
+        if plan["include_md5"]:
+            info["md5sum"] = info_files[0]["md5sum"]
+    else:
+        info["files"] = info_files
+
+    return info
+
+
+def edit_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="py3createtorrent edit",
+        description="Edit an existing torrent file without rehashing its data.\n"
+        "Fields are only changed if the corresponding option is given.",
+        usage="%(prog)s <torrent> [options ...]",
+        epilog="You are using py3createtorrent v%s" % __version__,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+
+    parser.add_argument(
+        "-t",
+        "--tracker",
+        metavar="TRACKER_URL",
+        action="append",
+        dest="trackers",
+        default=None,
+        help="Replace the tracker (announce) URLs. Can be used multiple times.",
+    )
+
+    parser.add_argument(
+        "--no-trackers",
+        action="store_true",
+        default=False,
+        help="Remove all trackers.",
+    )
+
+    parser.add_argument(
+        "--node",
+        metavar="HOST,PORT",
+        action="append",
+        dest="nodes",
+        default=None,
+        help="Replace the DHT bootstrap nodes. Can be used multiple times.",
+    )
+
+    parser.add_argument(
+        "--no-nodes",
+        action="store_true",
+        default=False,
+        help="Remove all DHT bootstrap nodes.",
+    )
+
+    parser.add_argument(
+        "--webseed",
+        metavar="WEBSEED_URL",
+        action="append",
+        dest="webseeds",
+        default=None,
+        help="Replace the webseeds. Can be used multiple times.",
+    )
+
+    parser.add_argument(
+        "--no-webseeds",
+        action="store_true",
+        default=False,
+        help="Remove all webseeds.",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--comment",
+        type=str,
+        action="store",
+        dest="comment",
+        default=None,
+        help="Replace the comment. Specify an empty comment to remove it.",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--date",
+        type=int,
+        action="store",
+        dest="date",
+        default=None,
+        metavar="TIMESTAMP",
+        help="Replace the creation date with a unix timestamp.\n" + "Specify -1 for the current date and time and\n" +
+        "-2 to remove the creation date.",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--source",
+        type=str,
+        action="store",
+        dest="source",
+        default=None,
+        help="Replace the source tag. Specify an empty source to remove it.\n" + "(changes the info hash)",
+    )
+
+    parser.add_argument(
+        "-P",
+        "--private",
+        action="store_true",
+        dest="private",
+        default=None,
+        help="Set the private flag. (changes the info hash)",
+    )
+
+    parser.add_argument(
+        "--no-private",
+        action="store_false",
+        dest="private",
+        help="Clear the private flag. (changes the info hash)",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--name",
+        type=str,
+        action="store",
+        dest="name",
+        default=None,
+        help="Replace the name of the torrent. (changes the info hash)",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        action="store",
+        dest="output",
+        default=None,
+        metavar="PATH",
+        help="Write the edited torrent to PATH instead of replacing\n" + "the original torrent file.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        dest="force",
+        default=False,
+        help="Overwrite existing .torrent files without asking and\n" + "disable the tracker and node validations.",
+    )
+
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        default=False,
+        help="Enable output of diagnostic information.",
+    )
+
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        dest="quiet",
+        default=False,
+        help="Suppress output, e.g. don't print summary",
+    )
+
+    parser.add_argument(
+        "--config",
+        type=str,
+        action="store",
+        help="Specify location of config file.\n" + "[default: <home directiory>/.py3createtorrent.cfg]",
+    )
+
+    parser.add_argument(
+        "torrent",
+        metavar="torrent <path>",
+        help="Torrent file to edit",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.no_trackers:
+        if args.trackers:
+            parser.error("--tracker and --no-trackers exclude each other.")
+        args.trackers = []
+    if args.no_nodes:
+        if args.nodes:
+            parser.error("--node and --no-nodes exclude each other.")
+        args.nodes = []
+    if args.no_webseeds:
+        if args.webseeds:
+            parser.error("--webseed and --no-webseeds exclude each other.")
+        args.webseeds = []
+
+    edit_torrent(
+        args.torrent,
+        output=args.output,
+        trackers=args.trackers,
+        nodes=args.nodes,
+        webseeds=args.webseeds,
+        comment=args.comment,
+        date=args.date,
+        source=args.source,
+        private=args.private,
+        name=args.name,
+        force=args.force,
+        verbose=args.verbose,
+        quiet=args.quiet,
+        config_path=args.config,
+        _parser=parser,
+    )
+
+
+def plan_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="py3createtorrent plan",
+        description="Scan a file or folder and write a plan for hashing it in shards on multiple machines.\n"
+        "Hash the shards with 'hash-shard' and assemble the torrent with 'merge'.",
+        usage="%(prog)s <target> -o <plan> [options ...]",
+        epilog="You are using py3createtorrent v%s" % __version__,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        action="store",
+        dest="output",
+        required=True,
+        metavar="PATH",
+        help="Path of the plan file.",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--piece-length",
+        type=int,
+        action="store",
+        dest="piece_length",
+        default=0,
+        help="Set piece size in KiB. [default: 0 = automatic selection]",
+    )
+
+    parser.add_argument(
+        "--md5",
+        action="store_true",
+        dest="include_md5",
+        default=False,
+        help="Include MD5 hashes in torrent file.",
+    )
+
+    parser.add_argument(
+        "-e",
+        "--exclude",
+        type=str,
+        action="append",
+        dest="exclude",
+        default=[],
+        metavar="PATH",
+        help="Exclude a specific path (can be repeated to exclude\n" + "multiple paths).",
+    )
+
+    parser.add_argument(
+        "--exclude-pattern",
+        type=str,
+        action="append",
+        dest="exclude_pattern",
+        default=[],
+        metavar="REGEXP",
+        help="Exclude paths matching a regular expression (can be repeated\n" + "to use multiple patterns).",
+    )
+
+    parser.add_argument(
+        "--exclude-pattern-ci",
+        type=str,
+        action="append",
+        dest="exclude_pattern_ci",
+        default=[],
+        metavar="REGEXP",
+        help="Same as --exclude-pattern but case-insensitive.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        dest="force",
+        default=False,
+        help="Overwrite an existing plan file without asking.",
+    )
+
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        default=False,
+        help="Enable output of diagnostic information.",
+    )
+
+    parser.add_argument(
+        "path",
+        metavar="target <path>",
+        help="File or folder for which to create a torrent",
+    )
+
+    args = parser.parse_args(argv)
+
+    plan_torrent(
+        args.path,
+        args.output,
+        piece_length=args.piece_length,
+        include_md5=args.include_md5,
+        exclude=args.exclude,
+        exclude_pattern=args.exclude_pattern,
+        exclude_pattern_ci=args.exclude_pattern_ci,
+        force=args.force,
+        verbose=args.verbose,
+        _parser=parser,
+    )
+
+
+def hash_shard_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog="py3createtorrent hash-shard",
+        description="Hash one shard of a plan written by 'plan'.",
+        usage="%(prog)s <plan> --shard I/N -o <shard> [options ...]",
+        epilog="You are using py3createtorrent v%s" % __version__,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--shard",
+        type=str,
+        action="store",
+        dest="shard",
+        required=True,
+        metavar="I/N",
+        help="Hash shard I (starting at 0) of N shards.",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        action="store",
+        dest="output",
+        required=True,
+        metavar="PATH",
+        help="Path of the shard file.",
+    )
+
+    parser.add_argument(
+        "--root",
+        type=str,
+        action="store",
+        dest="root",
+        default=None,
+        metavar="PATH",
+        help="Location of the target on this machine.\n" + "[default: the path stored in the plan]",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        action="store",
+        default=4,
+        help="Set the maximum number of threads to use for hashing pieces.\n" + "[default: 4]",
+    )
+
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        default=False,
+        help="Enable output of diagnostic information.",
+    )
+
+    parser.add_argument(
+        "plan",
+        metavar="plan <path>",
+        help="Plan file written by 'plan'",
+    )
+
+    args = parser.parse_args(argv)
+
+    match = re.match(r"^(\d+)/(\d+)$", args.shard)
+    if not match:
+        parser.error("Invalid shard: '%s' (expected I/N, e.g. 0/4)" % args.shard)
+
+    hash_shard(
+        args.plan,
+        int(match.group(1)),
+        int(match.group(2)),
+        args.output,
+        root=args.root,
+        threads=args.threads,
+        verbose=args.verbose,
+        _parser=parser,
+    )
+
+
+def merge_main(argv: List[str]) -> None:
+    parser = create_argument_parser(
+        prog="py3createtorrent merge",
+        description="Merge the shards hashed by 'hash-shard' and create the torrent.\n"
+        "The options for creating torrents can be used as usual.",
+        usage="%(prog)s <plan> <shard> [<shard> ...] [options ...]",
+    )
+
+    parser.add_argument(
+        "plan",
+        metavar="plan <path>",
+        help="Plan file written by 'plan'",
+    )
+
+    parser.add_argument(
+        "shards",
+        metavar="shard <path>",
+        nargs="+",
+        help="Shard files written by 'hash-shard'",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.from_index or args.stdin or args.urls or args.url_manifest or args.maps or args.layout:
+        parser.error("--from-index, --stdin, URLs and layouts cannot be used together with merge.")
+
+    try:
+        info = merge_shards(args.plan, args.shards)
+    except (IOError, ValueError, KeyError, TypeError) as exc:
+        parser.error("Cannot merge shards: %s" % exc)
 
-        # Make creation date human readable (ISO format).
-        if "creation date" in metainfo:
-            creation_date = datetime.datetime.fromtimestamp(metainfo["creation date"]).isoformat(" ")
-        else:
-            creation_date = "(none)"
-
-        # Now actually print the summary table.
-        print("  Name:                %s\n"
-              "  Size:                %s\n"
-              "  Pieces:              %d x %d KiB\n"
-              "  Comment:             %s\n"
-              "  Private:             %s\n"
-              "  Creation date:       %s\n"
-              "  DHT bootstrap nodes: %s\n"
-              "  Webseeds:            %s\n"
-              "  Primary tracker:     %s\n"
-              "  Backup trackers:\n"
-              "%s" % (
-                  metainfo["info"]["name"],
-                  size,
-                  piece_count,
-                  piece_length / KIB,
-                  metainfo["comment"] if "comment" in metainfo else "(none)",
-                  "yes" if private else "no",
-                  creation_date,
-                  metainfo["nodes"] if "nodes" in metainfo else "(none)",
-                  metainfo["url-list"] if "url-list" in metainfo else "(none)",
-                  metainfo["announce"] if "announce" in metainfo else "(none)",
-                  backup_trackers,
-              ))
+    # Create the torrent via a temporary index.
+    fd, index_path = tempfile.mkstemp(suffix=".idx")
+    os.close(fd)
+    try:
+        PieceIndex.write(index_path, info)
+        args.path = None
+        args.from_index = index_path
+        create_torrent_from_args(args, parser)
+    finally:
+        os.remove(index_path)
 
 
-def main() -> None:
-    # Create and configure ArgumentParser.
-    parser = argparse.ArgumentParser(
-        description="py3createtorrent is a comprehensive command line utility for creating torrents.",
-        usage="%(prog)s <target> [-t tracker_url] [options ...]",
-        epilog="You are using py3createtorrent v%s" % __version__,
-        formatter_class=argparse.RawTextHelpFormatter,
-    )
+def create_argument_parser(**kwargs: Any) -> argparse.ArgumentParser:
+    """Return an ArgumentParser with all the options for creating a torrent, but without the target path."""
+    parser = argparse.ArgumentParser(epilog="You are using py3createtorrent v%s" % __version__,
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     **kwargs)
 
     parser.add_argument(
         "-t",
@@ -1148,11 +6503,12 @@ def main() -> None:
     parser.add_argument(
         "-p",
         "--piece-length",
-        type=int,
+        type=str,
         action="store",
         dest="piece_length",
-        default=0,
-        help="Set piece size in KiB. [default: 0 = automatic selection]",
+        default="0",
+        help="Set piece size in KiB. Use a comma-separated list (e.g. 256,4096)\n" +
+        "to create one torrent per piece size, reading the data only once.\n" + "[default: 0 = automatic selection]",
     )
 
     parser.add_argument(
@@ -1254,6 +6610,41 @@ def main() -> None:
         help="Same as --exclude-pattern but case-insensitive.",
     )
 
+    parser.add_argument(
+        "--files-from",
+        type=str,
+        action="store",
+        dest="files_from",
+        default=None,
+        metavar="FILE",
+        help="Take the files of the target folder (in this order) from\n" +
+        "FILE ('-' for stdin) instead of scanning the folder. One\n" +
+        "path per line or NUL-separated (find -print0), optionally\n" +
+        "followed by <TAB>size<TAB>mtime_ns. Paths are relative to\n" + "the target folder.",
+    )
+
+    parser.add_argument(
+        "--map",
+        type=str,
+        action="append",
+        dest="maps",
+        default=[],
+        metavar="LOCAL=PATH",
+        help="Compose the torrent from local files and folders instead\n" +
+        "of a single target: add the file or folder LOCAL as PATH\n" +
+        "in the torrent (can be repeated). Requires --name.",
+    )
+
+    parser.add_argument(
+        "--layout",
+        type=str,
+        action="store",
+        dest="layout",
+        default=None,
+        metavar="PATH",
+        help="Like --map, but read the name and the mappings from a JSON\n" + "layout file.",
+    )
+
     parser.add_argument(
         "-d",
         "--date",
@@ -1283,10 +6674,11 @@ def main() -> None:
         "--threads",
         type=int,
         action="store",
-        default=4,
+        default=None,
         help="Set the maximum number of threads to use for hashing pieces.\n"
         "py3createtorrent will never use more threads than there are CPU cores.\n"
-        "[default: 4]",
+        "[default: calibrated (see --calibrate) or 4, the number of\n"
+        "CPU cores on free-threaded Python builds]",
     )
 
     parser.add_argument(
@@ -1313,6 +6705,355 @@ def main() -> None:
         help="Add one or multiple HTTP/FTP urls as seeds (GetRight-style).",
     )
 
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Resume an interrupted run from its checkpoint file\n" + "(<output path>.checkpoint).",
+    )
+
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        action="store",
+        dest="checkpoint_interval",
+        default=60,
+        metavar="SECONDS",
+        help="Save a checkpoint every SECONDS seconds while hashing.\n" +
+        "Specify 0 to disable checkpoints. [default: 60]",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="Keep running and update the torrent whenever the input changes.\n" +
+        "Only pieces affected by changed files are rehashed.",
+    )
+
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        action="store",
+        dest="watch_debounce",
+        default=5,
+        metavar="SECONDS",
+        help="Wait until there have been no changes for SECONDS seconds\n" +
+        "before updating the torrent. [default: 5]",
+    )
+
+    parser.add_argument(
+        "--watch-hook",
+        type=str,
+        action="store",
+        dest="watch_hook",
+        default=None,
+        metavar="COMMAND",
+        help="Shell command to run after each update in watch mode. The path\n" +
+        "to the torrent is passed in $PY3CREATETORRENT_TORRENT.",
+    )
+
+    parser.add_argument(
+        "--reuse-from",
+        type=str,
+        action="store",
+        dest="reuse_from",
+        default=None,
+        metavar="TORRENT",
+        help="Re-use the piece hashes of an existing torrent for (an older\n" +
+        "version of) the same data. Only pieces affected by changed\n" + "files are hashed.",
+    )
+
+    parser.add_argument(
+        "--reuse-trust",
+        choices=["mtime", "size"],
+        action="store",
+        dest="reuse_trust",
+        default="mtime",
+        help="Consider files with unchanged path and size unchanged if they\n" +
+        "have not been modified since the torrent was created (mtime)\n" + "or in any case (size). [default: mtime]",
+    )
+
+    parser.add_argument(
+        "--reuse-verify",
+        type=int,
+        action="store",
+        dest="reuse_verify",
+        default=0,
+        metavar="N",
+        help="Spot-check N randomly chosen re-used pieces. [default: 0]",
+    )
+
+    parser.add_argument(
+        "--export-index",
+        type=str,
+        action="store",
+        dest="export_index",
+        default=None,
+        metavar="PATH",
+        help="Also write a binary index of the piece hashes and the file\n" + "table to PATH.",
+    )
+
+    parser.add_argument(
+        "--from-index",
+        type=str,
+        action="store",
+        dest="from_index",
+        default=None,
+        metavar="PATH",
+        help="Create the torrent from an index written by --export-index\n" +
+        "without reading the data. Do not specify a path then.",
+    )
+
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        dest="stdin",
+        default=False,
+        help="Read the data of a single file torrent from stdin\n" +
+        "(same as target '-'). Requires --piece-length and --name.",
+    )
+
+    parser.add_argument(
+        "--tee",
+        type=str,
+        action="store",
+        dest="tee",
+        default=None,
+        metavar="PATH",
+        help="When reading from stdin, also write the data to PATH.",
+    )
+
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        dest="archive",
+        default=False,
+        help="Create a torrent for the contents of the target tar or zip\n" +
+        "archive (or a tar archive from stdin) without extracting it.",
+    )
+
+    parser.add_argument(
+        "--strip-components",
+        type=int,
+        action="store",
+        dest="strip_components",
+        default=0,
+        metavar="N",
+        help="Strip N leading components from the paths in the archive.\n" + "[default: 0]",
+    )
+
+    parser.add_argument(
+        "--url",
+        type=str,
+        action="append",
+        dest="urls",
+        default=[],
+        metavar="URL",
+        help="Create the torrent for a file served over HTTP(S) instead of\n" +
+        "a local path (can be repeated). The origin is added as webseed.",
+    )
+
+    parser.add_argument(
+        "--url-manifest",
+        type=str,
+        action="store",
+        dest="url_manifest",
+        default=None,
+        metavar="PATH",
+        help="Like --url, but read URLs, paths and sizes from a JSON manifest.",
+    )
+
+    parser.add_argument(
+        "--http-connections",
+        type=int,
+        action="store",
+        dest="http_connections",
+        default=4,
+        metavar="N",
+        help="Maximum number of concurrent HTTP requests per host.\n" + "[default: 4]",
+    )
+
+    parser.add_argument(
+        "--http-retries",
+        type=int,
+        action="store",
+        dest="http_retries",
+        default=3,
+        metavar="N",
+        help="Number of retries for failed HTTP requests. [default: 3]",
+    )
+
+    parser.add_argument(
+        "--no-auto-webseed",
+        action="store_true",
+        dest="no_auto_webseed",
+        default=False,
+        help="Do not add the origin of the URLs as webseed.",
+    )
+
+    parser.add_argument(
+        "--variant",
+        type=str,
+        action="append",
+        dest="variants",
+        default=[],
+        metavar="LABEL[:KEY=VALUE;...]",
+        help="Create a variant of the torrent with the same pieces, e.g.\n" +
+        "'a:tracker=URL;source=A;private=yes' (can be repeated).\n" +
+        "KEY is tracker, node, webseed, private, source or comment.",
+    )
+
+    parser.add_argument(
+        "--variants-file",
+        type=str,
+        action="store",
+        dest="variants_file",
+        default=None,
+        metavar="PATH",
+        help="Like --variant, but read the variants from a JSON file.",
+    )
+
+    parser.add_argument(
+        "--checksums",
+        type=str,
+        action="store",
+        dest="checksums",
+        default="",
+        metavar="ALGORITHMS",
+        help="Also calculate checksums of the files while hashing and write\n" +
+        "them to checksum files, e.g. sha256,blake2b,crc32. Supported:\n" + ", ".join(FileChecksums.ALGORITHMS) +
+        " (crc32 is written as SFV file).",
+    )
+
+    parser.add_argument(
+        "--checksums-out",
+        type=str,
+        action="store",
+        dest="checksums_out",
+        default=None,
+        metavar="DIR",
+        help="Directory for the checksum files.\n" + "[default: directory of the torrent file]",
+    )
+
+    parser.add_argument(
+        "--file-sha1",
+        action="store_true",
+        dest="include_sha1",
+        default=False,
+        help="Include the sha1 hashes of the files in the torrent file.",
+    )
+
+    parser.add_argument(
+        "--read-order",
+        choices=["torrent", "physical"],
+        action="store",
+        dest="read_order",
+        default="torrent",
+        help="Read the files in the torrent's order or in the order of\n" +
+        "their location on disk (fewer seeks on hard disks).\n" + "[default: torrent]",
+    )
+
+    parser.add_argument(
+        "--readers-per-device",
+        type=int,
+        action="store",
+        dest="readers_per_device",
+        default=1,
+        metavar="N",
+        help="Number of threads reading from each disk (device). Files on\n" +
+        "different disks are read in parallel. [default: 1]",
+    )
+
+    parser.add_argument(
+        "--prefetch-files",
+        type=int,
+        action="store",
+        dest="prefetch_files",
+        default=16,
+        metavar="N",
+        help="Number of small files (up to 1 MiB) that are read\n" +
+        "concurrently, ahead of the hashing. 0 disables this. [default: 16]",
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        dest="stats",
+        default=False,
+        help="Print statistics about the hashing time and the throughput\n" + "of each disk (device).",
+    )
+
+    parser.add_argument(
+        "--max-read-rate",
+        type=str,
+        action="store",
+        dest="max_read_rate",
+        default="0",
+        metavar="RATE",
+        help="Limit the read rate to RATE bytes/s (suffixes K, M, G\n" + "allowed, e.g. 20M). [default: 0 = no limit]",
+    )
+
+    parser.add_argument(
+        "--max-cpu",
+        type=float,
+        action="store",
+        dest="max_cpu",
+        default=0,
+        metavar="PERCENT",
+        help="Limit the CPU usage to PERCENT of one CPU core.\n" + "[default: 0 = no limit]",
+    )
+
+    parser.add_argument(
+        "--throttle-file",
+        type=str,
+        action="store",
+        dest="throttle_file",
+        default=None,
+        metavar="PATH",
+        help="JSON file for changing the limits while hashing, e.g.\n" + '{"max_read_rate": "20M", "max_cpu": 50}.',
+    )
+
+    parser.add_argument(
+        "--nice",
+        type=int,
+        action="store",
+        dest="nice",
+        default=0,
+        metavar="N",
+        help="Lower the CPU priority by N.",
+    )
+
+    parser.add_argument(
+        "--ionice",
+        type=str,
+        action="store",
+        dest="ionice",
+        default=None,
+        metavar="CLASS[:LEVEL]",
+        help="Set the I/O scheduling class (Linux), e.g. idle or\n" + "best-effort:7.",
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=sorted(HASH_ENGINES),
+        action="store",
+        dest="engine",
+        default=None,
+        help="Calculate the sha1 hashes with hashlib, with parallel\n" +
+        "threads that also read the data, or in the Linux kernel\n" +
+        "(afalg, falls back to hashlib if not available).\n" + "[default: calibrated (see --calibrate) or hashlib,\n" +
+        "parallel on free-threaded Python builds]",
+    )
+
+    parser.add_argument(
+        "--hash-while-scanning",
+        action="store_true",
+        dest="hash_while_scanning",
+        default=False,
+        help="Hash the files of a folder while it is being scanned\n" + "(requires -p, no checkpoints).",
+    )
+
     parser.add_argument("--no-created-by", action="store_true", help=argparse.SUPPRESS)
 
     parser.add_argument(
@@ -1322,19 +7063,21 @@ def main() -> None:
         help="Show version number of py3createtorrent",
     )
 
-    parser.add_argument(
-        "path",
-        metavar="target <path>",
-        help="File or folder for which to create a torrent",
-    )
+    return parser
 
-    args = parser.parse_args()
+
+def create_torrent_from_args(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """Call create_torrent with the arguments parsed by a parser from create_argument_parser."""
+    try:
+        max_read_rate = parse_rate(args.max_read_rate)
+    except ValueError:
+        raise_error("Invalid read rate: '%s'" % args.max_read_rate, parser)
 
     create_torrent(
         args.path,
         trackers=args.trackers,
         nodes=args.nodes,
-        piece_length=args.piece_length,
+        piece_length=parse_piece_lengths(args.piece_length, parser),
         private=args.private,
         comment=args.comment,
         source=args.source,
@@ -1352,10 +7095,116 @@ def main() -> None:
         config_path=args.config,
         webseeds=args.webseeds,
         no_created_by=args.no_created_by,
+        resume=args.resume,
+        checkpoint_interval=args.checkpoint_interval,
+        watch=args.watch,
+        watch_debounce=args.watch_debounce,
+        watch_hook=args.watch_hook,
+        reuse_from=args.reuse_from,
+        reuse_trust=args.reuse_trust,
+        reuse_verify=args.reuse_verify,
+        export_index=args.export_index,
+        from_index=args.from_index,
+        tee=args.tee,
+        archive=args.archive,
+        strip_components=args.strip_components,
+        urls=args.urls,
+        url_manifest=args.url_manifest,
+        http_connections=args.http_connections,
+        http_retries=args.http_retries,
+        auto_webseed=not args.no_auto_webseed,
+        variants=args.variants,
+        variants_file=args.variants_file,
+        checksums=[algorithm.strip() for algorithm in args.checksums.split(",") if algorithm.strip()],
+        checksums_out=args.checksums_out,
+        include_sha1=args.include_sha1,
+        read_order=args.read_order,
+        readers_per_device=args.readers_per_device,
+        prefetch_files=args.prefetch_files,
+        stats=args.stats,
+        max_read_rate=max_read_rate,
+        max_cpu=args.max_cpu,
+        throttle_file=args.throttle_file,
+        nice=args.nice,
+        ionice=args.ionice,
+        engine=args.engine,
+        hash_while_scanning=args.hash_while_scanning,
+        files_from=args.files_from,
+        maps=args.maps,
+        layout=args.layout,
         _parser=parser,
     )
 
 
+def main() -> None:
+    # Dispatch subcommands. Everything else is handled as before, i.e. the first argument is the target. A file or
+    # folder that is named like a subcommand is still a target.
+    subcommands = {"edit": edit_main, "plan": plan_main, "hash-shard": hash_shard_main, "merge": merge_main}
+    if len(sys.argv) > 1 and sys.argv[1] in subcommands and not os.path.exists(sys.argv[1]):
+        subcommands[sys.argv[1]](sys.argv[2:])
+        return
+
+    # Create and configure ArgumentParser.
+    parser = create_argument_parser(
+        description="py3createtorrent is a comprehensive command line utility for creating torrents.\n\n"
+        "Use '%(prog)s edit --help' for editing existing torrents.\n"
+        "Use '%(prog)s plan --help' for hashing in shards on multiple machines.",
+        usage="%(prog)s <target> [-t tracker_url] [options ...]",
+    )
+
+    parser.add_argument(
+        "path",
+        metavar="target <path>",
+        nargs="?",
+        help="File or folder for which to create a torrent ('-' for stdin)",
+    )
+
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        default=False,
+        help="Measure the speed of the hash engines and thread counts at\n" +
+        "the piece sizes given by -p (or 256, 1024 and 4096 KiB),\n" +
+        "and store the fastest ones in the config file, so that\n" +
+        "they are used unless --engine/--threads are given.",
+    )
+
+    args = parser.parse_args()
+
+    if args.calibrate:
+        if args.path is not None:
+            parser.error("A target cannot be specified together with --calibrate.")
+        piece_lengths = parse_piece_lengths(args.piece_length, parser)
+        piece_lengths = piece_lengths if isinstance(piece_lengths, list) else [piece_lengths]
+        if piece_lengths == [0]:
+            piece_lengths = [256, 1024, 4096]
+        if any(length <= 0 for length in piece_lengths):
+            parser.error("The piece lengths must be positive.")
+
+        # The config file is created if it does not exist yet.
+        config = Config(args.config)
+        if os.path.isfile(config.get_path_to_config_file()):
+            config = load_config(args.config)
+        print("Calibrating (this may take a while)...")
+        try:
+            calibrate(config, [length * KIB for length in piece_lengths])
+        except IOError as exc:
+            parser.error("Calibration failed: %s" % exc)
+        print("Stored the calibration in '%s'." % config.get_path_to_config_file())
+        return
+
+    if args.stdin:
+        if args.path is not None and args.path != "-":
+            parser.error("A path cannot be specified together with --stdin.")
+        args.path = "-"
+
+    if (args.path is None and args.from_index is None and not args.urls and not args.url_manifest and not args.maps
+            and not args.layout):
+        parser.error("the following arguments are required: target <path>")
+
+    create_torrent_from_args(args, parser)
+
+
 if __name__ == "__main__":
     try:
         main()
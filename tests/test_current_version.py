@@ -2,9 +2,22 @@
 Test the local src/py3createtorrent.py against the reference torrent files in tests/referencedata.
 """
 import argparse
+import functools
+import http.server
+import io
+import json
 import os
+import re
+import shutil
+import signal
 import subprocess
 import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Any
 
 
 def get_file_contents(path):
@@ -12,9 +25,359 @@ def get_file_contents(path):
         return fh.read()
 
 
+def create_archives(directory, target_dir):
+    """Create tar, tar.gz and zip archives of the directory's contents in target_dir and return their paths."""
+    name = os.path.basename(directory)
+    archives = []
+
+    path = os.path.join(target_dir, name + ".tar")
+    with tarfile.open(path, "w") as tar:
+        for node in os.listdir(directory):
+            tar.add(os.path.join(directory, node), arcname=node)
+    archives.append(path)
+
+    path = os.path.join(target_dir, name + ".tar.gz")
+    with tarfile.open(path, "w:gz") as tar:
+        for node in os.listdir(directory):
+            tar.add(os.path.join(directory, node), arcname=node)
+    archives.append(path)
+
+    path = os.path.join(target_dir, name + ".zip")
+    with zipfile.ZipFile(path, "w") as zip_file:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                zip_file.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), directory))
+    archives.append(path)
+
+    return archives
+
+
+def get_files(directory):
+    """Return the paths of the files in the directory (relative to it) in torrent order."""
+    files = []
+    for name in sorted(os.listdir(directory), key=str.lower):
+        if os.path.isdir(os.path.join(directory, name)):
+            files += [os.path.join(name, file) for file in get_files(os.path.join(directory, name))]
+        else:
+            files.append(name)
+    return files
+
+
+def create_file_list(directory, path):
+    """Write the files of the directory in torrent order, NUL-separated and with their sizes, to the file list."""
+    with open(path, "wb") as fh:
+        for file in get_files(directory):
+            fh.write(os.fsencode("%s\t%d" % (file, os.path.getsize(os.path.join(directory, file)))) + b"\0")
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serve files with support for (single) range requests."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        match = re.match(r"^bytes=(\d+)-(\d+)$", self.headers.get("Range", ""))
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start, end = int(match.group(1)), min(int(match.group(2)), size - 1)
+        with open(path, "rb") as fh:
+            fh.seek(start)
+            data = fh.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+def start_http_server(directory):
+    """Serve the directory on a random local port in a background thread and return the server."""
+    handler = functools.partial(RangeRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_url_manifest(directory, base_url, path):
+    """Write a manifest with the URLs of all files in the directory to path."""
+    files = []
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            relpath = os.path.relpath(os.path.join(root, filename), os.path.dirname(directory))
+            files.append({"url": base_url + "/".join(relpath.split(os.sep))})
+    with open(path, "w") as fh:
+        json.dump({"files": files}, fh)
+
+
+def check_reuse_after_changes(verbose):
+    """
+    Change copies of the test folder and check that re-using the piece hashes of the torrent file of the unchanged
+    folder results in the same torrent file as hashing everything.
+    """
+
+    def append_to_file(folder, files):
+        with open(os.path.join(folder, files[len(files) // 2]), "ab") as fh:
+            fh.write(os.urandom(12345))
+
+    def add_file(folder, files):
+        with open(os.path.join(folder, files[len(files) // 2] + ".added"), "wb") as fh:
+            fh.write(os.urandom(54321))
+
+    def edit_file(folder, files):
+        # The size does not change, only the modification time.
+        path = os.path.join(folder, max(files, key=lambda file: os.path.getsize(os.path.join(folder, file))))
+        with open(path, "r+b") as fh:
+            fh.seek(100)
+            fh.write(os.urandom(100))
+
+    # Each case is given by a label, the change and whether the old torrent is for an unrelated file.
+    cases = [("appended file", append_to_file, False), ("added file", add_file, False),
+             ("edited file", edit_file, False), ("unrelated torrent", None, True)]
+    for label, change, unrelated in cases:
+        work_dir = tempfile.mkdtemp()
+        folder = os.path.join(work_dir, "random_folder")
+        shutil.copytree(os.path.join("tests", "testdata", "random_folder"), folder)
+        files = get_files(folder)
+
+        # The files are older than the old torrent file, which is older than the changes.
+        past = time.time() - 3600
+        for file in files:
+            os.utime(os.path.join(folder, file), (past, past))
+
+        old_source = folder
+        if unrelated:
+            # A file of the same size as the folder's first file.
+            old_source = os.path.join(work_dir, "other.bin")
+            with open(old_source, "wb") as fh:
+                fh.write(os.urandom(os.path.getsize(os.path.join(folder, files[0]))))
+        old_file = os.path.join(work_dir, "old.torrent")
+        options = '--no-created-by -c "" --date -2 -p 16 -f'
+        commands = [r"python src\py3createtorrent.py %s %s -o %s" % (old_source, options, old_file)]
+        subprocess.run(commands[0], shell=True, check=True, stdout=subprocess.DEVNULL)
+        os.utime(old_file, (past + 60, past + 60))
+
+        if change is not None:
+            change(folder, files)
+
+        reused_file = os.path.join(work_dir, "reused.torrent")
+        full_file = os.path.join(work_dir, "full.torrent")
+        commands = [
+            r"python src\py3createtorrent.py %s %s -o %s --reuse-from %s -v" % (folder, options, reused_file, old_file),
+            r"python src\py3createtorrent.py %s %s -o %s" % (folder, options, full_file)
+        ]
+        if verbose:
+            for cmd in commands:
+                print("cmd: ", cmd)
+        output = subprocess.run(commands[0], shell=True, check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        subprocess.run(commands[1], shell=True, check=True, stdout=subprocess.DEVNULL)
+
+        # Some of the piece hashes (but not all of them) must have been re-used, unless the torrent is unrelated.
+        match = re.search(r"Re-using (\d+) of (\d+) piece hashes", output)
+        if unrelated:
+            reused = match is None
+        else:
+            reused = match is not None and 0 < int(match.group(1)) < int(match.group(2))
+
+        if reused and get_file_contents(reused_file) == get_file_contents(full_file):
+            print("Re-using piece hashes after changes (%s) matches a full rebuild: YES" % label)
+        else:
+            print("Re-using piece hashes after changes (%s) matches a full rebuild: NO" % label)
+
+        shutil.rmtree(work_dir)
+
+
+def check_resume_after_interrupt(verbose):
+    """
+    Interrupt the hashing of the test folder once a checkpoint has been saved and check that resuming it results in
+    the reference torrent file.
+    """
+    if os.name == "nt":
+        # Ctrl+C cannot be sent to a single process on Windows.
+        print("Resuming an interrupted run matches the reference: skipped on Windows")
+        return
+
+    work_dir = tempfile.mkdtemp()
+    torrent_file = os.path.join(work_dir, "resumed.torrent")
+    reference_file = os.path.join("tests", "referencedata", "random_folder_py3createtorrent_p16.torrent")
+    command = [
+        sys.executable,
+        os.path.join("src", "py3createtorrent.py"),
+        os.path.join("tests", "testdata", "random_folder"), "--no-created-by", "-c", "", "--date", "-2", "-p", "16",
+        "-f", "-o", torrent_file
+    ]
+    # The read rate is limited, so that the run can be interrupted after the first checkpoint.
+    commands = [command + ["--max-read-rate", "20M", "--checkpoint-interval", "0.1"], command + ["--resume", "-v"]]
+    if verbose:
+        for cmd in commands:
+            print("cmd: ", " ".join(cmd))
+
+    process = subprocess.Popen(commands[0], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while not os.path.isfile(torrent_file + ".checkpoint") and process.poll() is None:
+        time.sleep(0.05)
+    time.sleep(0.3)
+    process.send_signal(signal.SIGINT)
+    process.wait()
+
+    output = subprocess.run(commands[1], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    # The resumed run must have started from the checkpoint and removed it at the end.
+    resumed = re.search(r"Loaded checkpoint .* \(\d+ pieces done\)", output) is not None
+    if (resumed and not os.path.exists(torrent_file + ".checkpoint")
+            and get_file_contents(torrent_file) == get_file_contents(reference_file)):
+        print("Resuming an interrupted run matches the reference: YES")
+    else:
+        print("Resuming an interrupted run matches the reference: NO")
+
+    shutil.rmtree(work_dir)
+
+
+def check_watch_after_changes(verbose):
+    """
+    Watch a copy of the test folder, change one of its files and check that the updated torrent file is the same as
+    the one of a full rebuild.
+    """
+    work_dir = tempfile.mkdtemp()
+    folder = os.path.join(work_dir, "random_folder")
+    shutil.copytree(os.path.join("tests", "testdata", "random_folder"), folder)
+    files = get_files(folder)
+
+    watched_file = os.path.join(work_dir, "watched.torrent")
+    full_file = os.path.join(work_dir, "full.torrent")
+    options = ["--no-created-by", "-c", "", "--date", "-2", "-p", "16", "-f"]
+    # The output is unbuffered, so that the updates can be followed.
+    commands = [[sys.executable, "-u", os.path.join("src", "py3createtorrent.py"), folder] + options +
+                ["-o", watched_file, "--watch", "--watch-debounce", "0.5", "-v"],
+                [sys.executable, os.path.join("src", "py3createtorrent.py"), folder] + options + ["-o", full_file]]
+    if verbose:
+        for cmd in commands:
+            print("cmd: ", " ".join(cmd))
+
+    def wait_for_update(process):
+        # Each update ends with waiting for further changes. Returns the output of the update.
+        lines = []
+        for line in process.stdout:
+            if line.startswith("Watching"):
+                break
+            lines.append(line)
+        return "".join(lines)
+
+    process = subprocess.Popen(commands[0], stdout=subprocess.PIPE, universal_newlines=True)
+    wait_for_update(process)
+    with open(os.path.join(folder, files[len(files) // 2]), "ab") as fh:
+        fh.write(os.urandom(12345))
+    output = wait_for_update(process)
+    process.terminate()
+    process.wait()
+
+    subprocess.run(commands[1], check=True, stdout=subprocess.DEVNULL)
+
+    # Only the pieces affected by the change may have been rehashed.
+    match = re.search(r"Re-using (\d+) of (\d+) piece hashes", output)
+    reused = match is not None and 0 < int(match.group(1)) < int(match.group(2))
+    if reused and get_file_contents(watched_file) == get_file_contents(full_file):
+        print("Watching for changes matches a full rebuild: YES")
+    else:
+        print("Watching for changes matches a full rebuild: NO")
+
+    shutil.rmtree(work_dir)
+
+
+def check_stdin_with_tee(verbose):
+    """
+    Pipe the test file through stdin and check that the torrent file matches the reference torrent file and that the
+    copy written by --tee is the same as the test file.
+    """
+    target_path = os.path.join("tests", "testdata", "random_file.dat")
+    for p in [16, 128, 1024, 8192]:
+        work_dir = tempfile.mkdtemp()
+        torrent_file = os.path.join(work_dir, "stdin.torrent")
+        tee_file = os.path.join(work_dir, "random_file.dat")
+        reference_file = os.path.join("tests", "referencedata", "random_file_py3createtorrent_p%d.torrent" % p)
+        command = (r'python src\py3createtorrent.py - --no-created-by -c "" --date -2 -p %d -o %s -n %s --tee %s' %
+                   (p, torrent_file, os.path.basename(target_path), tee_file))
+        if verbose:
+            print("cmd: ", command)
+        with open(target_path, "rb") as fh:
+            subprocess.run(command, shell=True, check=True, stdin=fh, stdout=subprocess.DEVNULL)
+
+        if (get_file_contents(torrent_file) == get_file_contents(reference_file)
+                and get_file_contents(tee_file) == get_file_contents(target_path)):
+            print("Reading from stdin with piece size % 5d matches the reference and the input: YES" % p)
+        else:
+            print("Reading from stdin with piece size % 5d matches the reference and the input: NO" % p)
+
+        shutil.rmtree(work_dir)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--test-threads", action="store_true", help="Enable testing of various numbers of threads.")
+    parser.add_argument("--test-reuse",
+                        action="store_true",
+                        help="Also test re-using the piece hashes of the reference torrent files.")
+    parser.add_argument("--test-shards",
+                        action="store_true",
+                        help="Also test hashing in shards (plan, hash-shard and merge).")
+    parser.add_argument("--test-archives",
+                        action="store_true",
+                        help="Also test hashing tar and zip archives of the test folder.")
+    parser.add_argument("--test-http",
+                        action="store_true",
+                        help="Also test hashing the test data via HTTP (from a local web server).")
+    parser.add_argument("--test-multi",
+                        action="store_true",
+                        help="Also test creating the torrents for all piece sizes at once.")
+    parser.add_argument("--test-variants",
+                        action="store_true",
+                        help="Also test creating variants (the first one without any overrides).")
+    parser.add_argument("--test-checksums",
+                        action="store_true",
+                        help="Also test calculating checksums of the files (which must not change the torrent).")
+    parser.add_argument("--test-read-order",
+                        action="store_true",
+                        help="Also test reading the files in the order of their location on disk.")
+    parser.add_argument("--test-readers",
+                        action="store_true",
+                        help="Also test reading the files with several reader threads.")
+    parser.add_argument("--test-afalg",
+                        action="store_true",
+                        help="Also test hashing in the Linux kernel (falls back to hashlib if not available).")
+    parser.add_argument("--test-hash-while-scanning",
+                        action="store_true",
+                        help="Also test hashing the folder while scanning it.")
+    parser.add_argument("--test-parallel",
+                        action="store_true",
+                        help="Also test hashing in threads that read the pieces themselves.")
+    parser.add_argument("--test-files-from",
+                        action="store_true",
+                        help="Also test taking the files of the folder from a file list.")
+    parser.add_argument("--test-map",
+                        action="store_true",
+                        help="Also test composing the folder's torrent from its files and subfolders with --map.")
+    parser.add_argument("--test-calibrate",
+                        action="store_true",
+                        help="Also test hashing with the engine and threads found by --calibrate.")
+    parser.add_argument("--test-resume",
+                        action="store_true",
+                        help="Also test resuming an interrupted run from its checkpoint.")
+    parser.add_argument("--test-watch",
+                        action="store_true",
+                        help="Also test updating the torrent file of a changing folder with --watch.")
+    parser.add_argument("--test-index",
+                        action="store_true",
+                        help="Also test creating the torrent files from an index written by --export-index.")
+    parser.add_argument("--test-edit",
+                        action="store_true",
+                        help="Also test editing a torrent file into the reference torrent file.")
+    parser.add_argument("--test-stdin",
+                        action="store_true",
+                        help="Also test reading the test file from stdin and copying it with --tee.")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output for debugging purposes.")
     args = parser.parse_args()
 
@@ -30,6 +393,33 @@ def main():
 
     piece_sizes = [16, 128, 1024, 8192]
     targets = ["random_folder", "random_file.dat"]
+
+    archives = []
+    archive_dir = None
+    if args.test_archives:
+        archive_dir = tempfile.mkdtemp()
+        archives = create_archives(os.path.join("tests", "testdata", "random_folder"), archive_dir)
+    server = None
+    base_url = None
+    manifest_dir = None
+    manifest_file = None
+    if args.test_http:
+        server = start_http_server(os.path.join("tests", "testdata"))
+        base_url = "http://127.0.0.1:%d/" % server.server_address[1]
+        manifest_dir = tempfile.mkdtemp()
+        manifest_file = os.path.join(manifest_dir, "random_folder.json")
+        create_url_manifest(os.path.join("tests", "testdata", "random_folder"), base_url, manifest_file)
+    file_list_dir = None
+    file_list = None
+    if args.test_files_from:
+        file_list_dir = tempfile.mkdtemp()
+        file_list = os.path.join(file_list_dir, "random_folder.txt")
+        create_file_list(os.path.join("tests", "testdata", "random_folder"), file_list)
+    config_dir = None
+    config_file = None
+    if args.test_calibrate:
+        config_dir = tempfile.mkdtemp()
+        config_file = os.path.join(config_dir, "calibrated.cfg")
     for t in threads:
         if args.test_threads:
             print("Testing with --threads %d:" % t)
@@ -39,30 +429,156 @@ def main():
                 target = target.split(".")[0]
 
             for p in piece_sizes:
-                torrent_file = os.path.join("tests", "testdata", "%s_currentversion_p%d.torrent" % (target, p))
-                if os.path.isfile(torrent_file):
-                    os.remove(torrent_file)
+                reference_file = os.path.join("tests", "referencedata", "%s_py3createtorrent_p%d.torrent" % (target, p))
 
-                cmd = r'python src\py3createtorrent.py --no-created-by -c "" --date -2 %s -p %d -o %s' % (
-                    target_path, p, torrent_file)
+                torrent_file = os.path.join("tests", "testdata", "%s_currentversion_p%d.torrent" % (target, p))
+                options = '--no-created-by -c "" --date -2 -p %d -o %s' % (p, torrent_file)
                 if args.test_threads:
-                    cmd += " --threads %d" % t
-                if args.verbose:
-                    print("cmd: ", cmd)
-                cp = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.DEVNULL)
+                    options += " --threads %d" % t
 
-                reference_file = os.path.join("tests", "referencedata", "%s_py3createtorrent_p%d.torrent" % (target, p))
+                # Each mode is given by a label, the commands that create the torrent file and the torrent file.
+                modes = [("", [r"python src\py3createtorrent.py %s %s" % (target_path, options)], torrent_file)]
+                if args.test_reuse:
+                    modes.append((" (reuse)", [
+                        r"python src\py3createtorrent.py %s %s --reuse-from %s --reuse-trust size --reuse-verify 10" %
+                        (target_path, options, reference_file)
+                    ], torrent_file))
+                if args.test_shards:
+                    plan_file = os.path.join("tests", "testdata", "%s_currentversion_p%d.plan" % (target, p))
+                    shard_files = [plan_file + ".shard%d" % i for i in range(3)]
+                    commands = [r"python src\py3createtorrent.py plan %s -p %d -f -o %s" % (target_path, p, plan_file)]
+                    for i, shard_file in enumerate(shard_files):
+                        commands.append(r"python src\py3createtorrent.py hash-shard %s --shard %d/3 -o %s" %
+                                        (plan_file, i, shard_file))
+                    commands.append(r"python src\py3createtorrent.py merge %s %s %s" %
+                                    (plan_file, " ".join(shard_files), options))
+                    modes.append((" (shards)", commands, torrent_file))
+                if target == "random_folder":
+                    for archive in archives:
+                        command = r"python src\py3createtorrent.py --archive %s %s" % (archive, options)
+                        modes.append((" (%s)" % os.path.basename(archive), [command], torrent_file))
+                if args.test_http:
+                    if target == "random_folder":
+                        source = "--url-manifest %s" % manifest_file
+                    else:
+                        source = "--url %s%s" % (base_url, os.path.basename(target_path))
+                    command = r"python src\py3createtorrent.py %s %s --no-auto-webseed" % (source, options)
+                    modes.append((" (http)", [command], torrent_file))
+                if args.test_multi:
+                    # One torrent file is created per piece size, named <output>.p<piece size>.torrent.
+                    multi_file = os.path.join("tests", "testdata", "%s_currentversion_multi.torrent" % target)
+                    multi_options = '--no-created-by -c "" --date -2 -f -p %s -o %s' % (",".join(
+                        str(size) for size in piece_sizes), multi_file)
+                    modes.append((" (multi)", [r"python src\py3createtorrent.py %s %s" % (target_path, multi_options)],
+                                  multi_file[:-len(".torrent")] + ".p%d.torrent" % p))
+                if args.test_variants:
+                    # One torrent file is created per variant, named <output>.<label>.torrent.
+                    variants = '--variant same --variant "other:private=yes;source=OTHER;tracker=http://example.com/a"'
+                    command = r"python src\py3createtorrent.py %s %s -f %s" % (target_path, options, variants)
+                    modes.append((" (variants)", [command], torrent_file[:-len(".torrent")] + ".same.torrent"))
+                if args.test_checksums:
+                    checksums_dir = os.path.join("tests", "testdata", "%s_currentversion_p%d.checksums" % (target, p))
+                    modes.append((" (checksums)", [
+                        r"python src\py3createtorrent.py %s %s --checksums sha256,blake2b,crc32 --checksums-out %s" %
+                        (target_path, options, checksums_dir)
+                    ], torrent_file))
+
+                if args.test_read_order:
+                    command = r"python src\py3createtorrent.py %s %s --read-order physical" % (target_path, options)
+                    modes.append((" (physical read order)", [command], torrent_file))
+
+                if args.test_readers:
+                    modes.append((" (readers per device)", [
+                        r"python src\py3createtorrent.py %s %s --readers-per-device 3 --stats" % (target_path, options)
+                    ], torrent_file))
+
+                if args.test_afalg:
+                    command = r"python src\py3createtorrent.py %s %s --engine afalg" % (target_path, options)
+                    modes.append((" (afalg)", [command], torrent_file))
+
+                if args.test_hash_while_scanning:
+                    command = r"python src\py3createtorrent.py %s %s --hash-while-scanning" % (target_path, options)
+                    modes.append((" (hash while scanning)", [command], torrent_file))
+
+                if args.test_parallel:
+                    command = r"python src\py3createtorrent.py %s %s --engine parallel" % (target_path, options)
+                    modes.append((" (parallel)", [command], torrent_file))
+
+                if args.test_files_from and target == "random_folder":
+                    command = (r"python src\py3createtorrent.py %s %s --files-from %s" %
+                               (target_path, options, file_list))
+                    modes.append((" (files from)", [command], torrent_file))
+
+                if args.test_map and target == "random_folder":
+                    # Each file and subfolder is mapped on its own, in reverse order.
+                    maps = " ".join("--map %s=%s" % (os.path.join(target_path, node), node)
+                                    for node in sorted(os.listdir(target_path), reverse=True))
+                    command = r"python src\py3createtorrent.py %s %s --name %s" % (maps, options, target)
+                    modes.append((" (map)", [command], torrent_file))
+
+                if args.test_calibrate:
+                    modes.append((" (calibrated)", [
+                        r"python src\py3createtorrent.py --calibrate -p %d --config %s" % (p, config_file),
+                        r"python src\py3createtorrent.py %s %s --config %s" % (target_path, options, config_file)
+                    ], torrent_file))
+
+                if args.test_index:
+                    index_file = os.path.join("tests", "testdata", "%s_currentversion_p%d.index" % (target, p))
+                    commands = [
+                        r"python src\py3createtorrent.py %s %s --export-index %s" % (target_path, options, index_file),
+                        r"python src\py3createtorrent.py --from-index %s %s -f" % (index_file, options)
+                    ]
+                    modes.append((" (index)", commands, torrent_file))
+
+                if args.test_edit:
+                    # Everything that differs from the reference torrent file is removed or replaced by the edit.
+                    name = os.path.basename(target_path)
+                    modes.append((" (edit)", [
+                        r"python src\py3createtorrent.py %s %s -f -t http://example.com/announce --webseed "
+                        r"http://example.com/ -c other --date -1 -P -s OTHER -n other" % (target_path, options),
+                        r'python src\py3createtorrent.py edit %s -f --no-trackers --no-webseeds -c "" --date -2 '
+                        r'--no-private -s "" -n %s' % (torrent_file, name)
+                    ], torrent_file))
+
+                for label, commands, torrent_file in modes:
+                    if os.path.isfile(torrent_file):
+                        os.remove(torrent_file)
+
+                    for cmd in commands:
+                        if args.verbose:
+                            print("cmd: ", cmd)
+                        cp = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.DEVNULL)
+
+                    if args.verbose:
+                        print("Torrent file:   %s" % torrent_file)
+                        print("Reference file: %s" % reference_file)
+                    actual_bytes = get_file_contents(torrent_file)
+                    expected_bytes = get_file_contents(reference_file)
+
+                    if actual_bytes == expected_bytes:
+                        print("Torrent files for % 15s with piece size % 5d are matching: YES%s" % (target, p, label))
+                    else:
+                        print("Torrent files for % 15s with piece size % 5d are matching: NO%s" % (target, p, label))
 
-                if args.verbose:
-                    print("Torrent file:   %s" % torrent_file)
-                    print("Reference file: %s" % reference_file)
-                actual_bytes = get_file_contents(torrent_file)
-                expected_bytes = get_file_contents(reference_file)
+    if args.test_reuse:
+        check_reuse_after_changes(args.verbose)
+    if args.test_resume:
+        check_resume_after_interrupt(args.verbose)
+    if args.test_watch:
+        check_watch_after_changes(args.verbose)
+    if args.test_stdin:
+        check_stdin_with_tee(args.verbose)
 
-                if actual_bytes == expected_bytes:
-                    print("Torrent files for % 15s with piece size % 5d are matching: YES" % (target, p))
-                else:
-                    print("Torrent files for % 15s with piece size % 5d are matching: NO" % (target, p))
+    if archive_dir is not None:
+        shutil.rmtree(archive_dir)
+    if server is not None:
+        server.shutdown()
+    if manifest_dir is not None:
+        shutil.rmtree(manifest_dir)
+    if file_list_dir is not None:
+        shutil.rmtree(file_list_dir)
+    if config_dir is not None:
+        shutil.rmtree(config_dir)
 
     return 0
 